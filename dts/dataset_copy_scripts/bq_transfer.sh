@@ -14,12 +14,12 @@ case "$ENVIRONMENT" in
     "dev")
         SOURCE_PROJECT="${BQ_DEV_SOURCE_PROJECT:-sbox-rgodoy-001-20251124}"
         DEST_PROJECT="${BQ_DEV_DEST_PROJECT:-sbox-rgodoy-002-20251008}"
-        DATASET_MAPPING="dts_01:dev_dts"
+        DATASET_MAPPINGS="${BQ_DEV_DATASET_MAPPINGS:-dts_01:dev_dts,dts_02:dev_dts_02}"
         ;;
     "uat")
         SOURCE_PROJECT="${BQ_UAT_SOURCE_PROJECT:-sbox-rgodoy-001-20251124}"
         DEST_PROJECT="${BQ_UAT_DEST_PROJECT:-sbox-rgodoy-002-20251008}"
-        DATASET_MAPPING="dts_01:uat_dts"
+        DATASET_MAPPINGS="${BQ_UAT_DATASET_MAPPINGS:-dts_01:uat_dts,dts_02:uat_dts_02}"
         ;;
     *)
         echo "ERROR: Unknown environment '$ENVIRONMENT'. Must be 'dev' or 'uat'."
@@ -29,11 +29,13 @@ case "$ENVIRONMENT" in
         ;;
 esac
 
-# Build dataset configuration dynamically
-IFS=':' read -r SRC_DATASET DEST_DATASET <<< "$DATASET_MAPPING"
-DATASETS_TO_COPY=(
-    "$SOURCE_PROJECT:$SRC_DATASET:$DEST_PROJECT:$DEST_DATASET"
-)
+# Build dataset configuration dynamically (SOURCE:DEST pairs, comma-separated; same defaults as main.py)
+DATASETS_TO_COPY=()
+IFS=',' read -r -a DATASET_MAPPING_LIST <<< "$DATASET_MAPPINGS"
+for mapping in "${DATASET_MAPPING_LIST[@]}"; do
+    IFS=':' read -r SRC_DATASET DEST_DATASET <<< "$mapping"
+    DATASETS_TO_COPY+=("$SOURCE_PROJECT:$SRC_DATASET:$DEST_PROJECT:$DEST_DATASET")
+done
 
 # Service account keyfile selection based on environment
 case "$ENVIRONMENT" in
@@ -48,41 +50,28 @@ esac
 # Default BigQuery location for destination jobs/datasets
 DEFAULT_LOCATION="us-central1"
 
-# Define sensitive columns and remediation tactics by environment
+# Cross-region fallback: when source and destination locations differ, tables are exported as sharded Avro
+# to BQ_STAGING_BUCKET (colocated with the source) and loaded from BQ_LOAD_BUCKET (colocated with the
+# destination; defaults to the staging bucket). Same settings as TRANSFER_STAGING_BUCKET/TRANSFER_LOAD_BUCKET in main.py.
+BQ_STAGING_BUCKET="${BQ_STAGING_BUCKET:-}"
+BQ_LOAD_BUCKET="${BQ_LOAD_BUCKET:-$BQ_STAGING_BUCKET}"
+
+# Sensitive columns and remediation tactics by environment, shared with main.py and the test scripts
 # Format: DATASET:TABLE.COLUMN.TACTIC
 # TACTICS: 'redact' (set to NULL), 'FF' (FARM_FINGERPRINT), 'mask' (partial masking), 'hash' (SHA256 hash)
+SENSITIVE_COLUMNS_FILE="${SENSITIVE_COLUMNS_FILE:-$(dirname "$0")/sensitive_columns.json}"
 
-# Development Environment - Full redaction for testing
-SENSITIVE_TABLE_COLUMNS_DEV=(
-    # Business Licenses - redact sensitive columns
-    "dts_01:stg_business_licenses.account_number.redact"
-    "dts_01:stg_business_licenses.business_address.redact"
-    "dts_01:stg_business_licenses.community_area.redact"
-    "dts_01:stg_business_licenses.payment_date.redact"
-    
-    # Crimes - redact location/coordinate columns
-    "dts_01:stg_crimes.x_coordinate.redact"
-    "dts_01:stg_crimes.y_coordinate.redact"
-    "dts_01:stg_crimes.latitude.redact"
-    "dts_01:stg_crimes.longitude.redact"
-    "dts_01:stg_crimes.location_description.redact"
-)
-
-# Select appropriate configuration based on environment
-case "$ENVIRONMENT" in
-    "dev")
-        SENSITIVE_TABLE_COLUMNS=("${SENSITIVE_TABLE_COLUMNS_DEV[@]}")
-        echo "Using DEV environment configuration (full redaction)"
-        ;;
-    "uat")
-        SENSITIVE_TABLE_COLUMNS=()
-        echo "Using UAT environment configuration (no redaction)"
-        ;;
-    *)
-        echo "WARNING: Unknown environment '$ENVIRONMENT'. Using DEV configuration."
-        SENSITIVE_TABLE_COLUMNS=("${SENSITIVE_TABLE_COLUMNS_DEV[@]}")
-        ;;
-esac
+# Load the entries for this environment (DEV: full redaction, UAT: none)
+if ! SENSITIVE_ENTRIES=$(python3 -c 'import json, sys; print("\n".join(json.load(open(sys.argv[1])).get(sys.argv[2], [])))' \
+        "$SENSITIVE_COLUMNS_FILE" "$ENVIRONMENT"); then
+    echo "ERROR: Could not read sensitive columns from $SENSITIVE_COLUMNS_FILE"
+    exit 1
+fi
+SENSITIVE_TABLE_COLUMNS=()
+while IFS= read -r entry; do
+    [ -n "$entry" ] && SENSITIVE_TABLE_COLUMNS+=("$entry")
+done <<< "$SENSITIVE_ENTRIES"
+echo "Using $ENVIRONMENT sensitive column configuration (${#SENSITIVE_TABLE_COLUMNS[@]} columns from $SENSITIVE_COLUMNS_FILE)"
 
 # ==============================================================================
 # TEMPLATED SQL STATEMENTS
@@ -189,6 +178,36 @@ execute_sql() {
     fi
 }
 
+# Export a table to sharded Avro in the staging bucket, load it in the destination location, clean up.
+# Redaction runs afterwards through execute_sql, as for copied tables.
+export_load_table() {
+    local src_table="$1"      # project:dataset.table
+    local dest_table="$2"     # project:dataset.table
+    local table_name="$3"
+    local prefix="transfer_staging/${SRC_DS}/${table_name}/$(date +%s)_$$"
+    local status=0
+
+    echo "  - Exporting $src_table ($SRC_LOCATION) to gs://$BQ_STAGING_BUCKET/$prefix/"
+    bq "${BQ_AUTH_ARGS[@]}" --project_id="$DEST_PROJ" --location="$SRC_LOCATION" query --nouse_legacy_sql --quiet \
+        "EXPORT DATA OPTIONS (uri = 'gs://$BQ_STAGING_BUCKET/$prefix/part-*.avro', format = 'AVRO', use_avro_logical_types = true, overwrite = true) AS SELECT * FROM \`$(echo "$src_table" | sed 's/:/./')\`" || status=1
+
+    if [ $status -eq 0 ] && [ "$BQ_LOAD_BUCKET" != "$BQ_STAGING_BUCKET" ]; then
+        gcloud storage cp "gs://$BQ_STAGING_BUCKET/$prefix/*" "gs://$BQ_LOAD_BUCKET/$prefix/" --quiet || status=1
+    fi
+
+    if [ $status -eq 0 ]; then
+        echo "  - Loading into $dest_table ($DEST_LOCATION)"
+        bq "${BQ_AUTH_ARGS[@]}" --project_id="$DEST_PROJ" --location="$DEST_LOCATION" load --replace \
+            --source_format=AVRO --use_avro_logical_types "$dest_table" "gs://$BQ_LOAD_BUCKET/$prefix/part-*.avro" || status=1
+    fi
+
+    gcloud storage rm --recursive "gs://$BQ_STAGING_BUCKET/$prefix/" --quiet >/dev/null 2>&1
+    if [ "$BQ_LOAD_BUCKET" != "$BQ_STAGING_BUCKET" ]; then
+        gcloud storage rm --recursive "gs://$BQ_LOAD_BUCKET/$prefix/" --quiet >/dev/null 2>&1
+    fi
+    return $status
+}
+
 # ============================================================================== 
 # MAIN LOGIC
 # ============================================================================== 
@@ -199,7 +218,7 @@ echo "=========================================="
 echo "Environment: $ENVIRONMENT"
 echo "Source Project: $SOURCE_PROJECT"
 echo "Destination Project: $DEST_PROJECT"
-echo "Dataset Mapping: $DATASET_MAPPING"
+echo "Dataset Mappings: $DATASET_MAPPINGS"
 echo "Using service account credentials from $AUTH_KEYFILE"
 echo "=========================================="
 
@@ -248,11 +267,16 @@ for dataset_config in "${DATASETS_TO_COPY[@]}"; do
         continue
     fi
 
-    # Enforce location match between source and destination datasets for native copy
-    if [ "$SRC_LOCATION" != "$DEST_LOCATION" ]; then
-        echo "  - ERROR: Location mismatch. Source is $SRC_LOCATION, destination is $DEST_LOCATION. Native copy requires matching locations."
-        echo "    Fix: Create destination dataset in $SRC_LOCATION, or perform extract+load. Skipping dataset."
-        continue
+    # Native copy requires matching locations; otherwise fall back to export/load through the staging bucket
+    CROSS_REGION=0
+    if [ "$(echo "$SRC_LOCATION" | tr '[:upper:]' '[:lower:]')" != "$(echo "$DEST_LOCATION" | tr '[:upper:]' '[:lower:]')" ]; then
+        if [ -z "$BQ_STAGING_BUCKET" ]; then
+            echo "  - ERROR: Location mismatch. Source is $SRC_LOCATION, destination is $DEST_LOCATION. Native copy requires matching locations."
+            echo "    Fix: Create destination dataset in $SRC_LOCATION, or set BQ_STAGING_BUCKET for export+load. Skipping dataset."
+            continue
+        fi
+        echo "  - Location mismatch ($SRC_LOCATION -> $DEST_LOCATION). Using export+load via gs://$BQ_STAGING_BUCKET."
+        CROSS_REGION=1
     fi
 
     # List tables using INFORMATION_SCHEMA (BASE TABLE) with dataset scoping; avoids backtick quoting issues
@@ -287,9 +311,13 @@ for dataset_config in "${DATASETS_TO_COPY[@]}"; do
         
         echo "  - Copying native table: $SRC_FULL_TABLE to $DEST_FULL_TABLE"
 
-        # Use bq cp for tables. The -f flag ensures overwrite.
-        # Use the SOURCE dataset location for the copy job
-        bq "${BQ_AUTH_ARGS[@]}" --project_id="$DEST_PROJ" --location="$SRC_LOCATION" cp -f "$SRC_FULL_TABLE" "$DEST_FULL_TABLE"
+        if [ $CROSS_REGION -eq 1 ]; then
+            export_load_table "$SRC_FULL_TABLE" "$DEST_FULL_TABLE" "$table_name"
+        else
+            # Use bq cp for tables. The -f flag ensures overwrite.
+            # Use the SOURCE dataset location for the copy job
+            bq "${BQ_AUTH_ARGS[@]}" --project_id="$DEST_PROJ" --location="$SRC_LOCATION" cp -f "$SRC_FULL_TABLE" "$DEST_FULL_TABLE"
+        fi
         
         if [ $? -ne 0 ]; then
             echo "  - ERROR: Table copy failed for $table_name. Skipping remediation."
@@ -6,56 +6,453 @@ Handles dataset transfers between projects with environment-specific redaction
 
 import os
 import json
+import time
+import hashlib
 import logging
-from typing import Dict, List, Optional
-from google.cloud import bigquery
+import threading
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from google.cloud import bigquery, storage
 from google.cloud.exceptions import NotFound, BadRequest
 import argparse
+import heapq
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from flask import Flask, request, jsonify
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# How sensitive columns are remediated in the destination:
+#   dml  - copy into the destination dataset, then rewrite the columns with UPDATE statements
+#   view - copy into <dest_dataset>_raw, then publish masked authorized views in the destination dataset
+REMEDIATION_MODES = ["dml", "view"]
+RAW_DATASET_SUFFIX = "_raw"
+
+# How tables are copied:
+#   full  - copy every table with WRITE_TRUNCATE
+#   delta - compare INFORMATION_SCHEMA.PARTITIONS on both sides and copy only the partitions modified
+#           since the destination copy (unchanged tables are skipped); redaction runs on those partitions only
+COPY_MODES = ["full", "delta"]
+
+# Delta mode copies changed partitions one job each; beyond this many a single full copy is cheaper
+DELTA_MAX_PARTITIONS = int(os.getenv("DELTA_MAX_PARTITIONS", "50"))
+
+# dml mode: label on each redacted destination table holding redaction_rules_hash() of the rules it was
+# redacted with, so delta mode copies it in full again (instead of skipping it) when the rules change
+REDACTION_RULES_LABEL = "redaction_rules"
+
+# Cross-region fallback (source and destination datasets in different locations): tables are exported as
+# sharded Avro to TRANSFER_STAGING_BUCKET (colocated with the source) and loaded from TRANSFER_LOAD_BUCKET
+# (colocated with the destination). A single dual- or multi-region bucket can serve as both.
+STAGING_BUCKET = os.getenv("TRANSFER_STAGING_BUCKET")
+LOAD_BUCKET = os.getenv("TRANSFER_LOAD_BUCKET") or STAGING_BUCKET
+STAGING_PREFIX = "transfer_staging/"
+
+# Copy/DML/view jobs allowed in flight at once across every dataset of a transfer
+MAX_INFLIGHT_JOBS = int(os.getenv("MAX_INFLIGHT_JOBS", "8"))
+
+# Per-run checkpoints: gs://$CHECKPOINT_BUCKET/transfer_checkpoints/<run_id>/ (unset disables checkpointing)
+CHECKPOINT_BUCKET = os.getenv("CHECKPOINT_BUCKET")
+CHECKPOINT_PREFIX = "transfer_checkpoints/"
+
+# Attempts per table within one run; retries wait base * 2^(attempt-1) seconds, capped
+TRANSFER_MAX_ATTEMPTS = int(os.getenv("TRANSFER_MAX_ATTEMPTS", "3"))
+RETRY_BASE_SECONDS = float(os.getenv("TRANSFER_RETRY_BASE_SECONDS", "5"))
+RETRY_MAX_SECONDS = float(os.getenv("TRANSFER_RETRY_MAX_SECONDS", "60"))
+
+# After the copies, one aggregated query per dataset side compares row counts and content fingerprints
+VERIFY_TRANSFER = os.getenv("VERIFY_TRANSFER", "true").lower() not in ("false", "0", "no")
+
+# What verification scans:
+#   changed - only what this run wrote: delta tables skipped as unchanged are not scanned, and tables
+#             copied partition by partition are compared on those partitions only
+#   full    - every transferred table, whole
+VERIFY_SCOPES = ["changed", "full"]
+VERIFY_SCOPE = os.getenv("VERIFY_SCOPE", "changed")
+
+def redaction_rules_hash(columns: List[Tuple[str, str]]) -> Optional[str]:
+    """Short, label-safe hash of a table's (column, tactic) rules; None for a table without rules"""
+    if not columns:
+        return None
+    rules = json.dumps(sorted((column_name.lower(), tactic) for column_name, tactic in columns))
+    return hashlib.sha256(rules.encode()).hexdigest()[:16]
+
+# Checkpoint status -> (copy status, remediation status)
+CHECKPOINT_STAGES = {
+    "copied": ("done", "pending"),
+    "success": ("done", "done"),
+    "verification_failed": ("done", "done"),
+    "redaction_failed": ("done", "failed"),
+    "copy_failed": ("failed", "pending"),
+}
+
+def backoff_delay(attempt: int, base: Optional[float] = None, cap: Optional[float] = None) -> float:
+    """Seconds to wait after failed attempt n (1-based) before the next one"""
+    base = RETRY_BASE_SECONDS if base is None else base
+    cap = RETRY_MAX_SECONDS if cap is None else cap
+    return min(cap, base * 2 ** (attempt - 1))
+
+def parse_dataset_mappings(value: str) -> List[Tuple[str, str]]:
+    """Parse 'src:dest,src2:dest2' into [(src, dest), ...]"""
+    mappings = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        source_dataset, sep, dest_dataset = item.partition(":")
+        if not sep or not source_dataset or not dest_dataset:
+            raise ValueError(f"Malformed dataset mapping (expected SOURCE:DEST): {item}")
+        mappings.append((source_dataset, dest_dataset))
+    if not mappings:
+        raise ValueError("At least one dataset mapping is required")
+    return mappings
+
+# Sensitive column rules for every environment, shared with bq_transfer.sh and the test scripts
+SENSITIVE_COLUMNS_FILE = os.getenv(
+    "SENSITIVE_COLUMNS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sensitive_columns.json"))
+REDACTION_TACTICS = ["redact", "FF", "mask", "hash"]
+
+# Legacy schema type names → GoogleSQL type names (used to keep masked view columns typed)
+SQL_TYPE_NAMES = {"INTEGER": "INT64", "FLOAT": "FLOAT64", "BOOLEAN": "BOOL", "RECORD": "STRUCT"}
+
+def masked_view_expression(column_name: str, tactic: str, field_type: str) -> Optional[str]:
+    """
+    View expression equivalent to a redaction tactic's UPDATE, or None for an unknown tactic.
+    redact and FF keep the column's type; mask and hash produce STRING like their DML versions.
+    """
+    sql_type = SQL_TYPE_NAMES.get(field_type, field_type)
+    if tactic == "redact":
+        return f"CAST(NULL AS {sql_type})"
+    if tactic == "FF":
+        return f"CAST(FARM_FINGERPRINT(CAST({column_name} AS STRING)) AS {sql_type})"
+    if tactic == "mask":
+        return (f"CASE WHEN {column_name} IS NULL THEN NULL "
+                f"WHEN LENGTH(CAST({column_name} AS STRING)) > 4 "
+                f"THEN CONCAT('****', SUBSTR(CAST({column_name} AS STRING), -4)) ELSE '****' END")
+    if tactic == "hash":
+        return f"TO_HEX(SHA256(CAST({column_name} AS BYTES)))"
+    return None
+
+# Non-null count of each sensitive column, in the same shape for every table of the verification query
+NON_NULL_COUNTS_TYPE = "ARRAY<STRUCT<column_name STRING, non_null INT64>>"
+
+def verification_query(table_ids: Dict[str, str], sensitive_columns: Dict[str, List[Tuple[str, str]]],
+                       schemas: Dict[str, List[bigquery.SchemaField]],
+                       row_filters: Optional[Dict[str, str]] = None) -> str:
+    """
+    One query over every table of a dataset side (table name -> table id): a UNION ALL of one aggregate
+    per table giving its row count, an order-independent fingerprint (BIT_XOR of FARM_FINGERPRINT of each
+    row's JSON, without the sensitive columns) and the non-null count of each sensitive column.
+    Tables with sensitive columns need their schema, to list the columns that are fingerprinted.
+    A table with a row filter (see partition_filter) is aggregated over the matching rows only.
+    """
+    row_filters = row_filters or {}
+    selects = []
+    for table_name, table_id in table_ids.items():
+        columns = sensitive_columns.get(table_name, [])
+        if columns:
+            excluded = {column_name.lower() for column_name, _ in columns}
+            kept = [f"verified_row.`{field.name}`" for field in schemas[table_name] if field.name.lower() not in excluded]
+            row = f"STRUCT({', '.join(kept)})"
+            counts = ", ".join(f"('{column_name}', COUNTIF(verified_row.`{column_name}` IS NOT NULL))"
+                               for column_name, _ in columns)
+        else:
+            row, counts = "verified_row", ""
+        selects.append(f"SELECT '{table_name}' AS table_name, COUNT(*) AS row_count, "
+                       f"BIT_XOR(FARM_FINGERPRINT(TO_JSON_STRING({row}))) AS fingerprint, "
+                       f"{NON_NULL_COUNTS_TYPE}[{counts}] AS non_null_counts "
+                       f"FROM `{table_id}` AS verified_row"
+                       f"{f' WHERE {row_filters[table_name]}' if table_name in row_filters else ''}")
+    return "\nUNION ALL\n".join(selects)
+
+def verification_discrepancies(source: Optional[Dict[str, Any]], dest: Optional[Dict[str, Any]],
+                               columns: List[Tuple[str, str]]) -> List[str]:
+    """
+    Differences between the verification rows of a table on both sides ({row_count, fingerprint,
+    non_null: {column: count}}). redact must leave no non-null value; the other tactics keep NULLs as
+    NULLs, so their non-null counts must match the source.
+    """
+    if source is None or dest is None:
+        return [f"missing from the {'source' if source is None else 'destination'} verification result"]
+    issues = []
+    if source["row_count"] != dest["row_count"]:
+        issues.append(f"row count {dest['row_count']} != source {source['row_count']}")
+    elif source["fingerprint"] != dest["fingerprint"]:
+        issues.append("content fingerprint differs from source")
+    for column_name, tactic in columns:
+        dest_non_null = dest["non_null"].get(column_name, 0)
+        if tactic == "redact" and dest_non_null:
+            issues.append(f"{column_name} ({tactic}) has {dest_non_null} non-null values")
+        elif tactic != "redact" and dest_non_null != source["non_null"].get(column_name, 0):
+            issues.append(f"{column_name} ({tactic}) has {dest_non_null} non-null values, "
+                          f"source has {source['non_null'].get(column_name, 0)}")
+    return issues
+
+def plan_delta_copy(source_partitions: Dict[Optional[str], datetime],
+                    dest_partitions: Dict[Optional[str], datetime],
+                    max_partitions: Optional[int] = None) -> Tuple[str, List[str], List[str]]:
+    """
+    Compare partition_id -> last_modified_time of a source table and its destination copy.
+    Returns (action, changed, removed): action is 'unchanged', 'partitions' (copy changed, delete removed)
+    or 'full'. Unpartitioned tables have a single None partition and are either unchanged or copied in full.
+    """
+    max_partitions = DELTA_MAX_PARTITIONS if max_partitions is None else max_partitions
+    if not source_partitions or not dest_partitions:
+        return "full", [], []
+    if None in source_partitions or None in dest_partitions:
+        if set(source_partitions) == set(dest_partitions) and source_partitions[None] <= dest_partitions[None]:
+            return "unchanged", [], []
+        return "full", [], []
+    
+    changed = sorted(pid for pid, modified in source_partitions.items()
+                     if pid not in dest_partitions or modified > dest_partitions[pid])
+    removed = sorted(pid for pid in dest_partitions if pid not in source_partitions)
+    if not changed and not removed:
+        return "unchanged", [], []
+    # __NULL__ / __UNPARTITIONED__ cannot be addressed reliably with a decorator or a range predicate
+    if any(pid.startswith("__") for pid in changed + removed) or len(changed) + len(removed) > max_partitions:
+        return "full", [], []
+    return "partitions", changed, removed
+
+# Partition id formats of time-unit / ingestion-time partitioning
+TIME_PARTITION_FORMATS = {"HOUR": "%Y%m%d%H", "DAY": "%Y%m%d", "MONTH": "%Y%m", "YEAR": "%Y"}
+
+def _time_partition_end(start: datetime, unit: str) -> datetime:
+    if unit == "HOUR":
+        return start + timedelta(hours=1)
+    if unit == "DAY":
+        return start + timedelta(days=1)
+    if unit == "MONTH":
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start.replace(year=start.year + 1)
+
+def partition_filter(partition_ids: List[str], table: Optional[bigquery.Table]) -> Optional[str]:
+    """
+    WHERE predicate selecting exactly the rows of the given partitions of table, as range conditions on
+    the partitioning column so DML prunes to those partitions. Returns None if it cannot be expressed.
+    """
+    if not partition_ids or table is None:
+        return None
+    field_types = {field.name: field.field_type for field in table.schema}
+    ranges = []
+    if table.time_partitioning is not None:
+        unit = table.time_partitioning.type_ or "DAY"
+        column = table.time_partitioning.field or "_PARTITIONTIME"
+        field_type = field_types.get(column, "TIMESTAMP")
+        if unit not in TIME_PARTITION_FORMATS or field_type not in ("DATE", "DATETIME", "TIMESTAMP"):
+            return None
+        literal_format = "%Y-%m-%d" if field_type == "DATE" else "%Y-%m-%d %H:%M:%S"
+        try:
+            bounds = sorted((start, _time_partition_end(start, unit)) for start in
+                            (datetime.strptime(pid, TIME_PARTITION_FORMATS[unit]) for pid in partition_ids))
+        except ValueError:
+            return None
+        literal = lambda value: f"{field_type} '{value.strftime(literal_format)}'"
+    elif table.range_partitioning is not None:
+        column = table.range_partitioning.field
+        interval = int(table.range_partitioning.range_.interval)
+        try:
+            bounds = sorted((int(pid), int(pid) + interval) for pid in partition_ids)
+        except ValueError:
+            return None
+        literal = str
+    else:
+        return None
+    
+    # Adjacent partitions (e.g. the last few days) collapse into one range
+    for start, end in bounds:
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return " OR ".join(f"({column} >= {literal(start)} AND {column} < {literal(end)})" for start, end in ranges)
+
+def load_sensitive_columns(environment: str, path: Optional[str] = None) -> List[str]:
+    """Read the DATASET:TABLE.COLUMN.TACTIC entries configured for an environment"""
+    with open(path or SENSITIVE_COLUMNS_FILE) as f:
+        config = json.load(f)
+    entries = config.get(environment, [])
+    if not isinstance(entries, list):
+        raise ValueError(f"Sensitive columns for '{environment}' must be a list of DATASET:TABLE.COLUMN.TACTIC entries")
+    return entries
+
+def compile_sensitive_columns(entries: List[str], source_dataset: str) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Parse the entries once into table -> [(column, tactic)] for source_dataset.
+    Entries for other datasets are ignored; malformed entries and unknown tactics raise ValueError.
+    """
+    index: Dict[str, List[Tuple[str, str]]] = {}
+    for column_config in entries:
+        # Format: dataset:table.column.tactic
+        dataset_name, sep, col_info = column_config.partition(":")
+        col_parts = col_info.split(".")
+        if not sep or ":" in col_info or len(col_parts) != 3 or not all(col_parts):
+            raise ValueError(f"Malformed sensitive column config (expected DATASET:TABLE.COLUMN.TACTIC): {column_config}")
+        table_name, column_name, tactic = col_parts
+        if tactic not in REDACTION_TACTICS:
+            raise ValueError(f"Unknown tactic '{tactic}' in {column_config}. Must be one of {REDACTION_TACTICS}")
+        if dataset_name != source_dataset:
+            continue
+        index.setdefault(table_name, []).append((column_name, tactic))
+    return index
+
+class InvalidTransferRequest(ValueError):
+    """A transfer request that cannot run as asked (e.g. an unknown or mismatched resume run); HTTP 400"""
+
+class TransferCheckpoint:
+    """
+    Transfer state of one run in GCS: a _run.json manifest plus one small JSON object per table
+    (<source_dataset>/<table>.json), rewritten after the copy and again when the table finishes.
+    One object per table keeps concurrent workers clear of the per-object update rate limit.
+    """
+    def __init__(self, bucket: storage.Bucket, run_id: str):
+        self.bucket = bucket
+        self.run_id = run_id
+        self.prefix = f"{CHECKPOINT_PREFIX}{run_id}/"
+
+    @staticmethod
+    def new_run_id() -> str:
+        return f"{time.strftime('%Y%m%d_%H%M%S', time.gmtime())}_{uuid.uuid4().hex[:6]}"
+
+    def start(self, metadata: Dict[str, Any]):
+        """Write the run manifest"""
+        self.bucket.blob(self.prefix + "_run.json").upload_from_string(
+            json.dumps(metadata), content_type="application/json")
+
+    def load_run(self) -> Optional[Dict[str, Any]]:
+        """The run manifest, or None for an unknown run_id"""
+        try:
+            return json.loads(self.bucket.blob(self.prefix + "_run.json").download_as_bytes())
+        except NotFound:
+            return None
+
+    def load(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """(source_dataset, table) -> last recorded state"""
+        states = {}
+        for blob in self.bucket.list_blobs(prefix=self.prefix):
+            relative = blob.name[len(self.prefix):]
+            if relative == "_run.json" or "/" not in relative:
+                continue
+            dataset, table_file = relative.split("/", 1)
+            states[(dataset, table_file[:-len(".json")])] = json.loads(blob.download_as_bytes())
+        return states
+
+    def record(self, dataset: str, table_name: str, status: str, attempt: int, error: Optional[str] = None):
+        """Save a table's state; a failed write is logged, never fatal to the transfer"""
+        copy_status, remediation_status = CHECKPOINT_STAGES[status]
+        state = {
+            "status": status,
+            "copy": copy_status,
+            "remediation": remediation_status,
+            "attempt": attempt,
+            "error": error,
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        try:
+            self.bucket.blob(f"{self.prefix}{dataset}/{table_name}.json").upload_from_string(
+                json.dumps(state), content_type="application/json")
+        except Exception as e:
+            logger.warning(f"Failed to checkpoint {dataset}.{table_name} ({status}): {e}")
+
 class BigQueryTransferService:
-    def __init__(self, environment: str):
+    def __init__(self, environment: str, remediation_mode: Optional[str] = None,
+                 dataset_mapping: Optional[Tuple[str, str]] = None, client: Optional[bigquery.Client] = None,
+                 copy_mode: Optional[str] = None):
         self.environment = environment
+        self.remediation_mode = remediation_mode or os.getenv("REMEDIATION_MODE", "dml")
+        if self.remediation_mode not in REMEDIATION_MODES:
+            raise ValueError(f"Unknown remediation mode: {self.remediation_mode}. Must be one of {REMEDIATION_MODES}")
+        self.copy_mode = copy_mode or os.getenv("COPY_MODE", "full")
+        if self.copy_mode not in COPY_MODES:
+            raise ValueError(f"Unknown copy mode: {self.copy_mode}. Must be one of {COPY_MODES}")
         self._setup_environment_config()
-        # Initialize client with destination project (where jobs will run)
-        self.client = bigquery.Client(project=self.dest_project)
+        # One service instance handles one SOURCE:DEST pair (the first one unless given)
+        self.source_dataset, self.dest_dataset = dataset_mapping or self.dataset_mappings[0]
+        # Parsed once: table -> [(column, tactic)]; checked against source schemas before any copy
+        self.redaction_index = compile_sensitive_columns(self.sensitive_columns, self.source_dataset)
+        self.source_schemas: Dict[str, List[bigquery.SchemaField]] = {}
+        # Source table metadata (schema and partitioning) of the tables with sensitive columns
+        self.source_tables: Dict[str, bigquery.Table] = {}
+        # Delta mode: table -> {partition_id: last_modified_time} on each side, read once in prepare()
+        self.source_partitions: Dict[str, Dict[Optional[str], datetime]] = {}
+        self.dest_partitions: Dict[str, Dict[Optional[str], datetime]] = {}
+        # Delta mode: rows of the partitions copied this run, so redaction leaves the rest untouched
+        self.partition_filters: Dict[str, str] = {}
+        # dml mode: table -> REDACTION_RULES_LABEL of the destination copy, read once in prepare()
+        self.dest_rule_hashes: Dict[str, Optional[str]] = {}
+        # Caps the BigQuery jobs in flight; MultiDatasetTransfer shares one across every dataset pair.
+        # transfer_table() holds one slot per table, extra concurrent partition copies take more.
+        self.job_slots = threading.BoundedSemaphore(MAX_INFLIGHT_JOBS)
+        # Dataset locations, read in prepare(); a mismatch switches copies to export/load
+        self.source_location: Optional[str] = None
+        self.dest_location: Optional[str] = None
+        self.cross_region = False
+        self.storage_client: Optional[storage.Client] = None
+        # Tables whose sensitive columns were already redacted in the cross-region export query
+        self.redacted_in_export: set = set()
+        # Tables are copied into copy_dataset; in view mode consumers read masked views in dest_dataset
+        self.copy_dataset = (self.dest_dataset + RAW_DATASET_SUFFIX
+                             if self.remediation_mode == "view" else self.dest_dataset)
+        # Initialize client with destination project (where jobs will run); shared across datasets when given
+        self.client = client or bigquery.Client(project=self.dest_project)
+        # Per-table job statistics collected during transfer_dataset()
+        self.table_metrics: Dict[str, Dict[str, Any]] = {}
+        # Set by MultiDatasetTransfer when the run is checkpointed
+        self.checkpoint: Optional[TransferCheckpoint] = None
+        # Outcome of verify_tables() for this dataset pair
+        self.verification: Dict[str, Any] = {"status": "skipped"}
+        self.report: Dict[str, Any] = {}
     
     def _setup_environment_config(self):
         """Setup environment-specific configuration"""
         if self.environment == "dev":
             self.source_project = os.getenv("DEV_SOURCE_PROJECT", "sbox-rgodoy-001-20251124")
             self.dest_project = os.getenv("DEV_DEST_PROJECT", "sbox-rgodoy-002-20251008")
-            self.source_dataset = "dts_01"
-            self.dest_dataset = "dev_dts"
-            # NOTE: sensitive_columns format is DATASET:TABLE.COLUMN.TACTIC, matching bq_transfer.sh
-            self.sensitive_columns = [
-                "dts_01:stg_business_licenses.account_number.redact",
-                "dts_01:stg_business_licenses.business_address.redact",
-                "dts_01:stg_business_licenses.community_area.redact",
-                "dts_01:stg_business_licenses.payment_date.redact",
-                "dts_01:stg_crimes.x_coordinate.redact",
-                "dts_01:stg_crimes.y_coordinate.redact",
-                "dts_01:stg_crimes.latitude.redact",
-                "dts_01:stg_crimes.longitude.redact",
-                "dts_01:stg_crimes.location_description.redact"
-            ]
+            self.dataset_mappings = parse_dataset_mappings(
+                os.getenv("DEV_DATASET_MAPPINGS", "dts_01:dev_dts,dts_02:dev_dts_02"))
+            # NOTE: sensitive_columns format is DATASET:TABLE.COLUMN.TACTIC, shared with bq_transfer.sh
+            self.sensitive_columns = load_sensitive_columns(self.environment)
             logger.info("Using DEV environment configuration (full redaction)")
             
         elif self.environment == "uat":
             self.source_project = os.getenv("UAT_SOURCE_PROJECT", "sbox-rgodoy-001-20251124")
             self.dest_project = os.getenv("UAT_DEST_PROJECT", "sbox-rgodoy-002-20251008")
-            self.source_dataset = "dts_01"
-            self.dest_dataset = "uat_dts"
-            self.sensitive_columns = []  # No redaction for UAT
+            self.dataset_mappings = parse_dataset_mappings(
+                os.getenv("UAT_DATASET_MAPPINGS", "dts_01:uat_dts,dts_02:uat_dts_02"))
+            self.sensitive_columns = load_sensitive_columns(self.environment)  # No redaction for UAT
             logger.info("Using UAT environment configuration (no redaction)")
             
         else:
             raise ValueError(f"Unknown environment: {self.environment}")
     
+    @staticmethod
+    def _elapsed_ms(start: Optional[datetime], end: Optional[datetime]) -> Optional[int]:
+        """Milliseconds between two job timestamps, or None if either is missing"""
+        if start is None or end is None:
+            return None
+        return int((end - start).total_seconds() * 1000)
+
+    def _job_metrics(self, job) -> Dict[str, Any]:
+        """Extract timing and resource usage from the statistics of a completed job"""
+        stats = job.to_api_repr().get("statistics", {})
+        return {
+            "job_id": job.job_id,
+            "duration_ms": self._elapsed_ms(job.started, job.ended),
+            "queue_wait_ms": self._elapsed_ms(job.created, job.started),
+            "slot_ms": int(stats.get("totalSlotMs") or 0),
+        }
+
+    def _copy_job_metrics(self, job) -> Dict[str, Any]:
+        """Copy statistics (copy jobs report bytes/rows under statistics.copy)"""
+        metrics = self._job_metrics(job)
+        copy_stats = job.to_api_repr().get("statistics", {}).get("copy", {})
+        metrics["bytes"] = int(copy_stats.get("copiedLogicalBytes") or 0)
+        metrics["rows"] = int(copy_stats.get("copiedRows") or 0)
+        return metrics
+
     def validate_authentication(self) -> bool:
         """Validate that we can access both projects"""
         try:
@@ -74,14 +471,15 @@ class BigQueryTransferService:
             logger.error(f"Authentication validation failed: {e}")
             return False
 
-    def ensure_dest_dataset_exists(self) -> bool:
+    def ensure_dest_dataset_exists(self, dataset_name: Optional[str] = None) -> bool:
         """
-        FIX 1: Creates the destination dataset if it does not exist.
+        FIX 1: Creates the destination dataset (or dataset_name in the destination project) if it does not exist.
         This prevents the copy_table operation from failing on a NotFound error.
         It also attempts to infer the location from the source dataset for compatibility.
         """
-        dest_dataset_id = f"{self.dest_project}.{self.dest_dataset}"
-        dataset_ref = bigquery.DatasetReference(self.dest_project, self.dest_dataset)
+        dataset_name = dataset_name or self.dest_dataset
+        dest_dataset_id = f"{self.dest_project}.{dataset_name}"
+        dataset_ref = bigquery.DatasetReference(self.dest_project, dataset_name)
         dataset = bigquery.Dataset(dataset_ref)
         
         try:
@@ -123,9 +521,13 @@ class BigQueryTransferService:
             for table in source_client.list_tables(dataset_ref):
                 # Only copy native BigQuery tables (BASE TABLE, not EXTERNAL, VIEW, etc.)
                 # This check ensures consistency with the bash script's INFORMATION_SCHEMA query.
-                table_obj = source_client.get_table(table.reference)
-                if table_obj.table_type == "TABLE":
+                # The listing already carries the type; only tables with sensitive columns need a
+                # get_table() call, for their schema.
+                if table.table_type == "TABLE":
                     tables.append(table.table_id)
+                    if table.table_id in self.redaction_index:
+                        self.source_tables[table.table_id] = source_client.get_table(table.reference)
+                        self.source_schemas[table.table_id] = self.source_tables[table.table_id].schema
             
             logger.info(f"Found {len(tables)} tables to copy: {tables}")
             return tables
@@ -136,9 +538,11 @@ class BigQueryTransferService:
     
     def copy_table(self, table_name: str) -> bool:
         """Copy a single table from source to destination"""
+        if self.cross_region:
+            return self.export_load_table(table_name)
         try:
             source_table_id = f"{self.source_project}.{self.source_dataset}.{table_name}"
-            dest_table_id = f"{self.dest_project}.{self.dest_dataset}.{table_name}"
+            dest_table_id = f"{self.dest_project}.{self.copy_dataset}.{table_name}"
             
             logger.info(f"Copying table: {source_table_id} → {dest_table_id}")
             
@@ -158,152 +562,980 @@ class BigQueryTransferService:
             # Wait for the job to complete
             job.result()  # This blocks until the job completes
             
-            # Get the destination table to report row count
-            try:
-                dest_table = self.client.get_table(dest_table_id)
-                logger.info(f"Successfully copied table: {table_name} ({dest_table.num_rows} rows)")
-            except Exception:
-                # If we can't get the row count, still report success
-                logger.info(f"Successfully copied table: {table_name}")
+            copy_metrics = self._copy_job_metrics(job)
+            self.table_metrics.setdefault(table_name, {})["copy"] = copy_metrics
+            # The copy job reports its row count; contents are checked by verify_tables()
+            logger.info(f"Successfully copied table: {table_name} ({copy_metrics['rows']} rows)")
             
             return True
             
         except Exception as e:
             logger.error(f"Failed to copy table {table_name}: {e}")
             logger.error(f"Details: {type(e).__name__}: {str(e)}")
+            self.table_metrics.setdefault(table_name, {})["error"] = f"{type(e).__name__}: {e}"
             return False
     
+    def detect_locations(self) -> bool:
+        """
+        Read both dataset locations. Copy jobs cannot cross locations, so a mismatch switches every
+        table to export_load_table(); that needs TRANSFER_STAGING_BUCKET. Returns False if it is unset.
+        """
+        self.source_location = self.client.get_dataset(
+            bigquery.DatasetReference(self.source_project, self.source_dataset)).location
+        self.dest_location = self.client.get_dataset(
+            bigquery.DatasetReference(self.dest_project, self.copy_dataset)).location
+        self.cross_region = (self.source_location or "").lower() != (self.dest_location or "").lower()
+        if not self.cross_region:
+            return True
+        
+        if not STAGING_BUCKET:
+            logger.error(f"Location mismatch: {self.source_dataset} is in {self.source_location}, {self.copy_dataset} is in "
+                         f"{self.dest_location}. Set TRANSFER_STAGING_BUCKET to transfer via export/load.")
+            return False
+        logger.info(f"Location mismatch ({self.source_location} → {self.dest_location}): "
+                    f"transferring {self.source_dataset} via gs://{STAGING_BUCKET}"
+                    f"{f' and gs://{LOAD_BUCKET}' if LOAD_BUCKET != STAGING_BUCKET else ''}")
+        self.storage_client = self.storage_client or storage.Client(project=self.dest_project)
+        return True
+
+    def export_load_table(self, table_name: str) -> bool:
+        """
+        Cross-region fallback for copy_table(): EXPORT DATA the table as sharded Avro (one wildcard URI,
+        written in parallel by BigQuery), run a single load job over the shards in the destination location,
+        then delete them. In dml mode the sensitive columns are redacted in the export projection, so
+        unredacted rows never reach the staging bucket or the destination. Tables share the worker pool,
+        so one table's load overlaps the next table's export.
+        """
+        source_table_id = f"{self.source_project}.{self.source_dataset}.{table_name}"
+        dest_table_id = f"{self.dest_project}.{self.copy_dataset}.{table_name}"
+        prefix = f"{STAGING_PREFIX}{self.source_dataset}/{table_name}/{uuid.uuid4().hex[:8]}/"
+        export_bucket = self.storage_client.bucket(STAGING_BUCKET)
+        load_bucket = self.storage_client.bucket(LOAD_BUCKET)
+        self.redacted_in_export.discard(table_name)
+        
+        try:
+            source_table = self.client.get_table(source_table_id)
+            replacements = []
+            if self.remediation_mode == "dml":
+                # View mode keeps the raw copy unredacted; its masked views do the work
+                field_types = {field.name.lower(): field.field_type for field in source_table.schema}
+                for column_name, tactic in self.sensitive_columns_for(table_name):
+                    expression = masked_view_expression(column_name, tactic, field_types.get(column_name.lower(), "STRING"))
+                    if expression is not None:
+                        replacements.append(f"{expression} AS {column_name}")
+            replace_clause = f" REPLACE ({', '.join(replacements)})" if replacements else ""
+            
+            logger.info(f"Exporting {source_table_id} ({self.source_location}) to gs://{STAGING_BUCKET}/{prefix}"
+                        f"{f' with {len(replacements)} columns redacted' if replacements else ''}")
+            export_sql = f"""
+            EXPORT DATA OPTIONS (
+                uri = 'gs://{STAGING_BUCKET}/{prefix}part-*.avro',
+                format = 'AVRO',
+                use_avro_logical_types = true,
+                overwrite = true
+            ) AS
+            SELECT *{replace_clause} FROM `{source_table_id}`
+            """
+            export_job = self.client.query(export_sql, location=self.source_location)
+            export_job.result()
+            
+            staged = list(export_bucket.list_blobs(prefix=prefix))
+            if load_bucket.name != export_bucket.name:
+                for blob in staged:
+                    export_bucket.copy_blob(blob, load_bucket, blob.name)
+            
+            # Avro carries the schema; partitioning and clustering are taken from the source table
+            job_config = bigquery.LoadJobConfig(
+                source_format=bigquery.SourceFormat.AVRO,
+                use_avro_logical_types=True,
+                write_disposition="WRITE_TRUNCATE",
+            )
+            if source_table.time_partitioning is not None:
+                job_config.time_partitioning = source_table.time_partitioning
+            if source_table.range_partitioning is not None:
+                job_config.range_partitioning = source_table.range_partitioning
+            if source_table.clustering_fields:
+                job_config.clustering_fields = source_table.clustering_fields
+            
+            logger.info(f"Loading {len(staged)} files into {dest_table_id} ({self.dest_location})")
+            load_job = self.client.load_table_from_uri(
+                f"gs://{LOAD_BUCKET}/{prefix}part-*.avro", dest_table_id,
+                job_config=job_config, location=self.dest_location)
+            load_job.result()
+            
+            export_metrics, load_metrics = self._job_metrics(export_job), self._job_metrics(load_job)
+            self.table_metrics.setdefault(table_name, {})["copy"] = {
+                "strategy": "export_load",
+                "job_id": load_job.job_id,
+                "export_job_id": export_job.job_id,
+                "duration_ms": (export_metrics["duration_ms"] or 0) + (load_metrics["duration_ms"] or 0),
+                "queue_wait_ms": (export_metrics["queue_wait_ms"] or 0) + (load_metrics["queue_wait_ms"] or 0),
+                "slot_ms": export_metrics["slot_ms"] + load_metrics["slot_ms"],
+                "bytes": int(load_job.output_bytes or 0),
+                "rows": int(load_job.output_rows or 0),
+                "staged_files": len(staged),
+            }
+            if replacements:
+                self.redacted_in_export.add(table_name)
+            logger.info(f"Successfully transferred table: {table_name} ({load_job.output_rows} rows) via export/load")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to export/load table {table_name}: {e}")
+            self.table_metrics.setdefault(table_name, {})["error"] = f"{type(e).__name__}: {e}"
+            return False
+        finally:
+            for bucket in {export_bucket.name: export_bucket, load_bucket.name: load_bucket}.values():
+                try:
+                    bucket.delete_blobs(list(bucket.list_blobs(prefix=prefix)))
+                except Exception as e:
+                    logger.warning(f"Failed to clean up gs://{bucket.name}/{prefix}: {e}")
+
+    def list_partitions(self, project: str, dataset: str,
+                        table_name: Optional[str] = None) -> Dict[str, Dict[Optional[str], datetime]]:
+        """
+        table -> {partition_id: last_modified_time} for every table in a dataset (or just table_name),
+        from one metadata query
+        """
+        sql = f"""
+        SELECT table_name, partition_id, last_modified_time
+        FROM `{project}.{dataset}.INFORMATION_SCHEMA.PARTITIONS`
+        """
+        job_config = None
+        if table_name is not None:
+            sql += "WHERE table_name = @table_name"
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[bigquery.ScalarQueryParameter("table_name", "STRING", table_name)])
+        partitions: Dict[str, Dict[Optional[str], datetime]] = {}
+        for row in self.client.query(sql, job_config=job_config).result():
+            partitions.setdefault(row.table_name, {})[row.partition_id] = row.last_modified_time
+        return partitions
+
+    def copy_delta(self, table_name: str) -> bool:
+        """
+        Delta mode: copy only the partitions modified since the destination copy, each with its own
+        WRITE_TRUNCATE copy job on table$partition, and drop partitions deleted at the source.
+        Falls back to copy_table() when the table is new, unpartitioned and changed, or too much changed.
+        """
+        # A retried attempt may copy differently (e.g. in full) than the one that set the filter
+        self.partition_filters.pop(table_name, None)
+        source = self.source_partitions.get(table_name, {})
+        action, changed, removed = plan_delta_copy(source, self.dest_partitions.get(table_name, {}))
+        row_filter = partition_filter(changed, self.source_tables.get(table_name))
+        # Without a partition predicate the redaction would have to rewrite (and re-hash) the whole table
+        if action == "partitions" and self.sensitive_columns_for(table_name) and row_filter is None:
+            action = "full"
+        # Rows kept from earlier runs were redacted with other rules: only a full copy redacts them anew
+        rules_changed = (self.remediation_mode == "dml" and action != "full" and self.dest_rule_hashes.get(table_name)
+                         != redaction_rules_hash(self.sensitive_columns_for(table_name)))
+        if rules_changed:
+            logger.info(f"Redaction rules of {table_name} changed since its last transfer. Copying it in full.")
+            action = "full"
+        delta = {"action": action, "partitions_total": len(source),
+                 "partitions_changed": len(changed), "partitions_removed": len(removed)}
+        if rules_changed:
+            delta["rules_changed"] = True
+        self.table_metrics.setdefault(table_name, {})["delta"] = delta
+        
+        if action == "full":
+            return self.copy_table(table_name)
+        if action == "unchanged":
+            logger.info(f"Table {table_name} unchanged since the last transfer. Skipping copy.")
+            return True
+        
+        source_table_id = f"{self.source_project}.{self.source_dataset}.{table_name}"
+        dest_table_id = f"{self.dest_project}.{self.copy_dataset}.{table_name}"
+        try:
+            logger.info(f"Copying {len(changed)} changed partitions of {source_table_id} → {dest_table_id}")
+            # Partition copies run side by side, within the shared cap on jobs in flight
+            jobs = self.run_capped(lambda pid: self.client.copy_table(
+                f"{source_table_id}${pid}", f"{dest_table_id}${pid}",
+                job_config=bigquery.CopyJobConfig(write_disposition="WRITE_TRUNCATE")), changed)
+            for pid in removed:
+                self.client.delete_table(f"{dest_table_id}${pid}", not_found_ok=True)
+        except Exception as e:
+            # e.g. the source schema or partitioning changed; a full copy replaces the table
+            logger.warning(f"Partition copy failed for {table_name} ({type(e).__name__}: {e}). Falling back to a full copy.")
+            delta["action"] = "full"
+            return self.copy_table(table_name)
+        
+        job_metrics = [self._copy_job_metrics(job) for job in jobs]
+        self.table_metrics[table_name]["copy"] = {
+            "job_ids": [m["job_id"] for m in job_metrics],
+            "duration_ms": max((m["duration_ms"] or 0 for m in job_metrics), default=0),
+            "queue_wait_ms": max((m["queue_wait_ms"] or 0 for m in job_metrics), default=0),
+            "slot_ms": sum(m["slot_ms"] for m in job_metrics),
+            "bytes": sum(m["bytes"] for m in job_metrics),
+            "rows": sum(m["rows"] for m in job_metrics),
+        }
+        if row_filter:
+            self.partition_filters[table_name] = row_filter
+        logger.info(f"Successfully copied {len(changed)}/{len(source)} partitions of {table_name}"
+                    f"{f' and removed {len(removed)}' if removed else ''}")
+        return True
+
+    def run_capped(self, submit: Callable[[str], Any], items: List[str]) -> List[Any]:
+        """
+        Submits a job per item and waits for all of them. The caller's slot in job_slots covers one job in
+        flight; each further concurrent job needs a spare slot, and without one the oldest running job is
+        awaited first. Returns the jobs in item order.
+        """
+        jobs, running, extra_slots = [], deque(), 0
+        try:
+            for item in items:
+                if len(running) > extra_slots:
+                    if self.job_slots.acquire(blocking=False):
+                        extra_slots += 1
+                    else:
+                        running.popleft().result()
+                job = submit(item)
+                jobs.append(job)
+                running.append(job)
+            for job in running:
+                job.result()
+        finally:
+            for _ in range(extra_slots):
+                self.job_slots.release()
+        return jobs
+
+    def read_rule_hashes(self):
+        """dml mode: the REDACTION_RULES_LABEL of every destination table, from one table listing"""
+        self.dest_rule_hashes = {
+            table.table_id: (table.labels or {}).get(REDACTION_RULES_LABEL)
+            for table in self.client.list_tables(bigquery.DatasetReference(self.dest_project, self.copy_dataset))
+        }
+
+    def record_rule_hash(self, table_name: str):
+        """Labels a redacted destination table with the hash of its current rules (removed when it has none)"""
+        rules_hash = redaction_rules_hash(self.sensitive_columns_for(table_name))
+        if self.dest_rule_hashes.get(table_name) == rules_hash:
+            return
+        try:
+            table = self.client.get_table(f"{self.dest_project}.{self.copy_dataset}.{table_name}")
+            # A None value deletes the label
+            table.labels = {REDACTION_RULES_LABEL: rules_hash}
+            self.client.update_table(table, ["labels"])
+            self.dest_rule_hashes[table_name] = rules_hash
+        except Exception as e:
+            # A stale or missing label only makes the next delta run copy the table in full
+            logger.warning(f"Failed to label {table_name} with its redaction rules: {e}")
+
+    def discard_unremediated(self, table_name: str):
+        """
+        Delta + dml mode: drop the destination table when its redaction failed. Its copy would otherwise
+        look newer than the source, and the next delta run would skip the unredacted data.
+        """
+        dest_table_id = f"{self.dest_project}.{self.copy_dataset}.{table_name}"
+        try:
+            # Redaction may have rewritten some columns already; dropping the table is the only safe state
+            self.client.delete_table(dest_table_id, not_found_ok=True)
+            self.dest_partitions.pop(table_name, None)
+            self.dest_rule_hashes.pop(table_name, None)
+            logger.warning(f"Deleted {dest_table_id} after failed redaction; the next run copies it in full")
+        except Exception as e:
+            logger.error(f"Failed to delete unredacted table {dest_table_id}: {e}")
+
+    def sensitive_columns_for(self, table_name: str) -> List[Tuple[str, str]]:
+        """(column, tactic) pairs configured for a table"""
+        return self.redaction_index.get(table_name, [])
+
+    def validate_sensitive_columns(self, tables: List[str]) -> bool:
+        """Check every configured column exists in its source table schema, before anything is copied"""
+        errors = []
+        for table_name, columns in self.redaction_index.items():
+            if table_name not in self.source_schemas:
+                logger.warning(f"Sensitive columns configured for {table_name}, which is not a table in "
+                               f"{self.source_project}.{self.source_dataset}. Ignoring.")
+                continue
+            # Column names are case-insensitive in BigQuery
+            schema_columns = {field.name.lower() for field in self.source_schemas[table_name]}
+            for column_name, tactic in columns:
+                if column_name.lower() not in schema_columns:
+                    errors.append(f"{table_name}.{column_name} ({tactic})")
+        
+        if errors:
+            logger.error(f"Sensitive columns not found in source schemas: {', '.join(errors)}. "
+                         f"Fix {SENSITIVE_COLUMNS_FILE} before transferring.")
+            return False
+        logger.info(f"Validated {sum(len(c) for c in self.redaction_index.values())} sensitive columns against source schemas")
+        return True
+
+    def remediate(self, table_name: str) -> bool:
+        """Protect a copied table's sensitive columns using the configured remediation mode"""
+        if self.remediation_mode == "view":
+            return self.publish_masked_view(table_name)
+        return self.apply_redaction(table_name)
+
     def apply_redaction(self, table_name: str) -> bool:
         """Apply redaction to sensitive columns in a table"""
-        if not self.sensitive_columns:
+        if not self.sensitive_columns_for(table_name):
             logger.info(f"No redaction needed for table: {table_name}")
+            # Drops the label of rules that have since been removed
+            self.record_rule_hash(table_name)
+            return True
+        if self.table_metrics.get(table_name, {}).get("delta", {}).get("action") == "unchanged":
+            # copy_delta() copies the table in full instead when its rules changed
+            logger.info(f"Table {table_name} not copied this run; its redaction is already in place")
+            return True
+        if table_name in self.redacted_in_export:
+            logger.info(f"Sensitive columns of {table_name} were redacted in the cross-region export")
+            self.record_rule_hash(table_name)
             return True
         
         try:
             # DML updates run in the project where the destination table resides
             dest_table_id = f"{self.dest_project}.{self.dest_dataset}.{table_name}"
+            # Delta mode: only the partitions copied this run (re-applying FF/hash would corrupt the rest)
+            row_filter = self.partition_filters.get(table_name)
+            where_all = row_filter or "TRUE"
+            and_partitions = f" AND ({row_filter})" if row_filter else ""
             
-            for column_config in self.sensitive_columns:
-                try:
-                    # FIX 2: Correctly parse config: dataset:table.column.tactic
-                    parts = column_config.split(":") 
-                    if len(parts) != 2:
-                        logger.warning(f"Skipping malformed config (expecting 1 ':'): {column_config}")
-                        continue
-
-                    # parts[0] is dataset_name (dts_01)
-                    col_info = parts[1] # e.g., 'stg_business_licenses.account_number.redact'
-                    
-                    # Split col_info by '.' to get table, column, and tactic
-                    col_parts = col_info.split(".")
-                    if len(col_parts) != 3:
-                        logger.warning(f"Skipping malformed config (expecting 2 '.'): {column_config}")
-                        continue
-                        
-                    config_table_name = col_parts[0]  # e.g., 'stg_business_licenses'
-                    column_name = col_parts[1]        # e.g., 'account_number'
-                    tactic = col_parts[2]             # e.g., 'redact'
-                    
-                except Exception as e:
-                    logger.error(f"Failed to parse sensitive column config '{column_config}': {e}. Skipping.")
+            for column_name, tactic in self.sensitive_columns_for(table_name):
+                logger.info(f"Applying {tactic} to {table_name}.{column_name}")
+                
+                if tactic == "redact":
+                    sql = f"""
+                    UPDATE `{dest_table_id}`
+                    SET {column_name} = NULL
+                    WHERE {where_all}
+                    """
+                elif tactic == "FF":
+                    # Note: The original SQL was slightly cleaner, using T.
+                    sql = f"""
+                    UPDATE `{dest_table_id}` T
+                    SET {column_name} = FARM_FINGERPRINT(CAST(T.{column_name} AS STRING))
+                    WHERE {where_all}
+                    """
+                elif tactic == "mask":
+                    sql = f"""
+                    UPDATE `{dest_table_id}`
+                    SET {column_name} = CASE 
+                        WHEN LENGTH(CAST({column_name} AS STRING)) > 4 THEN 
+                            CONCAT('****', SUBSTR(CAST({column_name} AS STRING), -4))
+                        ELSE '****'
+                    END
+                    WHERE {column_name} IS NOT NULL{and_partitions}
+                    """
+                elif tactic == "hash":
+                    sql = f"""
+                    UPDATE `{dest_table_id}`
+                    SET {column_name} = TO_HEX(SHA256(CAST({column_name} AS BYTES)))
+                    WHERE {column_name} IS NOT NULL{and_partitions}
+                    """
+                else:
+                    logger.warning(f"Unknown tactic: {tactic}. Skipping.")
                     continue
                 
-                # CORRECT MATCHING: Check if the current table matches the configured table name
-                if table_name == config_table_name:
-                    
-                    logger.info(f"Applying {tactic} to {table_name}.{column_name}")
-                    
-                    if tactic == "redact":
-                        sql = f"""
-                        UPDATE `{dest_table_id}`
-                        SET {column_name} = NULL
-                        WHERE TRUE
-                        """
-                    elif tactic == "FF":
-                        # Note: The original SQL was slightly cleaner, using T.
-                        sql = f"""
-                        UPDATE `{dest_table_id}` T
-                        SET {column_name} = FARM_FINGERPRINT(CAST(T.{column_name} AS STRING))
-                        WHERE TRUE
-                        """
-                    elif tactic == "mask":
-                        sql = f"""
-                        UPDATE `{dest_table_id}`
-                        SET {column_name} = CASE 
-                            WHEN LENGTH(CAST({column_name} AS STRING)) > 4 THEN 
-                                CONCAT('****', SUBSTR(CAST({column_name} AS STRING), -4))
-                            ELSE '****'
-                        END
-                        WHERE {column_name} IS NOT NULL
-                        """
-                    elif tactic == "hash":
-                        sql = f"""
-                        UPDATE `{dest_table_id}`
-                        SET {column_name} = TO_HEX(SHA256(CAST({column_name} AS BYTES)))
-                        WHERE {column_name} IS NOT NULL
-                        """
-                    else:
-                        logger.warning(f"Unknown tactic: {tactic}. Skipping.")
-                        continue
-                    
-                    # Execute the SQL (DML runs in the destination project)
-                    job_config = bigquery.QueryJobConfig(
-                        # This ensures the job runs in the destination project for DML
-                        default_dataset=bigquery.DatasetReference(self.dest_project, self.dest_dataset)
-                    )
-                    job = self.client.query(sql, job_config=job_config)
-                    job.result()
-                    logger.info(f"Applied {tactic} to {table_name}.{column_name} successfully.")
+                # Execute the SQL (DML runs in the destination project)
+                job_config = bigquery.QueryJobConfig(
+                    # This ensures the job runs in the destination project for DML
+                    default_dataset=bigquery.DatasetReference(self.dest_project, self.dest_dataset)
+                )
+                job = self.client.query(sql, job_config=job_config)
+                job.result()
+                
+                metrics = self._job_metrics(job)
+                metrics.update({
+                    "column": column_name,
+                    "tactic": tactic,
+                    "bytes_processed": job.total_bytes_processed or 0,
+                    "rows_affected": job.num_dml_affected_rows or 0,
+                })
+                self.table_metrics.setdefault(table_name, {}).setdefault("redactions", []).append(metrics)
+                logger.info(f"Applied {tactic} to {table_name}.{column_name} successfully.")
             
+            self.record_rule_hash(table_name)
             return True
             
         except Exception as e:
             logger.error(f"Failed to apply redaction to {table_name}: {e}")
+            self.table_metrics.setdefault(table_name, {})["error"] = f"{type(e).__name__}: {e}"
+            return False
+
+    def publish_masked_view(self, table_name: str) -> bool:
+        """
+        View mode: publish dest_dataset.<table> as a view over the raw copy, with each sensitive
+        column replaced by its tactic's expression. Only metadata changes; no table data is rewritten.
+        """
+        try:
+            raw_table_id = f"{self.dest_project}.{self.copy_dataset}.{table_name}"
+            view_id = f"{self.dest_project}.{self.dest_dataset}.{table_name}"
+            # Column names are case-insensitive in BigQuery, as in validate_sensitive_columns()
+            field_types = {field.name.casefold(): field.field_type
+                           for field in self.client.get_table(raw_table_id).schema}
+            
+            replacements = []
+            for column_name, tactic in self.sensitive_columns_for(table_name):
+                if column_name.casefold() not in field_types:
+                    raise ValueError(f"Sensitive column {column_name} not found in {raw_table_id}")
+                expression = masked_view_expression(column_name, tactic, field_types[column_name.casefold()])
+                if expression is None:
+                    logger.warning(f"Unknown tactic: {tactic}. Skipping.")
+                    continue
+                replacements.append(f"{expression} AS {column_name}")
+            
+            replace_clause = f" REPLACE ({', '.join(replacements)})" if replacements else ""
+            view_query = f"SELECT *{replace_clause} FROM `{raw_table_id}`"
+            
+            # Replace a table left behind by an earlier DML-mode transfer; update an existing view in place
+            try:
+                existing = self.client.get_table(view_id)
+            except NotFound:
+                existing = None
+            if existing is not None and existing.table_type != "VIEW":
+                logger.info(f"Replacing table {view_id} with a masked view")
+                self.client.delete_table(view_id)
+                existing = None
+            if existing is None:
+                view = bigquery.Table(view_id)
+                view.view_query = view_query
+                self.client.create_table(view)
+            elif existing.view_query != view_query:
+                existing.view_query = view_query
+                self.client.update_table(existing, ["view_query"])
+            
+            self.table_metrics.setdefault(table_name, {})["view"] = {
+                "view": view_id,
+                "masked_columns": len(replacements),
+            }
+            logger.info(f"Published view {view_id} ({len(replacements)} masked columns)")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to publish masked view for {table_name}: {e}")
+            self.table_metrics.setdefault(table_name, {})["error"] = f"{type(e).__name__}: {e}"
+            return False
+
+    def authorize_views(self) -> bool:
+        """
+        View mode: authorize every view in dest_dataset on the raw dataset, so consumers granted
+        dest_dataset can query the masked views without any access to the raw copy.
+        """
+        try:
+            raw_dataset = self.client.get_dataset(bigquery.DatasetReference(self.dest_project, self.copy_dataset))
+            entry = bigquery.AccessEntry(
+                role=None,
+                entity_type="dataset",
+                entity_id={
+                    "dataset": {"projectId": self.dest_project, "datasetId": self.dest_dataset},
+                    "targetTypes": ["VIEWS"],
+                },
+            )
+            if any(existing.entity_type == "dataset" and existing.entity_id == entry.entity_id
+                   for existing in raw_dataset.access_entries):
+                return True
+            raw_dataset.access_entries = list(raw_dataset.access_entries) + [entry]
+            self.client.update_dataset(raw_dataset, ["access_entries"])
+            logger.info(f"Authorized views in {self.dest_project}.{self.dest_dataset} on {self.dest_project}.{self.copy_dataset}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to authorize views on {self.copy_dataset}: {e}")
             return False
     
+    def prepare(self) -> Optional[List[str]]:
+        """
+        Discovery for this dataset pair: ensure destination datasets exist, list the source tables and
+        validate sensitive columns. Returns the tables to transfer, or None if the dataset cannot be transferred.
+        """
+        # FIX: Ensure destination dataset exists
+        if not self.ensure_dest_dataset_exists():
+            return None
+        if self.copy_dataset != self.dest_dataset:
+            if not self.ensure_dest_dataset_exists(self.copy_dataset) or not self.authorize_views():
+                return None
+        
+        try:
+            if not self.detect_locations():
+                return None
+        except Exception as e:
+            logger.error(f"Failed to read dataset locations for {self.source_dataset}: {e}")
+            return None
+        
+        tables = self.get_tables_to_copy()
+        
+        # Reject unknown sensitive columns before any copy starts
+        if not self.validate_sensitive_columns(tables):
+            return None
+        
+        if self.copy_mode == "delta" and self.cross_region:
+            logger.warning(f"Delta copy needs matching locations; copying {self.source_dataset} tables in full")
+        elif self.copy_mode == "delta":
+            try:
+                self.source_partitions = self.list_partitions(self.source_project, self.source_dataset)
+                self.dest_partitions = self.list_partitions(self.dest_project, self.copy_dataset)
+            except Exception as e:
+                # Without partition metadata every table is copied in full
+                logger.warning(f"Could not read partition metadata for {self.source_dataset}: {e}. Copying tables in full.")
+                self.source_partitions, self.dest_partitions = {}, {}
+        if self.remediation_mode == "dml":
+            try:
+                self.read_rule_hashes()
+            except Exception as e:
+                # Unknown labels count as changed rules: delta mode copies tables with sensitive columns in full
+                logger.warning(f"Could not read redaction labels of {self.copy_dataset}: {e}")
+                self.dest_rule_hashes = {}
+        return tables
+
+    def save_checkpoint(self, table_name: str, status: str):
+        if self.checkpoint is not None:
+            entry = self.table_metrics.get(table_name, {})
+            self.checkpoint.record(self.source_dataset, table_name, status, entry.get("attempts", 1), entry.get("error"))
+
+    def transfer_table(self, table_name: str, attempt: int = 1) -> bool:
+        """Copy one table and remediate its sensitive columns, recording status and wall time"""
+        with self.job_slots:
+            return self._transfer_table(table_name, attempt)
+
+    def _transfer_table(self, table_name: str, attempt: int) -> bool:
+        table_start = time.monotonic()
+        # Each attempt starts from a clean entry so a retried success does not carry the earlier error
+        self.table_metrics[table_name] = {"attempts": attempt}
+        delta_copy = self.copy_mode == "delta" and not self.cross_region
+        if delta_copy and attempt > 1:
+            # The failed attempt may have copied partitions or discarded the table since prepare() read them
+            try:
+                refreshed = self.list_partitions(self.dest_project, self.copy_dataset, table_name)
+                self.dest_partitions[table_name] = refreshed.get(table_name, {})
+            except Exception as e:
+                logger.warning(f"Could not re-read partitions of {table_name}: {e}. Copying it in full.")
+                self.dest_partitions.pop(table_name, None)
+        copied = self.copy_delta(table_name) if delta_copy else self.copy_table(table_name)
+        if copied:
+            self.save_checkpoint(table_name, "copied")
+            # Only apply redaction if copy was successful
+            if self.remediate(table_name):
+                status = "success"
+            else:
+                logger.warning(f"Redaction failed for {table_name}. Counting as failure.")
+                status = "redaction_failed"
+                if self.copy_mode == "delta" and self.remediation_mode == "dml":
+                    self.discard_unremediated(table_name)
+        else:
+             logger.error(f"Copy failed for {table_name}. Skipping redaction.")
+             status = "copy_failed"
+        table_entry = self.table_metrics.setdefault(table_name, {})
+        table_entry["status"] = status
+        table_entry["wall_ms"] = int((time.monotonic() - table_start) * 1000)
+        self.save_checkpoint(table_name, status)
+        return status == "success"
+
+    def _run_verification_queries(self, tables: List[str], row_filters: Optional[Dict[str, str]] = None
+                                  ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """Both sides' verification rows (table -> {row_count, fingerprint, non_null}), from one query each"""
+        sensitive = {table_name: self.sensitive_columns_for(table_name) for table_name in tables
+                     if self.sensitive_columns_for(table_name)}
+        sides = [
+            ({t: f"{self.source_project}.{self.source_dataset}.{t}" for t in tables}, self.source_location),
+            # The dataset consumers read: the redacted copy, or the masked views in view mode
+            ({t: f"{self.dest_project}.{self.dest_dataset}.{t}" for t in tables}, self.dest_location),
+        ]
+        # Submit both queries before waiting, so the two sides are scanned side by side
+        jobs = [self.client.query(verification_query(table_ids, sensitive, self.source_schemas, row_filters),
+                                  location=location)
+                for table_ids, location in sides]
+        results = []
+        for job in jobs:
+            rows = {row["table_name"]: {"row_count": row["row_count"], "fingerprint": row["fingerprint"],
+                                        "non_null": {c["column_name"]: c["non_null"] for c in row["non_null_counts"]}}
+                    for row in job.result()}
+            results.append(rows)
+        job_metrics = [self._job_metrics(job) for job in jobs]
+        self.verification.update({
+            "job_ids": [m["job_id"] for m in job_metrics],
+            "slot_ms": sum(m["slot_ms"] for m in job_metrics),
+            "bytes_processed": sum(job.total_bytes_processed or 0 for job in jobs),
+        })
+        return results[0], results[1]
+
+    def verification_scope(self, tables: List[str], scope: Optional[str] = None) -> Tuple[List[str], Dict[str, str]]:
+        """
+        The tables to verify and the row filter of each one verified on some partitions only. The changed
+        scope leaves out delta tables that were not copied and narrows partition copies to their partitions.
+        """
+        scope = scope or VERIFY_SCOPE
+        if scope == "full":
+            return tables, {}
+        verified, row_filters = [], {}
+        for table_name in tables:
+            action = self.table_metrics.get(table_name, {}).get("delta", {}).get("action")
+            if action == "unchanged":
+                continue
+            verified.append(table_name)
+            row_filter = self.partition_filters.get(table_name)
+            # Masked views do not expose the _PARTITIONTIME pseudo-column of ingestion-time partitioning
+            if action == "partitions" and row_filter and not (
+                    self.remediation_mode == "view" and "_PARTITIONTIME" in row_filter):
+                row_filters[table_name] = row_filter
+        return verified, row_filters
+
+    def verify_tables(self, tables: List[str], scope: Optional[str] = None) -> bool:
+        """
+        Verification stage: compare the transferred tables with their source using one aggregated query per
+        side (row counts, content fingerprints without the sensitive columns, and non-null counts of the
+        sensitive columns), over what verification_scope() selects. Tables that differ are marked
+        verification_failed. False if any differ or the queries fail.
+        """
+        transferred = [t for t in tables if self.table_metrics.get(t, {}).get("status") == "success"]
+        tables, row_filters = self.verification_scope(transferred, scope)
+        if not tables:
+            return True
+        self.verification = {"status": "running", "tables_verified": len(tables),
+                             "tables_skipped": len(transferred) - len(tables),
+                             "partition_filtered": len(row_filters), "tables_mismatched": 0}
+        try:
+            source_results, dest_results = self._run_verification_queries(tables, row_filters)
+        except Exception as e:
+            logger.error(f"Verification queries failed for {self.source_dataset} → {self.dest_dataset}: {e}")
+            self.verification.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+            return False
+        
+        for table_name in tables:
+            entry = self.table_metrics.setdefault(table_name, {})
+            source, dest = source_results.get(table_name), dest_results.get(table_name)
+            issues = verification_discrepancies(source, dest, self.sensitive_columns_for(table_name))
+            entry["verification"] = {
+                "status": "mismatch" if issues else "match",
+                "scope": "partitions" if table_name in row_filters else "table",
+                "source_rows": source and source["row_count"],
+                "dest_rows": dest and dest["row_count"],
+                "discrepancies": issues,
+            }
+            if not issues:
+                continue
+            logger.error(f"Verification failed for {self.source_dataset}.{table_name}: {'; '.join(issues)}")
+            self.verification["tables_mismatched"] += 1
+            entry["status"] = "verification_failed"
+            entry["error"] = f"Verification failed: {'; '.join(issues)}"
+            # A delta run would skip this table as unchanged; dropping it makes the next run copy it in full
+            if self.copy_mode == "delta" and self.remediation_mode == "dml":
+                self.discard_unremediated(table_name)
+            self.save_checkpoint(table_name, "verification_failed")
+        
+        self.verification["status"] = "failed" if self.verification["tables_mismatched"] else "passed"
+        logger.info(f"Verified {len(tables)} tables of {self.source_dataset} → {self.dest_dataset}: "
+                    f"{self.verification['tables_mismatched']} mismatched")
+        return not self.verification["tables_mismatched"]
+
     def transfer_dataset(self) -> bool:
-        """Main method to transfer dataset with redaction"""
-        logger.info(f"Starting dataset transfer: {self.environment}")
+        """Transfer this service's single dataset pair with redaction (see MultiDatasetTransfer for all pairs)"""
+        logger.info(f"Starting dataset transfer: {self.environment} {self.source_dataset} → {self.dest_dataset} "
+                    f"(remediation: {self.remediation_mode})")
         
         # 1. Validate authentication
         if not self.validate_authentication():
             return False
         
-        # 2. FIX: Ensure destination dataset exists
-        if not self.ensure_dest_dataset_exists():
-            return False
-        
-        # 3. Get tables to copy
-        tables = self.get_tables_to_copy()
+        # 2. Discovery
+        tables = self.prepare()
         if not tables:
             logger.error("No tables found to copy")
             return False
         
-        # 4. Copy and Redact each table
-        success_count = 0
+        # 3. Copy and Redact each table
+        transfer_start = time.monotonic()
+        success_count = sum(1 for table_name in tables if self.transfer_table(table_name))
+        
+        # 4. Verify the destination against the source
+        verified = self.verify_tables(tables) if VERIFY_TRANSFER else True
+        
+        self.report = self._build_report(tables, transfer_start)
+        logger.info(f"Transfer completed: {success_count}/{len(tables)} tables successful")
+        return success_count == len(tables) and verified
+
+    def _build_report(self, tables: List[str], transfer_start: float) -> Dict[str, Any]:
+        """Summarize per-table metrics, slowest tables first"""
+        table_reports = []
         for table_name in tables:
-            if self.copy_table(table_name):
-                # Only apply redaction if copy was successful
-                if self.apply_redaction(table_name):
-                    success_count += 1
+            entry = self.table_metrics.get(table_name, {})
+            copy_metrics = entry.get("copy", {})
+            redactions = entry.get("redactions", [])
+            table_reports.append({
+                "table": table_name,
+                "dataset": self.source_dataset,
+                "status": entry.get("status", "pending"),
+                "attempts": entry.get("attempts", 0),
+                "resumed": entry.get("resumed", False),
+                "wall_ms": entry.get("wall_ms", 0),
+                "copy": copy_metrics,
+                "delta": entry.get("delta"),
+                "redactions": redactions,
+                "verification": entry.get("verification"),
+                "slot_ms": copy_metrics.get("slot_ms", 0) + sum(r["slot_ms"] for r in redactions),
+                "dml_bytes_processed": sum(r["bytes_processed"] for r in redactions),
+                "error": entry.get("error"),
+            })
+        table_reports.sort(key=lambda t: t["wall_ms"], reverse=True)
+        
+        return {
+            "environment": self.environment,
+            "remediation_mode": self.remediation_mode,
+            "copy_mode": self.copy_mode,
+            "cross_region": self.cross_region,
+            "source_dataset": self.source_dataset,
+            "dest_dataset": self.dest_dataset,
+            "tables_total": len(tables),
+            "tables_succeeded": sum(1 for t in table_reports if t["status"] == "success"),
+            "wall_ms": int((time.monotonic() - transfer_start) * 1000),
+            "copy_bytes": sum(t["copy"].get("bytes", 0) for t in table_reports),
+            "slot_ms": sum(t["slot_ms"] for t in table_reports),
+            "dml_bytes_processed": sum(t["dml_bytes_processed"] for t in table_reports),
+            "verification": self.verification,
+            "tables": table_reports,
+        }
+
+class MultiDatasetTransfer:
+    """
+    Transfers every dataset mapping of an environment in one run.
+    Discovery runs concurrently per dataset, then all tables of all datasets share one pool of
+    max_inflight_jobs workers, so the run takes about as long as the largest dataset, not the sum.
+    """
+    def __init__(self, environment: str, remediation_mode: Optional[str] = None,
+                 max_inflight_jobs: Optional[int] = None, copy_mode: Optional[str] = None,
+                 resume: Optional[str] = None, verify: Optional[bool] = None, verify_scope: Optional[str] = None):
+        self.environment = environment
+        self.verify = VERIFY_TRANSFER if verify is None else verify
+        self.verify_scope = verify_scope or VERIFY_SCOPE
+        if self.verify_scope not in VERIFY_SCOPES:
+            raise ValueError(f"Unknown verify scope: {self.verify_scope}. Must be one of {VERIFY_SCOPES}")
+        if resume and not CHECKPOINT_BUCKET:
+            raise InvalidTransferRequest("resume requires CHECKPOINT_BUCKET to be set")
+        # resume=<run_id> continues an earlier run: tables it completed are skipped
+        self.resume = resume
+        self.run_id = resume or TransferCheckpoint.new_run_id()
+        primary = BigQueryTransferService(environment, remediation_mode, copy_mode=copy_mode)
+        self.checkpoint: Optional[TransferCheckpoint] = None
+        if CHECKPOINT_BUCKET:
+            storage_client = storage.Client(project=primary.dest_project)
+            self.checkpoint = TransferCheckpoint(storage_client.bucket(CHECKPOINT_BUCKET), self.run_id)
+        if resume:
+            # A resumed run finishes the way it started, whatever the current defaults are
+            manifest = self._load_manifest(primary, remediation_mode, copy_mode)
+            if (manifest["remediation_mode"], manifest["copy_mode"]) != (primary.remediation_mode, primary.copy_mode):
+                primary = BigQueryTransferService(environment, manifest["remediation_mode"], client=primary.client,
+                                                  copy_mode=manifest["copy_mode"])
+        self.remediation_mode = primary.remediation_mode
+        self.copy_mode = primary.copy_mode
+        # Every pair shares the primary's client (and its HTTP connection pool)
+        self.services = [primary] + [
+            BigQueryTransferService(environment, self.remediation_mode, mapping, client=primary.client,
+                                    copy_mode=self.copy_mode)
+            for mapping in primary.dataset_mappings[1:]
+        ]
+        self.max_inflight_jobs = max_inflight_jobs or MAX_INFLIGHT_JOBS
+        # One cap on jobs in flight across every dataset pair, partition copies included
+        job_slots = threading.BoundedSemaphore(self.max_inflight_jobs)
+        for service in self.services:
+            service.job_slots = job_slots
+            service.checkpoint = self.checkpoint
+        self.report: Dict[str, Any] = {}
+
+    def _load_manifest(self, primary: BigQueryTransferService, remediation_mode: Optional[str],
+                       copy_mode: Optional[str]) -> Dict[str, Any]:
+        """
+        The manifest of the run being resumed, checked against this request: same environment and dataset
+        pairs, and no explicitly requested mode that differs from the recorded one
+        """
+        manifest = self.checkpoint.load_run()
+        if manifest is None:
+            raise InvalidTransferRequest(f"No checkpoint found for run_id {self.run_id}")
+        if manifest.get("environment") != self.environment:
+            raise InvalidTransferRequest(
+                f"Run {self.run_id} was a {manifest.get('environment')} transfer, not {self.environment}")
+        datasets = [f"{source}:{dest}" for source, dest in primary.dataset_mappings]
+        if manifest.get("datasets") != datasets:
+            # Completed tables are keyed by source dataset; a remapped pair would skip tables never copied there
+            raise InvalidTransferRequest(f"Run {self.run_id} transferred {manifest.get('datasets')}, "
+                                         f"but the {self.environment} dataset mappings are now {datasets}")
+        for name, requested in (("remediation_mode", remediation_mode), ("copy_mode", copy_mode)):
+            if requested and requested != manifest.get(name):
+                raise InvalidTransferRequest(f"Run {self.run_id} used {name} {manifest.get(name)}; "
+                                             f"it cannot be resumed with {requested}")
+        return manifest
+
+    def _completed_tables(self) -> set:
+        """(source_dataset, table) pairs finished by the run being resumed; an empty set for a new run"""
+        if self.checkpoint is None:
+            return set()
+        if not self.resume:
+            self.checkpoint.start({
+                "environment": self.environment,
+                "remediation_mode": self.remediation_mode,
+                "copy_mode": self.copy_mode,
+                "datasets": [f"{s.source_dataset}:{s.dest_dataset}" for s in self.services],
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            })
+            return set()
+        
+        # The manifest was checked against this request in __init__
+        completed = {key for key, state in self.checkpoint.load().items() if state.get("status") == "success"}
+        logger.info(f"Resuming run {self.run_id}: {len(completed)} tables already completed")
+        return completed
+
+    def _transfer_all(self, executor: ThreadPoolExecutor,
+                      work: List[Tuple[BigQueryTransferService, str]]) -> List[bool]:
+        """
+        Transfers every (service, table) through the pool, with up to TRANSFER_MAX_ATTEMPTS attempts per table.
+        A failed table waits out its backoff here, not in a worker, so the other tables keep every worker busy;
+        it is resubmitted once its delay has passed. Returns each table's outcome in work order.
+        """
+        results: Dict[int, bool] = {}
+        running = {executor.submit(service.transfer_table, table_name, 1): (index, 1)
+                   for index, (service, table_name) in enumerate(work)}
+        # (ready_at, index, attempt) of the failed tables waiting for their next attempt
+        retries: List[Tuple[float, int, int]] = []
+        while running or retries:
+            while retries and retries[0][0] <= time.monotonic():
+                _, index, attempt = heapq.heappop(retries)
+                service, table_name = work[index]
+                running[executor.submit(service.transfer_table, table_name, attempt)] = (index, attempt)
+            if not running:
+                time.sleep(max(0.0, retries[0][0] - time.monotonic()))
+                continue
+            timeout = max(0.0, retries[0][0] - time.monotonic()) if retries else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, attempt = running.pop(future)
+                service, table_name = work[index]
+                if future.result():
+                    results[index] = True
+                elif attempt < TRANSFER_MAX_ATTEMPTS:
+                    delay = backoff_delay(attempt)
+                    logger.warning(f"{service.source_dataset}.{table_name} failed (attempt {attempt}/{TRANSFER_MAX_ATTEMPTS}); "
+                                   f"retrying in {delay:.0f}s")
+                    heapq.heappush(retries, (time.monotonic() + delay, index, attempt + 1))
                 else:
-                    logger.warning(f"Redaction failed for {table_name}. Counting as failure.")
-            else:
-                 logger.error(f"Copy failed for {table_name}. Skipping redaction.")
+                    results[index] = False
+        return [results[index] for index in range(len(work))]
+
+    def transfer(self) -> bool:
+        """Run discovery and transfers for all dataset pairs; True only if every table succeeded"""
+        mappings = ", ".join(f"{s.source_dataset} → {s.dest_dataset}" for s in self.services)
+        logger.info(f"Starting multi-dataset transfer {self.run_id}: {self.environment} [{mappings}] "
+                    f"(remediation: {self.remediation_mode}, copy: {self.copy_mode}, max in-flight jobs: {self.max_inflight_jobs})")
+        transfer_start = time.monotonic()
         
-        logger.info(f"Transfer completed: {success_count}/{len(tables)} tables successful")
-        return success_count == len(tables)
+        # 1. Validate authentication once for the shared projects
+        if not self.services[0].validate_authentication():
+            return False
+        completed = self._completed_tables()
+        
+        with ThreadPoolExecutor(max_workers=self.max_inflight_jobs) as executor:
+            # 2. Discovery for every dataset pair at once
+            discovered = list(executor.map(lambda service: service.prepare(), self.services))
+            for service, tables in zip(self.services, discovered):
+                if tables is None:
+                    logger.error(f"Discovery failed for {service.source_dataset}; none of its tables will be copied")
+                elif not tables:
+                    logger.warning(f"No native tables found in {service.source_dataset}")
+            
+            # 3. Every table of every dataset goes through the same pool: at most max_inflight_jobs jobs at once
+            work = []
+            for service, tables in zip(self.services, discovered):
+                for table_name in tables or []:
+                    if (service.source_dataset, table_name) in completed:
+                        service.table_metrics[table_name] = {"status": "success", "resumed": True}
+                    else:
+                        work.append((service, table_name))
+            results = self._transfer_all(executor, work)
+            
+            # 4. Verification: one aggregated query per dataset side, every dataset at once
+            verified = (list(executor.map(lambda pair: pair[0].verify_tables(pair[1] or [], self.verify_scope),
+                                          zip(self.services, discovered)))
+                        if self.verify else [])
+        
+        for service, tables in zip(self.services, discovered):
+            service.report = service._build_report(tables or [], transfer_start)
+        self.report = self._build_report(discovered, transfer_start)
+        
+        success = (all(tables is not None for tables in discovered) and bool(work or completed) and all(results)
+                   and all(verified))
+        logger.info(f"Transfer completed: {sum(results)}/{len(work)} tables successful across {len(self.services)} datasets"
+                    f"{f' ({len(completed)} completed before resume)' if completed else ''}")
+        return success
+
+    def _build_report(self, discovered: List[Optional[List[str]]], transfer_start: float) -> Dict[str, Any]:
+        """One consolidated report: totals, a per-dataset summary and all tables, slowest first"""
+        datasets = []
+        for service, tables in zip(self.services, discovered):
+            dataset_report = {key: value for key, value in service.report.items() if key != "tables"}
+            dataset_report["status"] = "discovery_failed" if tables is None else (
+                "success" if dataset_report["tables_succeeded"] == dataset_report["tables_total"] else "partial")
+            datasets.append(dataset_report)
+        table_reports = sorted((t for service in self.services for t in service.report["tables"]),
+                               key=lambda t: t["wall_ms"], reverse=True)
+        
+        return {
+            "run_id": self.run_id,
+            "resumed": bool(self.resume),
+            "checkpointed": self.checkpoint is not None,
+            "environment": self.environment,
+            "remediation_mode": self.remediation_mode,
+            "copy_mode": self.copy_mode,
+            "verify_scope": self.verify_scope if self.verify else None,
+            "max_inflight_jobs": self.max_inflight_jobs,
+            "tables_total": len(table_reports),
+            "tables_succeeded": sum(1 for t in table_reports if t["status"] == "success"),
+            "wall_ms": int((time.monotonic() - transfer_start) * 1000),
+            "copy_bytes": sum(d["copy_bytes"] for d in datasets),
+            "slot_ms": sum(d["slot_ms"] for d in datasets),
+            "dml_bytes_processed": sum(d["dml_bytes_processed"] for d in datasets),
+            "verification_slot_ms": sum(d["verification"].get("slot_ms", 0) for d in datasets),
+            "tables_mismatched": sum(d["verification"].get("tables_mismatched", 0) for d in datasets),
+            "datasets": datasets,
+            "tables": table_reports,
+        }
+
+def log_transfer_summary(report: Dict[str, Any]):
+    """Log the per-table timing report, slowest tables first"""
+    if not report:
+        return
+    logger.info("=" * 50)
+    logger.info(f"Transfer summary {report.get('run_id', '')} ({report['remediation_mode']}): {report['tables_succeeded']}/{report['tables_total']} tables, "
+                f"{report['wall_ms']} ms wall, {report['slot_ms']} slot-ms, "
+                f"{report['copy_bytes']} bytes copied, {report['dml_bytes_processed']} DML bytes processed")
+    for dataset in report.get("datasets", []):
+        mismatched = dataset.get("verification", {}).get("tables_mismatched")
+        logger.info(f"  [{dataset['source_dataset']} → {dataset['dest_dataset']}] {dataset['status']}: "
+                    f"{dataset['tables_succeeded']}/{dataset['tables_total']} tables, "
+                    f"verification {dataset.get('verification', {}).get('status')}"
+                    f"{f' ({mismatched} mismatched)' if mismatched else ''}")
+    for table in report["tables"]:
+        copy_metrics = table["copy"]
+        delta = table.get("delta")
+        delta_note = (f" delta={delta['action']}({delta['partitions_changed']}/{delta['partitions_total']} partitions)"
+                      if delta else "")
+        logger.info(f"  {table['dataset']}.{table['table']}: {table['status']}{delta_note} wall={table['wall_ms']}ms "
+                    f"copy={copy_metrics.get('duration_ms')}ms queue={copy_metrics.get('queue_wait_ms')}ms "
+                    f"bytes={copy_metrics.get('bytes', 0)} slot_ms={table['slot_ms']} "
+                    f"redactions={len(table['redactions'])} dml_bytes={table['dml_bytes_processed']}")
+        if table.get("verification") and table["verification"]["discrepancies"]:
+            logger.info(f"    verification: {'; '.join(table['verification']['discrepancies'])}")
+    logger.info("=" * 50)
 
 def main():
     parser = argparse.ArgumentParser(description="BigQuery Dataset Transfer Service")
     parser.add_argument("environment", choices=["dev", "uat"], 
                        help="Target environment (dev or uat)")
+    parser.add_argument("--remediation-mode", choices=REMEDIATION_MODES,
+                       help="dml rewrites sensitive columns; view publishes masked views (default: $REMEDIATION_MODE or dml)")
+    parser.add_argument("--copy-mode", choices=COPY_MODES,
+                       help="full copies every table; delta copies only changed partitions (default: $COPY_MODE or full)")
+    parser.add_argument("--resume", metavar="RUN_ID",
+                       help="Continue an earlier checkpointed run, skipping the tables it completed")
+    parser.add_argument("--skip-verification", action="store_true",
+                       help="Do not compare row counts and fingerprints after copying (default: $VERIFY_TRANSFER or true)")
+    parser.add_argument("--verify-scope", choices=VERIFY_SCOPES,
+                       help="changed verifies only the tables and partitions this run copied; full verifies every "
+                            "table whole (default: $VERIFY_SCOPE or changed)")
     
     args = parser.parse_args()
     
     try:
-        service = BigQueryTransferService(args.environment)
-        success = service.transfer_dataset()
+        service = MultiDatasetTransfer(args.environment, args.remediation_mode, copy_mode=args.copy_mode,
+                                       resume=args.resume, verify=False if args.skip_verification else None,
+                                       verify_scope=args.verify_scope)
+        success = service.transfer()
+        log_transfer_summary(service.report)
         
         if success:
             logger.info("Dataset transfer completed successfully!")
@@ -334,19 +1566,36 @@ def transfer_dataset_endpoint():
         
         if environment not in ['dev', 'uat']:
             return jsonify({"error": "Invalid environment. Must be 'dev' or 'uat'"}), 400
+        remediation_mode = (data or {}).get('remediation_mode')
+        if remediation_mode and remediation_mode not in REMEDIATION_MODES:
+            return jsonify({"error": f"Invalid remediation_mode. Must be one of {REMEDIATION_MODES}"}), 400
+        copy_mode = (data or {}).get('copy_mode')
+        if copy_mode and copy_mode not in COPY_MODES:
+            return jsonify({"error": f"Invalid copy_mode. Must be one of {COPY_MODES}"}), 400
+        # JSON booleans only: the string "false" would otherwise count as true
+        verify = (data or {}).get('verify')
+        if verify is not None and not isinstance(verify, bool):
+            return jsonify({"error": "Invalid verify. Must be true or false"}), 400
+        verify_scope = (data or {}).get('verify_scope')
+        if verify_scope and verify_scope not in VERIFY_SCOPES:
+            return jsonify({"error": f"Invalid verify_scope. Must be one of {VERIFY_SCOPES}"}), 400
         
         logger.info(f"Starting dataset transfer via web service: {environment}")
         
-        service = BigQueryTransferService(environment)
-        success = service.transfer_dataset()
+        service = MultiDatasetTransfer(environment, remediation_mode, copy_mode=copy_mode,
+                                       resume=(data or {}).get('resume'), verify=verify, verify_scope=verify_scope)
+        success = service.transfer()
         
         if success:
             logger.info("Dataset transfer completed successfully!")
-            return jsonify({"status": "success", "message": "Dataset transfer completed successfully!"}), 200
+            return jsonify({"status": "success", "message": "Dataset transfer completed successfully!", "report": service.report}), 200
         else:
             logger.error("Dataset transfer failed!")
-            return jsonify({"status": "error", "message": "Dataset transfer failed!"}), 500
+            return jsonify({"status": "error", "message": "Dataset transfer failed!", "report": service.report}), 500
             
+    except InvalidTransferRequest as e:
+        logger.error(f"Invalid transfer request: {e}")
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Service error: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -357,19 +1606,37 @@ def transfer_dataset_by_env(environment):
     try:
         if environment not in ['dev', 'uat']:
             return jsonify({"error": "Invalid environment. Must be 'dev' or 'uat'"}), 400
+        data = request.get_json(silent=True)
+        remediation_mode = (data or {}).get('remediation_mode')
+        if remediation_mode and remediation_mode not in REMEDIATION_MODES:
+            return jsonify({"error": f"Invalid remediation_mode. Must be one of {REMEDIATION_MODES}"}), 400
+        copy_mode = (data or {}).get('copy_mode')
+        if copy_mode and copy_mode not in COPY_MODES:
+            return jsonify({"error": f"Invalid copy_mode. Must be one of {COPY_MODES}"}), 400
+        # JSON booleans only: the string "false" would otherwise count as true
+        verify = (data or {}).get('verify')
+        if verify is not None and not isinstance(verify, bool):
+            return jsonify({"error": "Invalid verify. Must be true or false"}), 400
+        verify_scope = (data or {}).get('verify_scope')
+        if verify_scope and verify_scope not in VERIFY_SCOPES:
+            return jsonify({"error": f"Invalid verify_scope. Must be one of {VERIFY_SCOPES}"}), 400
         
         logger.info(f"Starting dataset transfer via web service: {environment}")
         
-        service = BigQueryTransferService(environment)
-        success = service.transfer_dataset()
+        service = MultiDatasetTransfer(environment, remediation_mode, copy_mode=copy_mode,
+                                       resume=(data or {}).get('resume'), verify=verify, verify_scope=verify_scope)
+        success = service.transfer()
         
         if success:
             logger.info("Dataset transfer completed successfully!")
-            return jsonify({"status": "success", "message": "Dataset transfer completed successfully!"}), 200
+            return jsonify({"status": "success", "message": "Dataset transfer completed successfully!", "report": service.report}), 200
         else:
             logger.error("Dataset transfer failed!")
-            return jsonify({"status": "error", "message": "Dataset transfer failed!"}), 500
+            return jsonify({"status": "error", "message": "Dataset transfer failed!", "report": service.report}), 500
             
+    except InvalidTransferRequest as e:
+        logger.error(f"Invalid transfer request: {e}")
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Service error: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
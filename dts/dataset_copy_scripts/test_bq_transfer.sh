@@ -67,32 +67,23 @@ TEST_TABLES=(
     "stg_crimes"
 )
 
-# Sensitive columns to test remediation (environment-specific)
-SENSITIVE_COLUMNS_DEV=(
-    "stg_business_licenses:account_number:redact"
-    "stg_business_licenses:business_address:redact"
-    "stg_business_licenses:community_area:redact"
-    "stg_business_licenses:payment_date:redact"
-    "stg_crimes:x_coordinate:redact"
-    "stg_crimes:y_coordinate:redact"
-    "stg_crimes:latitude:redact"
-    "stg_crimes:longitude:redact"
-    "stg_crimes:location_description:redact"
-)
-
-# Select appropriate configuration based on environment
-case "$TEST_ENVIRONMENT" in
-    "dev")
-        SENSITIVE_COLUMNS=("${SENSITIVE_COLUMNS_DEV[@]}")
-        ;;
-    "uat")
-        SENSITIVE_COLUMNS=()
-        ;;
-    *)
-        echo "WARNING: Unknown environment '$TEST_ENVIRONMENT'. Using DEV configuration."
-        SENSITIVE_COLUMNS=("${SENSITIVE_COLUMNS_DEV[@]}")
-        ;;
-esac
+# Sensitive columns to test remediation (environment-specific), read from the shared config
+# as TABLE:COLUMN:TACTIC for the source dataset
+SENSITIVE_COLUMNS_FILE="${SENSITIVE_COLUMNS_FILE:-$(dirname "$0")/sensitive_columns.json}"
+SENSITIVE_ENTRIES=$(python3 -c '
+import json, sys
+for entry in json.load(open(sys.argv[1])).get(sys.argv[2], []):
+    dataset, _, rest = entry.partition(":")
+    if dataset == sys.argv[3]:
+        print(":".join(rest.split(".")))
+' "$SENSITIVE_COLUMNS_FILE" "$TEST_ENVIRONMENT" "$TEST_DATASET_01") || {
+    echo "ERROR: Could not read sensitive columns from $SENSITIVE_COLUMNS_FILE"
+    exit 1
+}
+SENSITIVE_COLUMNS=()
+while IFS= read -r entry; do
+    [ -n "$entry" ] && SENSITIVE_COLUMNS+=("$entry")
+done <<< "$SENSITIVE_ENTRIES"
 
 # Colors for output
 RED='\033[0;31m'
@@ -16,6 +16,7 @@ from typing import Dict, List, Optional
 from google.cloud import bigquery
 from google.cloud.exceptions import NotFound, BadRequest
 import subprocess
+from main import load_sensitive_columns, compile_sensitive_columns, REDACTION_TACTICS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
@@ -34,17 +35,7 @@ class BigQueryTransferTester:
             self.dest_project = os.getenv("DEV_DEST_PROJECT", "sbox-rgodoy-002-20251008")
             self.source_dataset = "dts_01"
             self.dest_dataset = "dev_dts"
-            self.sensitive_columns = [
-                "dts_01:stg_business_licenses.account_number:redact",
-                "dts_01:stg_business_licenses.business_address:redact",
-                "dts_01:stg_business_licenses.community_area:redact",
-                "dts_01:stg_business_licenses.payment_date:redact",
-                "dts_01:stg_crimes.x_coordinate:redact",
-                "dts_01:stg_crimes.y_coordinate:redact",
-                "dts_01:stg_crimes.latitude:redact",
-                "dts_01:stg_crimes.longitude:redact",
-                "dts_01:stg_crimes.location_description:redact"
-            ]
+            self.sensitive_columns = load_sensitive_columns(self.environment)
             logger.info("Using DEV environment configuration (full redaction)")
             
         elif self.environment == "uat":
@@ -52,7 +43,7 @@ class BigQueryTransferTester:
             self.dest_project = os.getenv("UAT_DEST_PROJECT", "sbox-rgodoy-002-20251008")
             self.source_dataset = "dts_01"
             self.dest_dataset = "uat_dts"
-            self.sensitive_columns = []  # No redaction for UAT
+            self.sensitive_columns = load_sensitive_columns(self.environment)  # No redaction for UAT
             logger.info("Using UAT environment configuration (no redaction)")
             
         else:
@@ -103,13 +94,9 @@ class BigQueryTransferTester:
             logger.info(f"Sensitive columns configured: {len(self.sensitive_columns)}")
             
             logger.info("Step 3: Tactics being used...")
-            tactics = set()
-            for column_config in self.sensitive_columns:
-                if ":" in column_config:
-                    parts = column_config.split(":")
-                    if len(parts) >= 3:
-                        tactic = parts[-1]
-                        tactics.add(tactic)
+            # Raises ValueError for malformed entries and unknown tactics
+            redaction_index = compile_sensitive_columns(self.sensitive_columns, self.source_dataset)
+            tactics = {tactic for columns in redaction_index.values() for _, tactic in columns}
             
             if tactics:
                 logger.info(f"Unique tactics: {', '.join(tactics)}")
@@ -117,7 +104,7 @@ class BigQueryTransferTester:
                 logger.info("No tactics (no redaction)")
             
             logger.info("Step 4: Validating tactics...")
-            valid_tactics = {"redact", "FF", "mask", "hash"}
+            valid_tactics = set(REDACTION_TACTICS)
             for tactic in tactics:
                 if tactic not in valid_tactics:
                     logger.error(f"FAIL: Invalid tactic: {tactic}")
@@ -280,33 +267,24 @@ class BigQueryTransferTester:
             
             source_client = bigquery.Client(project=self.source_project)
             
-            for column_config in self.sensitive_columns:
-                parts = column_config.split(":")
-                if len(parts) >= 3:
-                    dataset_name = parts[0]
-                    table_col = parts[1]
-                    tactic = parts[2]
-                    table_name = table_col.split(".")[0]
-                    column_name = table_col.split(".")[1]
-                else:
-                    logger.warning(f"Skipping malformed column config: {column_config}")
-                    continue
-                
-                logger.info(f"Checking sensitive data in: {table_name}.{column_name} (tactic: {tactic})")
+            redaction_index = compile_sensitive_columns(self.sensitive_columns, self.source_dataset)
+            for table_name, columns in redaction_index.items():
+                for column_name, tactic in columns:
+                    logger.info(f"Checking sensitive data in: {table_name}.{column_name} (tactic: {tactic})")
                 
-                query = f"""
-                SELECT COUNT(*) as non_null_count
-                FROM `{self.source_project}.{self.source_dataset}.{table_name}`
-                WHERE {column_name} IS NOT NULL
-                """
+                    query = f"""
+                    SELECT COUNT(*) as non_null_count
+                    FROM `{self.source_project}.{self.source_dataset}.{table_name}`
+                    WHERE {column_name} IS NOT NULL
+                    """
                 
-                result = source_client.query(query).result()
-                non_null_count = list(result)[0].non_null_count
+                    result = source_client.query(query).result()
+                    non_null_count = list(result)[0].non_null_count
                 
-                if non_null_count > 0:
-                    logger.warning(f"WARN: Found {non_null_count} non-null values in sensitive column {table_name}.{column_name} (will apply {tactic})")
-                else:
-                    logger.info(f"No sensitive data found in {table_name}.{column_name} (already redacted)")
+                    if non_null_count > 0:
+                        logger.warning(f"WARN: Found {non_null_count} non-null values in sensitive column {table_name}.{column_name} (will apply {tactic})")
+                    else:
+                        logger.info(f"No sensitive data found in {table_name}.{column_name} (already redacted)")
             
             return True
             
@@ -0,0 +1,452 @@
+"""
+Unit tests for main.py with mocked BigQuery clients (test_main.py is the live integration CLI).
+
+Run with: python -m pytest -q test_transfer_service.py
+"""
+import threading
+from datetime import datetime
+from unittest import mock
+
+import pytest
+
+import main
+from main import BigQueryTransferService, redaction_rules_hash
+
+T0 = datetime(2026, 1, 1)
+T1 = datetime(2026, 1, 2)
+
+
+class FakeJob:
+    """Completed BigQuery job; result() also tracks how many jobs of its tracker are still running."""
+
+    def __init__(self, job_id, tracker=None, rows=()):
+        self.job_id = job_id
+        self.created = self.started = self.ended = None
+        self.total_bytes_processed = 0
+        self.num_dml_affected_rows = 0
+        self.output_bytes = self.output_rows = 0
+        self._tracker = tracker
+        self._rows = list(rows)
+        self._done = False
+        if tracker is not None:
+            tracker.submitted()
+
+    def result(self):
+        if self._tracker is not None and not self._done:
+            self._tracker.finished()
+        self._done = True
+        return self._rows
+
+    def to_api_repr(self):
+        return {"statistics": {"totalSlotMs": "10", "copy": {"copiedLogicalBytes": "100", "copiedRows": "5"}}}
+
+
+class InflightTracker:
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    def submitted(self):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+
+    def finished(self):
+        self.running -= 1
+
+
+def make_service(remediation_mode="dml", copy_mode="delta", **kwargs):
+    client = mock.Mock()
+    client.copy_table.side_effect = lambda source, dest, job_config=None: FakeJob(f"copy {dest}")
+    client.query.side_effect = lambda sql, **kw: FakeJob("query")
+    return BigQueryTransferService("dev", remediation_mode, client=client, copy_mode=copy_mode, **kwargs)
+
+
+def day_partitions(*days, modified=T0):
+    return {f"202601{day:02d}": modified for day in days}
+
+
+def test_partition_copies_stay_within_job_cap():
+    """Partition copies only run side by side on spare slots of the shared cap."""
+    service = make_service()
+    tracker = InflightTracker()
+    service.client.copy_table.side_effect = lambda source, dest, job_config=None: FakeJob(dest, tracker)
+    service.source_partitions = {"events": day_partitions(*range(1, 11), modified=T1)}
+    service.dest_partitions = {"events": day_partitions(*range(1, 11))}
+    service.job_slots = threading.BoundedSemaphore(3)
+
+    # Another table holds one slot; this table holds its own, leaving one spare
+    service.job_slots.acquire()
+    with service.job_slots:
+        assert service.copy_delta("events")
+    assert service.client.copy_table.call_count == 10
+    assert tracker.peak == 2
+    # Every spare slot is returned
+    for _ in range(2):
+        assert service.job_slots.acquire(blocking=False)
+
+
+def test_changed_redaction_rules_force_full_copy():
+    """An unchanged table is copied in full again when its rules no longer match its label."""
+    service = make_service()
+    table = "stg_crimes"
+    service.source_partitions = {table: day_partitions(1, 2)}
+    service.dest_partitions = {table: day_partitions(1, 2)}
+    current = redaction_rules_hash(service.sensitive_columns_for(table))
+
+    service.dest_rule_hashes = {table: current}
+    assert service.copy_delta(table)
+    assert service.table_metrics[table]["delta"]["action"] == "unchanged"
+    service.client.copy_table.assert_not_called()
+
+    service.dest_rule_hashes = {table: "0123456789abcdef"}
+    assert service.copy_delta(table)
+    assert service.table_metrics[table]["delta"] == {
+        "action": "full", "partitions_total": 2, "partitions_changed": 0, "partitions_removed": 0,
+        "rules_changed": True}
+    assert service.client.copy_table.call_args[0][1] == f"{service.dest_project}.{service.copy_dataset}.{table}"
+
+    # The redaction relabels the table with the current rules
+    labeled = mock.Mock(labels={main.REDACTION_RULES_LABEL: "0123456789abcdef"})
+    service.client.get_table.return_value = labeled
+    assert service.apply_redaction(table)
+    assert labeled.labels == {main.REDACTION_RULES_LABEL: current}
+    service.client.update_table.assert_called_once_with(labeled, ["labels"])
+    assert service.dest_rule_hashes[table] == current
+
+
+def test_retry_rereads_destination_partitions():
+    """A retried delta attempt plans against the destination as it is now, not as prepare() saw it."""
+    service = make_service(remediation_mode="view")
+    table = "events"
+    service.source_partitions = {table: day_partitions(1, 2)}
+    service.dest_partitions = {table: day_partitions(1, 2)}
+    # The failed attempt discarded the table, so it has no partitions left
+    with mock.patch.object(service, "list_partitions", return_value={}) as list_partitions, \
+            mock.patch.object(service, "publish_masked_view", return_value=True):
+        assert service.transfer_table(table, attempt=2)
+    list_partitions.assert_called_once_with(service.dest_project, service.copy_dataset, table)
+    assert service.table_metrics[table]["delta"]["action"] == "full"
+
+
+def verification_rows(sql, counts):
+    """Verification rows answering a verification query, for the tables it selects"""
+    return [{"table_name": name, "row_count": rows, "fingerprint": 7, "non_null_counts": []}
+            for name, rows in counts.items() if f"SELECT '{name}' AS table_name" in sql]
+
+
+def test_verification_covers_only_what_the_run_changed():
+    """Unchanged delta tables are not scanned; partition copies are compared on their partitions only."""
+    service = make_service(remediation_mode="view")
+    queries = []
+
+    def query(sql, **kwargs):
+        queries.append(sql)
+        return FakeJob("verify", rows=verification_rows(sql, {"kept": 3, "daily": 2, "rebuilt": 5}))
+
+    service.client.query.side_effect = query
+    service.table_metrics = {
+        "kept": {"status": "success", "delta": {"action": "unchanged"}},
+        "daily": {"status": "success", "delta": {"action": "partitions"}},
+        "rebuilt": {"status": "success", "delta": {"action": "full"}},
+        "failed": {"status": "copy_failed"},
+    }
+    service.partition_filters = {"daily": "(day >= DATE '2026-01-02' AND day < DATE '2026-01-03')"}
+    tables = list(service.table_metrics)
+
+    assert service.verify_tables(tables)
+    assert len(queries) == 2
+    for sql in queries:
+        assert "'kept'" not in sql
+        assert "AS verified_row WHERE (day >= DATE '2026-01-02' AND day < DATE '2026-01-03')" in sql
+        assert sql.count("WHERE") == 1
+    assert service.verification["tables_verified"] == 2
+    assert service.verification["tables_skipped"] == 1
+    assert service.table_metrics["daily"]["verification"]["scope"] == "partitions"
+    assert service.table_metrics["rebuilt"]["verification"]["scope"] == "table"
+
+    queries.clear()
+    assert service.verify_tables(tables, scope="full")
+    assert all("'kept'" in sql and "WHERE" not in sql for sql in queries)
+
+
+def test_retried_full_copy_drops_partition_filter():
+    """A filter left by an earlier partition copy never narrows the redaction of a later full copy."""
+    service = make_service()
+    service.partition_filters = {"events": "(day >= DATE '2026-01-01' AND day < DATE '2026-01-02')"}
+    assert service.copy_delta("events")
+    assert service.table_metrics["events"]["delta"]["action"] == "full"
+    assert "events" not in service.partition_filters
+
+
+@pytest.mark.parametrize("path", ["/transfer", "/transfer/dev"])
+@pytest.mark.parametrize("verify", ["false", 0, "yes"])
+def test_endpoints_reject_non_boolean_verify(path, verify):
+    with mock.patch.object(main, "MultiDatasetTransfer") as transfer:
+        response = main.app.test_client().post(path, json={"environment": "dev", "verify": verify})
+    assert response.status_code == 400
+    assert "verify" in response.get_json()["error"]
+    transfer.assert_not_called()
+
+
+@pytest.mark.parametrize("path", ["/transfer", "/transfer/dev"])
+def test_endpoints_pass_boolean_verify(path):
+    with mock.patch.object(main, "MultiDatasetTransfer") as transfer:
+        transfer.return_value.transfer.return_value = True
+        transfer.return_value.report = {}
+        response = main.app.test_client().post(path, json={"verify": False, "verify_scope": "full"})
+    assert response.status_code == 200
+    assert transfer.call_args.kwargs["verify"] is False
+    assert transfer.call_args.kwargs["verify_scope"] == "full"
+
+
+DEV_DATASETS = ["dts_01:dev_dts", "dts_02:dev_dts_02"]
+
+
+@pytest.fixture
+def checkpointed(monkeypatch):
+    """Checkpointing on, with mocked clients; yields a setter for the manifest of the run being resumed"""
+    monkeypatch.setattr(main, "CHECKPOINT_BUCKET", "checkpoints")
+    monkeypatch.setenv("DEV_DATASET_MAPPINGS", ",".join(DEV_DATASETS))
+    manifest = {}
+    with mock.patch.object(main.bigquery, "Client"), mock.patch.object(main.storage, "Client"), \
+            mock.patch.object(main.TransferCheckpoint, "load_run", side_effect=lambda: manifest or None):
+        yield manifest.update
+
+
+def test_resume_without_checkpoint_bucket_is_a_bad_request(monkeypatch):
+    monkeypatch.setattr(main, "CHECKPOINT_BUCKET", None)
+    with pytest.raises(main.InvalidTransferRequest):
+        main.MultiDatasetTransfer("dev", resume="20260105_020000_a1b2c3")
+    for path in ("/transfer", "/transfer/dev"):
+        response = main.app.test_client().post(path, json={"environment": "dev", "resume": "20260105_020000_a1b2c3"})
+        assert response.status_code == 400
+        assert "CHECKPOINT_BUCKET" in response.get_json()["error"]
+
+
+def test_resume_uses_recorded_modes(checkpointed, monkeypatch):
+    """A resumed run keeps the modes it started with, even when the defaults have changed since."""
+    monkeypatch.setenv("REMEDIATION_MODE", "dml")
+    monkeypatch.setenv("COPY_MODE", "full")
+    checkpointed({"environment": "dev", "remediation_mode": "view", "copy_mode": "delta", "datasets": DEV_DATASETS})
+
+    transfer = main.MultiDatasetTransfer("dev", resume="run1")
+    assert (transfer.remediation_mode, transfer.copy_mode) == ("view", "delta")
+    assert [(s.remediation_mode, s.copy_mode, s.copy_dataset) for s in transfer.services] == [
+        ("view", "delta", "dev_dts_raw"), ("view", "delta", "dev_dts_02_raw")]
+    # The same modes, given explicitly, are fine
+    assert main.MultiDatasetTransfer("dev", "view", copy_mode="delta", resume="run1").copy_mode == "delta"
+
+    with pytest.raises(main.InvalidTransferRequest, match="copy_mode delta"):
+        main.MultiDatasetTransfer("dev", copy_mode="full", resume="run1")
+
+
+def test_resume_checks_dataset_pairs(checkpointed, monkeypatch):
+    """Completed tables are only skipped for the same source:dest pairs the run was transferring."""
+    checkpointed({"environment": "dev", "remediation_mode": "dml", "copy_mode": "full", "datasets": DEV_DATASETS})
+    monkeypatch.setenv("DEV_DATASET_MAPPINGS", "dts_01:dev_dts_v2,dts_02:dev_dts_02")
+    with pytest.raises(main.InvalidTransferRequest, match="dataset mappings"):
+        main.MultiDatasetTransfer("dev", resume="run1")
+
+    with pytest.raises(main.InvalidTransferRequest, match="not uat"):
+        main.MultiDatasetTransfer("uat", resume="run1")
+
+
+def test_retry_backoff_does_not_hold_a_worker(monkeypatch):
+    """While a failed table waits to be retried, the other tables use the pool."""
+    monkeypatch.setattr(main, "backoff_delay", lambda attempt: 0.05)
+    calls = []
+
+    def transfer_table(table_name, attempt=1):
+        calls.append((table_name, attempt))
+        return table_name != "flaky" or attempt == 3
+
+    service = mock.Mock(source_dataset="dts_01", transfer_table=transfer_table)
+    transfer = main.MultiDatasetTransfer.__new__(main.MultiDatasetTransfer)
+    with main.ThreadPoolExecutor(max_workers=1) as executor:
+        results = transfer._transfer_all(executor, [(service, "flaky"), (service, "steady"), (service, "other")])
+    assert results == [True, True, True]
+    assert calls[:3] == [("flaky", 1), ("steady", 1), ("other", 1)]
+    assert calls[3:] == [("flaky", 2), ("flaky", 3)]
+
+    monkeypatch.setattr(main, "TRANSFER_MAX_ATTEMPTS", 2)
+    calls.clear()
+    with main.ThreadPoolExecutor(max_workers=1) as executor:
+        assert transfer._transfer_all(executor, [(service, "flaky"), (service, "steady")]) == [False, True]
+    assert calls == [("flaky", 1), ("steady", 1), ("flaky", 2)]
+
+
+def test_masked_view_matches_columns_case_insensitively():
+    """A rule spelled Latitude masks the latitude column, as validation already accepted it."""
+    service = make_service(remediation_mode="view")
+    service.redaction_index = {"stg_crimes": [("Latitude", "redact")]}
+    raw = mock.Mock(schema=[main.bigquery.SchemaField("id", "INTEGER"),
+                            main.bigquery.SchemaField("latitude", "FLOAT")])
+
+    def get_table(table_id):
+        if "_raw." not in table_id:
+            raise main.NotFound("no view yet")
+        return raw
+
+    service.client.get_table.side_effect = get_table
+
+    assert service.publish_masked_view("stg_crimes")
+    view = service.client.create_table.call_args[0][0]
+    assert view.view_query == (f"SELECT * REPLACE (CAST(NULL AS FLOAT64) AS Latitude) "
+                               f"FROM `{service.dest_project}.dev_dts_raw.stg_crimes`")
+
+
+def test_delta_copies_changed_partitions_and_drops_removed():
+    """Only modified partitions are copied; partitions deleted at the source are deleted from the copy."""
+    service = make_service(remediation_mode="view")
+    table = "events"
+    service.source_partitions = {table: {**day_partitions(1, 2), **day_partitions(3, modified=T1)}}
+    service.dest_partitions = {table: day_partitions(1, 2, 3, 4)}
+
+    assert service.copy_delta(table)
+    dest_table_id = f"{service.dest_project}.{service.copy_dataset}.{table}"
+    assert [c[0] for c in service.client.copy_table.call_args_list] == [
+        (f"{service.source_project}.{service.source_dataset}.{table}$20260103", f"{dest_table_id}$20260103")]
+    service.client.delete_table.assert_called_once_with(f"{dest_table_id}$20260104", not_found_ok=True)
+    assert service.table_metrics[table]["delta"] == {
+        "action": "partitions", "partitions_total": 3, "partitions_changed": 1, "partitions_removed": 1}
+    assert service.table_metrics[table]["copy"]["rows"] == 5
+
+
+def test_failed_partition_copy_falls_back_to_full_copy():
+    service = make_service(remediation_mode="view")
+    table = "events"
+    service.source_partitions = {table: day_partitions(1, 2, modified=T1)}
+    service.dest_partitions = {table: day_partitions(1, 2)}
+
+    def copy_table(source, dest, job_config=None):
+        if "$" in dest:
+            raise main.BadRequest("partitioning changed")
+        return FakeJob(f"copy {dest}")
+
+    service.client.copy_table.side_effect = copy_table
+    assert service.copy_delta(table)
+    assert service.table_metrics[table]["delta"]["action"] == "full"
+    assert service.client.copy_table.call_args[0][1] == f"{service.dest_project}.{service.copy_dataset}.{table}"
+
+
+@pytest.mark.parametrize("source, dest, expected", [
+    (day_partitions(1, 2), day_partitions(1, 2), ("unchanged", [], [])),
+    (day_partitions(1, 2, modified=T1), {}, ("full", [], [])),
+    ({None: T0}, {None: T0}, ("unchanged", [], [])),
+    ({None: T1}, {None: T0}, ("full", [], [])),
+    ({"__NULL__": T1, **day_partitions(1)}, day_partitions(1), ("full", [], [])),
+    (day_partitions(*range(1, 6), modified=T1), day_partitions(*range(1, 6)), ("full", [], [])),
+])
+def test_plan_delta_copy(source, dest, expected):
+    assert main.plan_delta_copy(source, dest, max_partitions=4) == expected
+
+
+def test_location_mismatch_needs_staging_bucket(monkeypatch):
+    service = make_service()
+    service.client.get_dataset.side_effect = lambda ref: mock.Mock(
+        location="US" if ref.dataset_id == service.source_dataset else "europe-west2")
+    monkeypatch.setattr(main, "STAGING_BUCKET", None)
+    assert not service.detect_locations()
+    assert service.cross_region
+
+    monkeypatch.setattr(main, "STAGING_BUCKET", "staging-us")
+    service.storage_client = mock.Mock()
+    assert service.detect_locations()
+    # Delta planning compares partitions across the copy, so a cross-region table is copied in full
+    with mock.patch.object(service, "export_load_table", return_value=True) as export_load, \
+            mock.patch.object(service, "remediate", return_value=True):
+        assert service.transfer_table("events")
+    export_load.assert_called_once_with("events")
+
+
+def make_cross_region_service(monkeypatch, load_bucket="staging-eu"):
+    """A dml service transferring US → europe-west2 through mocked staging buckets"""
+    monkeypatch.setattr(main, "STAGING_BUCKET", "staging-us")
+    monkeypatch.setattr(main, "LOAD_BUCKET", load_bucket)
+    service = make_service(copy_mode="full")
+    service.source_location, service.dest_location, service.cross_region = "US", "europe-west2", True
+    service.redaction_index = {"stg_crimes": [("latitude", "redact")]}
+    service.client.get_table.return_value = mock.Mock(
+        schema=[main.bigquery.SchemaField("id", "INTEGER"), main.bigquery.SchemaField("latitude", "FLOAT")],
+        time_partitioning=None, range_partitioning=None, clustering_fields=None)
+    buckets = {}
+
+    def bucket(name):
+        if name not in buckets:
+            staged = [mock.Mock()] if name == "staging-us" else []
+            buckets[name] = mock.Mock(list_blobs=mock.Mock(return_value=staged))
+            buckets[name].name = name
+        return buckets[name]
+
+    service.storage_client = mock.Mock(bucket=mock.Mock(side_effect=bucket))
+    load_job = FakeJob("load")
+    load_job.output_rows = 42
+    service.client.load_table_from_uri.return_value = load_job
+    return service, buckets
+
+
+def test_export_load_redacts_in_export_and_cleans_up(monkeypatch):
+    """Cross-region copies export redacted Avro, load it in the destination location and delete the shards."""
+    service, buckets = make_cross_region_service(monkeypatch)
+
+    assert service.export_load_table("stg_crimes")
+    export_sql, = service.client.query.call_args[0]
+    assert "SELECT * REPLACE (CAST(NULL AS FLOAT64) AS latitude)" in export_sql
+    assert "uri = 'gs://staging-us/transfer_staging/" in export_sql
+    assert service.client.query.call_args.kwargs["location"] == "US"
+
+    uri, dest_table_id = service.client.load_table_from_uri.call_args[0]
+    assert uri.startswith("gs://staging-eu/transfer_staging/") and uri.endswith("part-*.avro")
+    assert dest_table_id == f"{service.dest_project}.{service.copy_dataset}.stg_crimes"
+    assert service.client.load_table_from_uri.call_args.kwargs["location"] == "europe-west2"
+    # The shards are copied next to the destination, then removed from both buckets
+    assert buckets["staging-us"].copy_blob.call_count == 1
+    assert buckets["staging-us"].delete_blobs.called and buckets["staging-eu"].delete_blobs.called
+
+    copy = service.table_metrics["stg_crimes"]["copy"]
+    assert (copy["strategy"], copy["rows"], copy["staged_files"]) == ("export_load", 42, 1)
+    assert "stg_crimes" in service.redacted_in_export
+
+
+def test_failed_load_still_removes_staged_files(monkeypatch):
+    service, buckets = make_cross_region_service(monkeypatch, load_bucket="staging-us")
+    service.client.load_table_from_uri.side_effect = main.BadRequest("schema mismatch")
+
+    assert not service.export_load_table("stg_crimes")
+    assert len(buckets) == 1
+    buckets["staging-us"].copy_blob.assert_not_called()
+    buckets["staging-us"].delete_blobs.assert_called_once()
+    assert "BadRequest" in service.table_metrics["stg_crimes"]["error"]
+    assert "stg_crimes" not in service.redacted_in_export
+
+
+def test_verification_mismatch_fails_table_and_discards_copy():
+    """A table whose copy differs from its source fails, and is dropped so the next delta run copies it again."""
+    service = make_service()
+    service.redaction_index = {"stg_crimes": [("latitude", "redact")]}
+    service.source_schemas = {"stg_crimes": [main.bigquery.SchemaField("id", "INTEGER"),
+                                             main.bigquery.SchemaField("latitude", "FLOAT")]}
+    source_rows = [{"table_name": "stg_crimes", "row_count": 5, "fingerprint": 7,
+                    "non_null_counts": [{"column_name": "latitude", "non_null": 5}]},
+                   {"table_name": "events", "row_count": 3, "fingerprint": 1, "non_null_counts": []},
+                   {"table_name": "intact", "row_count": 1, "fingerprint": 9, "non_null_counts": []}]
+    dest_rows = [{"table_name": "stg_crimes", "row_count": 5, "fingerprint": 7,
+                  "non_null_counts": [{"column_name": "latitude", "non_null": 2}]},
+                 {"table_name": "events", "row_count": 2, "fingerprint": 1, "non_null_counts": []},
+                 {"table_name": "intact", "row_count": 1, "fingerprint": 9, "non_null_counts": []}]
+    service.client.query.side_effect = lambda sql, location=None: FakeJob(
+        "verify", rows=source_rows if f"{service.source_project}.{service.source_dataset}." in sql else dest_rows)
+    service.table_metrics = {"stg_crimes": {"status": "success"}, "events": {"status": "success"},
+                             "intact": {"status": "success"}}
+
+    assert not service.verify_tables(list(service.table_metrics))
+    assert service.verification["status"] == "failed"
+    assert service.verification["tables_mismatched"] == 2
+    assert service.table_metrics["stg_crimes"]["verification"]["discrepancies"] == [
+        "latitude (redact) has 2 non-null values"]
+    assert service.table_metrics["events"]["verification"]["discrepancies"] == ["row count 2 != source 3"]
+    assert service.table_metrics["intact"]["verification"]["status"] == "match"
+    assert [service.table_metrics[t]["status"] for t in ("stg_crimes", "events", "intact")] == [
+        "verification_failed", "verification_failed", "success"]
+    assert sorted(c[0][0] for c in service.client.delete_table.call_args_list) == [
+        f"{service.dest_project}.{service.copy_dataset}.{t}" for t in ("events", "stg_crimes")]
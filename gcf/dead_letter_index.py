@@ -0,0 +1,132 @@
+"""
+Structured index of dead-lettered files.
+
+process_dead_letter() builds one compact record per failure (dataset stem, reason code, expected and
+actual columns, object size and generation, where the file was copied). Records are buffered per
+instance and written as ONE newline-delimited JSON object per batch under
+gs://$DEAD_LETTER_BUCKET/error/_index/dt=YYYY-MM-DD/, so a burst of failures costs one extra write per
+batch rather than per file. xref_tables exposes the objects as the external table ext_dead_letter_errors.
+
+A batch is written once it holds DEAD_LETTER_INDEX_BATCH_SIZE records, once its oldest record has
+waited DEAD_LETTER_INDEX_FLUSH_SECONDS (checked after every request), and when the instance shuts down.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from google.cloud import storage
+
+from gcs_io import GcsIO
+
+logger = logging.getLogger(__name__)
+
+INDEX_PREFIX = 'error/_index/'
+
+# Records per index object, and the longest a record may wait in the buffer
+DEAD_LETTER_INDEX_BATCH_SIZE = int(os.environ.get('DEAD_LETTER_INDEX_BATCH_SIZE', '25'))
+DEAD_LETTER_INDEX_FLUSH_SECONDS = int(os.environ.get('DEAD_LETTER_INDEX_FLUSH_SECONDS', '30'))
+
+# Buffered records kept while the index bucket is unwritable; the oldest are dropped beyond this
+MAX_BUFFERED_RECORDS = 1000
+
+# Reason codes (the 'reason' field keeps the human-readable message)
+CONFIG_NOT_FOUND = 'config_not_found'
+FILENAME_PATTERN_MISMATCH = 'filename_pattern_mismatch'
+PARTITION_MISMATCH = 'partition_mismatch'
+COLUMN_COUNT_MISMATCH = 'column_count_mismatch'
+HEADER_MISMATCH = 'header_mismatch'
+DUPLICATE_KEYS = 'duplicate_keys'
+STAGING_LIMIT_EXCEEDED = 'staging_limit_exceeded'
+SCRATCH_LIMIT_EXCEEDED = 'scratch_limit_exceeded'
+INVALID_ZIP = 'invalid_zip'
+UNEXPECTED_ERROR = 'unexpected_error'
+
+
+def _optional_int(value: Any) -> Optional[int]:
+    return None if value in (None, '') else int(value)
+
+
+def error_record(stem: str, source_blob: str, dead_letter_blob: str, reason_code: str, reason: str,
+                 expected_columns: Optional[int] = None, actual_columns: Optional[int] = None,
+                 size: Any = None, generation: Any = None, copied: bool = True,
+                 now: Optional[float] = None) -> Dict[str, Any]:
+    """One index record. size and generation come from the event (strings) and are stored as integers."""
+    return {
+        'dead_lettered_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() if now is None else now)),
+        'stem': stem,
+        'source_object': source_blob,
+        'dead_letter_object': dead_letter_blob,
+        'reason_code': reason_code,
+        'reason': reason,
+        'expected_columns': expected_columns,
+        'actual_columns': actual_columns,
+        'size': _optional_int(size),
+        'generation': _optional_int(generation),
+        'copied': copied,
+    }
+
+
+class DeadLetterIndex:
+    """Thread-safe buffer of error records, flushed as batched NDJSON objects."""
+
+    def __init__(self, batch_size: int = DEAD_LETTER_INDEX_BATCH_SIZE,
+                 flush_seconds: float = DEAD_LETTER_INDEX_FLUSH_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.clock = clock
+        self._records: List[Dict[str, Any]] = []
+        self._first_added: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, record: Dict[str, Any]) -> bool:
+        """Buffers a record. Returns True when the buffer is due to be flushed."""
+        with self._lock:
+            if not self._records:
+                self._first_added = self.clock()
+            self._records.append(record)
+        return self.due()
+
+    def due(self) -> bool:
+        """True when the buffer is full or its oldest record has waited flush_seconds."""
+        with self._lock:
+            if not self._records:
+                return False
+            return (len(self._records) >= self.batch_size
+                    or self.clock() - self._first_added >= self.flush_seconds)
+
+    def flush(self, client: storage.Client, bucket_name: str, gcs_io: Optional[GcsIO] = None) -> Optional[str]:
+        """
+        Writes every buffered record as one NDJSON object and returns its name (None if empty).
+
+        The write goes through gcs_io (xref_processor passes its shared one) and is retried like any other
+        GCS call; the object name is unique, so a retry cannot duplicate the batch. Once the retries run
+        out, the records go back to the buffer for the next flush.
+        """
+        with self._lock:
+            records, first_added = self._records, self._first_added
+            self._records, self._first_added = [], None
+        if not records:
+            return None
+
+        day = records[0]['dead_lettered_at'][:10]
+        stamp = records[0]['dead_lettered_at'].replace('-', '').replace(':', '')[:15]
+        object_name = f"{INDEX_PREFIX}dt={day}/{stamp}_{uuid.uuid4().hex[:8]}.ndjson"
+        body = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+        blob = client.bucket(bucket_name).blob(object_name)
+        try:
+            (gcs_io or GcsIO()).call('dead-letter index write', lambda timeout: blob.upload_from_string(
+                body, content_type='application/x-ndjson', timeout=timeout, retry=None))
+        except Exception:
+            with self._lock:
+                self._records = (records + self._records)[-MAX_BUFFERED_RECORDS:]
+                self._first_added = first_added if first_added is not None else self.clock()
+            raise
+        return object_name
@@ -0,0 +1,183 @@
+"""
+Keyed row-level deltas between successive ingestions of a dataset.
+
+Configs with "delta": true (and "key_columns") get <stem>.delta.ndjson written next to each landed
+file, listing the rows inserted, updated and deleted since the previous ingestion_timestamp= partition
+of the same file. Both files are read as streams and sorted by key with an external merge sort
+(sorted runs of up to DELTA_MEMORY_MB are spilled to the request's scratch directory), then walked
+together in one sorted merge, so the buffered rows never outgrow DELTA_MEMORY_MB per file.
+
+The runs of both files share one MAX_SPILL_MB cap, like the spill of the key check: the default
+scratch directory is in-memory on Gen2. A delta that would spill more raises SpillLimitExceeded.
+
+Each line of the delta is one change:
+    {"op": "insert" | "update" | "delete", "key": {<key column>: value}, "row": {<column>: value}}
+"row" is the new row for inserts and updates and the removed row for deletes; updates also carry
+"previous", the row they replace.
+"""
+import heapq
+import json
+import operator
+import os
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from key_check import KEY_SEPARATOR, SpillBudget
+
+DELTA_MEMORY_MB = int(os.environ.get('DELTA_MEMORY_MB', '64'))
+
+# Sidecar written next to each landed file (see main.sidecar_blob_name)
+DELTA_SUFFIX = '.delta.ndjson'
+
+# Approximate cost of one buffered row in a sort run, on top of its field lengths
+BYTES_PER_ROW = 200
+BYTES_PER_FIELD = 60
+
+INSERT, UPDATE, DELETE = 'insert', 'update', 'delete'
+
+_sort_key = operator.itemgetter(0)
+
+
+class HeaderChanged(Exception):
+    """The two ingestions have different header rows, so their rows cannot be compared."""
+
+
+def _row_key(row: List[str], key_indexes: List[int]) -> str:
+    # Keys are compared like the key uniqueness check compares them
+    return KEY_SEPARATOR.join(row[i].strip() if i < len(row) else '' for i in key_indexes)
+
+
+def _write_run(records: List[Tuple[str, List[str]]], spill_dir: Optional[str], spill_budget: SpillBudget) -> str:
+    records.sort(key=_sort_key)
+    fd, path = tempfile.mkstemp(prefix='delta_', suffix='.run', dir=spill_dir)
+    try:
+        with os.fdopen(fd, 'wb') as run:
+            for record in records:
+                line = json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+                spill_budget.add(len(line))
+                run.write(line)
+    except BaseException:
+        spill_budget.remove(path)
+        raise
+    return path
+
+
+def _read_run(path: str, spill_budget: SpillBudget) -> Iterator[Tuple[str, List[str]]]:
+    try:
+        with open(path, encoding='utf-8') as run:
+            for line in run:
+                key, row = json.loads(line)
+                yield key, row
+    finally:
+        spill_budget.remove(path)
+
+
+def sorted_by_key(rows: Iterable[List[str]], key_indexes: List[int], width: int,
+                  spill_dir: Optional[str] = None, memory_mb: Optional[float] = None,
+                  spill_budget: Optional[SpillBudget] = None) -> Iterator[Tuple[str, List[str]]]:
+    """
+    (key, row) pairs of the data rows in key order; blank rows are skipped and rows padded to width.
+
+    Rows are buffered up to the memory budget; beyond it each buffer is sorted and spilled as a run
+    (counted against spill_budget), and the runs are merged lazily.
+    """
+    spill_budget = spill_budget or SpillBudget()
+    budget = (DELTA_MEMORY_MB if memory_mb is None else memory_mb) * 1024 * 1024
+    buffer: List[Tuple[str, List[str]]] = []
+    buffered_bytes = 0
+    runs: List[str] = []
+    try:
+        for row in rows:
+            if not any(field.strip() for field in row):
+                continue
+            if len(row) < width:
+                row = row + [''] * (width - len(row))
+            buffer.append((_row_key(row, key_indexes), row))
+            buffered_bytes += BYTES_PER_ROW + sum(len(field) + BYTES_PER_FIELD for field in row)
+            if buffered_bytes > budget:
+                runs.append(_write_run(buffer, spill_dir, spill_budget))
+                buffer, buffered_bytes = [], 0
+        if not runs:
+            buffer.sort(key=_sort_key)
+            yield from buffer
+            return
+        if buffer:
+            runs.append(_write_run(buffer, spill_dir, spill_budget))
+            buffer = []
+        readers = [_read_run(path, spill_budget) for path in runs]
+        runs = []
+        try:
+            yield from heapq.merge(*readers, key=_sort_key)
+        finally:
+            for reader in readers:
+                reader.close()
+    finally:
+        # Runs not handed to a reader yet (the generator was abandoned while buffering)
+        for path in runs:
+            spill_budget.remove(path)
+
+
+def diff_sorted(previous: Iterator[Tuple[str, List[str]]],
+                current: Iterator[Tuple[str, List[str]]]) -> Iterator[Tuple[str, List[str], Optional[List[str]]]]:
+    """
+    Sorted merge of two key-ordered streams: yields (op, row, previous row) for every changed key.
+
+    Rows whose key appears on both sides with identical fields are unchanged and skipped.
+    """
+    old = next(previous, None)
+    new = next(current, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield DELETE, old[1], None
+            old = next(previous, None)
+        elif old is None or new[0] < old[0]:
+            yield INSERT, new[1], None
+            new = next(current, None)
+        else:
+            if new[1] != old[1]:
+                yield UPDATE, new[1], old[1]
+            old = next(previous, None)
+            new = next(current, None)
+
+
+def _header(rows: Iterator[List[str]]) -> List[str]:
+    header = next(rows, [])
+    if header:
+        header[0] = header[0].lstrip('\ufeff')
+    return header
+
+
+def write_delta(previous_rows: Iterable[List[str]], current_rows: Iterable[List[str]], key_indexes: List[int],
+                target: TextIO, spill_dir: Optional[str] = None, memory_mb: Optional[float] = None,
+                max_spill_mb: Optional[float] = None) -> Dict[str, int]:
+    """
+    Writes the NDJSON delta between two files (each an iterable of rows starting with its header row)
+    to target, and returns the number of changes per op.
+
+    Raises HeaderChanged if the header rows differ, and SpillLimitExceeded if the sorted runs of both
+    files together would pass max_spill_mb (default MAX_SPILL_MB).
+    """
+    previous_rows, current_rows = iter(previous_rows), iter(current_rows)
+    previous_header = _header(previous_rows)
+    header = _header(current_rows)
+    if [name.strip().lower() for name in previous_header] != [name.strip().lower() for name in header]:
+        raise HeaderChanged(f"Header changed from {previous_header} to {header}")
+
+    width = len(header)
+    key_names = [header[i] for i in key_indexes]
+    counts = {INSERT: 0, UPDATE: 0, DELETE: 0}
+    spill_budget = SpillBudget(max_spill_mb)
+    changes = diff_sorted(sorted_by_key(previous_rows, key_indexes, width, spill_dir, memory_mb, spill_budget),
+                          sorted_by_key(current_rows, key_indexes, width, spill_dir, memory_mb, spill_budget))
+    for op, row, previous_row in changes:
+        change: Dict[str, Any] = {
+            'op': op,
+            'key': {name: row[i] for name, i in zip(key_names, key_indexes)},
+            'row': dict(zip(header, row)),
+        }
+        if previous_row is not None:
+            change['previous'] = dict(zip(header, previous_row))
+        target.write(json.dumps(change, ensure_ascii=False))
+        target.write('\n')
+        counts[op] += 1
+    return counts
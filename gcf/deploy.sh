@@ -6,7 +6,10 @@ gcloud functions deploy gcf-xref-processor \
   --source . \
   --trigger-event google.cloud.storage.object.v1.finalized \
   --trigger-resource xref-landing-zone \
-  --set-env-vars CONFIG_BUCKET=xref-config,DEAD_LETTER_BUCKET=xref-dead-letter \
+  --retry \
+  --set-env-vars CONFIG_BUCKET=xref-config,DEAD_LETTER_BUCKET=xref-dead-letter,FUNCTION_CONCURRENCY=8,MAX_STAGING_MB=256,REBUILD_QUEUE_BUCKET=xref-config \
   --service-account xref-gcf-sa@sbox-rgodoy-001-20251124.iam.gserviceaccount.com \
   --project sbox-rgodoy-001-20251124 \
-  --memory 512Mi
\ No newline at end of file
+  --memory 1Gi \
+  --cpu 1 \
+  --concurrency 8
\ No newline at end of file
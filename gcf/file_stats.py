@@ -0,0 +1,133 @@
+"""
+Single-pass statistics for landed CSV files.
+
+FileStats consumes rows one at a time and keeps constant memory per column: the row count, null count,
+numeric min/max and a HyperLogLog sketch for approximate distinct counts. xref_processor feeds it from
+the normalization pass, or from one streaming read of the landed object, and writes the result next to
+the file as <stem>.stats.json under the same ingestion_timestamp= prefix. Data-quality checks then
+read a few KB instead of scanning the table.
+"""
+import hashlib
+import math
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+# 2^12 registers per column: ~1.6% standard error for 4 KiB of memory
+HLL_PRECISION = 12
+
+# Empty fields are NULL, as for the BigQuery external tables (null_marker '')
+NULL_VALUES = frozenset([''])
+
+# Sidecar written next to each landed file (see main.sidecar_blob_name)
+STATS_SUFFIX = '.stats.json'
+
+
+class HyperLogLog:
+    """Approximate distinct counter (Flajolet et al.) with linear counting for small cardinalities."""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+        self._rank_bits = 64 - precision
+
+    def add(self, value: str) -> None:
+        hashed = int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+        index = hashed >> self._rank_bits
+        remainder = hashed & ((1 << self._rank_bits) - 1)
+        rank = self._rank_bits - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        raw = alpha * self.size * self.size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * self.size and zeros:
+            return int(round(self.size * math.log(self.size / zeros)))
+        return int(round(raw))
+
+
+class ColumnStats:
+    """Null count, numeric min/max and distinct sketch of one column."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.nulls = 0
+        self.numeric = True
+        self.minimum: Optional[float] = None
+        self.maximum: Optional[float] = None
+        self.distinct = HyperLogLog()
+
+    def add(self, value: str) -> None:
+        value = value.strip()
+        if value in NULL_VALUES:
+            self.nulls += 1
+            return
+        self.distinct.add(value)
+        if not self.numeric:
+            return
+        try:
+            number = float(value)
+        except ValueError:
+            number = math.nan
+        if not math.isfinite(number):
+            # One non-numeric value makes the column non-numeric; min/max are dropped
+            self.numeric, self.minimum, self.maximum = False, None, None
+            return
+        if self.minimum is None or number < self.minimum:
+            self.minimum = number
+        if self.maximum is None or number > self.maximum:
+            self.maximum = number
+
+    def to_dict(self, rows: int) -> Dict[str, Any]:
+        numeric = self.numeric and self.minimum is not None
+        return {
+            'name': self.name,
+            'null_count': self.nulls,
+            'null_rate': round(self.nulls / rows, 6) if rows else None,
+            'numeric': numeric,
+            'min': self.minimum if numeric else None,
+            'max': self.maximum if numeric else None,
+            'approx_distinct': self.distinct.estimate(),
+        }
+
+
+class FileStats:
+    """
+    Row-at-a-time statistics of one CSV file. The first row passed in is the header; rows shorter
+    than the header count their missing fields as NULL, extra fields are ignored.
+    """
+
+    def __init__(self):
+        self.columns: List[ColumnStats] = []
+        self.rows = 0
+        self._header_seen = False
+
+    def add_row(self, row: List[str]) -> None:
+        if not self._header_seen:
+            names = [name.strip() for name in row]
+            if names:
+                names[0] = names[0].lstrip('\ufeff')
+            self.columns = [ColumnStats(name or f"column_{i + 1}") for i, name in enumerate(names)]
+            self._header_seen = True
+            return
+        self.rows += 1
+        for column, value in zip(self.columns, row):
+            column.add(value)
+        for column in self.columns[len(row):]:
+            column.nulls += 1
+
+    def add_rows(self, rows: Iterable[List[str]]) -> 'FileStats':
+        for row in rows:
+            self.add_row(row)
+        return self
+
+    def to_dict(self, landed_object: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            'object': landed_object,
+            'computed_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'rows': self.rows,
+            'hll_precision': HLL_PRECISION,
+            'columns': [column.to_dict(self.rows) for column in self.columns],
+        }
@@ -0,0 +1,228 @@
+"""
+Deadlines, retries, hedged reads and a circuit breaker for the processor's GCS calls.
+
+Every GCS operation of xref_processor goes through GcsIO.call(), which owns retrying (the library's
+own retry is turned off per call with retry=None, so attempts are not multiplied):
+- Each operation has a deadline covering all of its attempts. The callable gets the time left for
+  the current attempt (capped at attempt_timeout) and passes it on as the request timeout.
+- Retryable failures (HTTP 408/429/5xx, connection resets, timeouts) are retried with exponential
+  backoff and full jitter, up to GCS_MAX_ATTEMPTS or the deadline, whichever comes first. Any other
+  error (404, 403, 412, a bad file) is raised at once.
+- Small idempotent reads (configs, header probes, manifests) can be hedged: if the first request has
+  not answered after GCS_HEDGE_AFTER_SECONDS, an identical second one is sent and the first answer wins.
+- After GCS_BREAKER_THRESHOLD consecutive retryable failures the breaker opens and calls fail fast for
+  GCS_BREAKER_RESET_SECONDS; then one trial call is let through and its outcome closes or re-opens it.
+
+When retries run out or the breaker is open, StorageUnavailable is raised. The file itself is fine, so
+xref_processor fails the request (the trigger redelivers the event) instead of dead-lettering it.
+"""
+import concurrent.futures
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+import requests
+from google.api_core import exceptions as gcs_exceptions
+from google.auth import exceptions as auth_exceptions
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Budget for one small operation (all attempts), and for landing a file (copy or stream)
+GCS_DEADLINE_SECONDS = float(os.environ.get('GCS_DEADLINE_SECONDS', '30'))
+GCS_LAND_DEADLINE_SECONDS = float(os.environ.get('GCS_LAND_DEADLINE_SECONDS', '480'))
+
+# Timeout of a single small request (configs, probes, uploads of small objects)
+GCS_ATTEMPT_TIMEOUT_SECONDS = float(os.environ.get('GCS_ATTEMPT_TIMEOUT_SECONDS', '10'))
+
+# Attempts per operation and the exponential backoff between them (full jitter)
+GCS_MAX_ATTEMPTS = int(os.environ.get('GCS_MAX_ATTEMPTS', '5'))
+GCS_BACKOFF_BASE_SECONDS = float(os.environ.get('GCS_BACKOFF_BASE_SECONDS', '0.2'))
+GCS_BACKOFF_MAX_SECONDS = float(os.environ.get('GCS_BACKOFF_MAX_SECONDS', '5'))
+
+# A hedged read sends its second request after this long (0 disables hedging)
+GCS_HEDGE_AFTER_SECONDS = float(os.environ.get('GCS_HEDGE_AFTER_SECONDS', '0.3'))
+
+# Consecutive retryable failures that open the breaker, and how long it stays open
+GCS_BREAKER_THRESHOLD = int(os.environ.get('GCS_BREAKER_THRESHOLD', '8'))
+GCS_BREAKER_RESET_SECONDS = float(os.environ.get('GCS_BREAKER_RESET_SECONDS', '30'))
+
+RETRYABLE_STATUS_CODES = frozenset([408, 429, 500, 502, 503, 504])
+
+# Transport-level failures: the request may not have reached GCS, or its answer was lost
+RETRYABLE_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    auth_exceptions.TransportError,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class StorageUnavailable(Exception):
+    """GCS kept failing with retryable errors until the operation's attempts or deadline ran out."""
+
+
+class CircuitOpenError(StorageUnavailable):
+    """The breaker is open after repeated GCS failures; the call was not attempted."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (StorageUnavailable, gcs_exceptions.NotFound)):
+        return False
+    if isinstance(error, gcs_exceptions.GoogleAPICallError):
+        return error.code in RETRYABLE_STATUS_CODES
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    # google.resumable_media errors (streamed uploads/downloads) carry the HTTP response
+    status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt: int, base: float = GCS_BACKOFF_BASE_SECONDS, cap: float = GCS_BACKOFF_MAX_SECONDS,
+                  rng: Callable[[float, float], float] = random.uniform) -> float:
+    """Full-jitter backoff before retry number `attempt` (1-based): uniform in [0, min(cap, base * 2^(attempt-1))]."""
+    return rng(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker shared by every GCS operation of the instance."""
+
+    def __init__(self, threshold: int = GCS_BREAKER_THRESHOLD, reset_seconds: float = GCS_BREAKER_RESET_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'open' if self.clock() - self._opened_at < self.reset_seconds else 'half_open'
+
+    def before_call(self, operation: str) -> None:
+        """Raises CircuitOpenError unless the call may go ahead (closed, or the half-open trial)."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            waited = self.clock() - self._opened_at
+            if waited < self.reset_seconds or self._trial_in_flight:
+                raise CircuitOpenError(f"GCS circuit open ({self._failures} consecutive failures); "
+                                       f"{operation} not attempted")
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("GCS circuit closed")
+            self._failures, self._opened_at, self._trial_in_flight = 0, None, False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            trial_failed = self._trial_in_flight
+            self._trial_in_flight = False
+            if trial_failed or (self._opened_at is None and self._failures >= self.threshold):
+                self._opened_at = self.clock()
+                logger.error(f"GCS circuit opened after {self._failures} consecutive failures; "
+                             f"failing fast for {self.reset_seconds:g}s")
+
+
+class GcsIO:
+    """Runs GCS operations with deadlines, jittered retries, optional hedging and a circuit breaker."""
+
+    def __init__(self, deadline_seconds: float = GCS_DEADLINE_SECONDS,
+                 attempt_timeout: float = GCS_ATTEMPT_TIMEOUT_SECONDS, max_attempts: int = GCS_MAX_ATTEMPTS,
+                 hedge_after: float = GCS_HEDGE_AFTER_SECONDS, breaker: Optional[CircuitBreaker] = None,
+                 sleep: Callable[[float], None] = time.sleep, clock: Callable[[], float] = time.monotonic,
+                 hedge_workers: int = 16):
+        self.deadline_seconds = deadline_seconds
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max_attempts
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self.sleep = sleep
+        self.clock = clock
+        self.hedge_workers = hedge_workers
+        self.hedged_requests = 0
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _hedge_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.hedge_workers, thread_name_prefix='gcs-hedge')
+            return self._executor
+
+    def _hedged(self, operation: str, func: Callable[[float], T], timeout: float) -> T:
+        """First successful answer of up to two identical requests, the second sent after hedge_after."""
+        executor = self._hedge_executor()
+        futures = [executor.submit(func, timeout)]
+        done, _ = concurrent.futures.wait(futures, timeout=min(self.hedge_after, timeout))
+        if not done:
+            with self._lock:
+                self.hedged_requests += 1
+            logger.info(f"GCS {operation} slower than {self.hedge_after:g}s; sending a hedged request")
+            futures.append(executor.submit(func, timeout))
+
+        ends_at = self.clock() + timeout
+        pending, error = set(futures), None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, timeout=max(0.0, ends_at - self.clock()),
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = error or future.exception()
+        if error is not None:
+            raise error
+        raise TimeoutError(f"GCS {operation} timed out after {timeout:.1f}s")
+
+    def call(self, operation: str, func: Callable[[float], T], deadline: Optional[float] = None,
+             attempt_timeout: Optional[float] = None, hedge: bool = False) -> T:
+        """
+        Runs func(timeout) until it succeeds, fails with a non-retryable error, or the attempts or the
+        deadline run out (StorageUnavailable). hedge should only be set for small idempotent reads.
+        """
+        deadline = self.deadline_seconds if deadline is None else deadline
+        attempt_timeout = attempt_timeout or self.attempt_timeout
+        started = self.clock()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call(operation)
+            timeout = max(0.001, min(attempt_timeout, deadline - (self.clock() - started)))
+            try:
+                if hedge and self.hedge_after > 0:
+                    result = self._hedged(operation, func, timeout)
+                else:
+                    result = func(timeout)
+            except Exception as e:
+                if not is_retryable(e):
+                    # GCS answered; the failure is about the request, not the service
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                delay = backoff_delay(attempt)
+                if attempt >= self.max_attempts or self.clock() - started + delay >= deadline:
+                    raise StorageUnavailable(f"GCS {operation} failed after {attempt} attempt(s) in "
+                                             f"{self.clock() - started:.1f}s: {type(e).__name__} - {e}") from e
+                logger.warning(f"GCS {operation} attempt {attempt} failed ({type(e).__name__} - {e}); "
+                               f"retrying in {delay:.2f}s")
+                self.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
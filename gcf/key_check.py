@@ -0,0 +1,221 @@
+"""
+Streaming primary-key uniqueness check with bounded memory.
+
+Configs declare "key_columns"; xref_processor feeds every row of the file to a KeyUniquenessCheck in
+one streaming pass. Keys are hashed to 128-bit digests (collisions are negligible at any realistic
+row count) and kept in an exact in-memory set until it would exceed KEY_CHECK_MEMORY_MB. Beyond that,
+the set and every later key are spilled to SPILL_PARTITIONS files by hash; at the end each partition
+is checked on its own (split again by the next digest byte if it is still over budget), so the set
+never grows past its budget.
+
+Spill files live in the request's scratch directory. Under the default SCRATCH_DIR that is the in-memory
+filesystem of a Gen2 instance, so spilled bytes still use instance memory. They are capped at
+MAX_SPILL_MB per check; a check that would spill more raises SpillLimitExceeded.
+
+A file with duplicate keys raises DuplicateKeysError with the number of extra rows and sample keys.
+"""
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+KEY_CHECK_MEMORY_MB = int(os.environ.get('KEY_CHECK_MEMORY_MB', '64'))
+
+# Most bytes of spill files one check (or one delta) may keep in the scratch directory at a time
+MAX_SPILL_MB = int(os.environ.get('MAX_SPILL_MB', '64'))
+
+DIGEST_SIZE = 16
+
+# Approximate cost of one digest in a Python set (bytes object plus hash table slot)
+BYTES_PER_KEY = 120
+
+SPILL_PARTITIONS = 64
+
+MAX_SAMPLE_KEYS = 5
+
+# Separates the fields of a composite key before hashing
+KEY_SEPARATOR = '\x1f'
+
+# Spill record: digest, then the length of the key text that follows (0 for keys spilled from memory)
+_RECORD_HEADER = struct.Struct(f'>{DIGEST_SIZE}sH')
+
+
+class DuplicateKeysError(Exception):
+    """The file repeats key values; duplicates is the number of rows whose key was already seen."""
+
+    def __init__(self, key_columns: List[str], duplicates: int, samples: List[str]):
+        self.key_columns = key_columns
+        self.duplicates = duplicates
+        self.samples = samples
+        shown = ', '.join(repr(sample) for sample in samples)
+        super().__init__(f"Key ({', '.join(key_columns)}) is not unique: {duplicates} duplicate row(s). "
+                         f"Sample keys: {shown}")
+
+
+class SpillLimitExceeded(Exception):
+    """Spill files would take more than their byte cap (MAX_SPILL_MB) of scratch space."""
+
+
+class SpillBudget:
+    """Counts the bytes of live spill files and raises SpillLimitExceeded once they pass max_bytes."""
+
+    def __init__(self, max_mb: Optional[float] = None):
+        self.max_bytes = int((MAX_SPILL_MB if max_mb is None else max_mb) * 1024 * 1024)
+        self.used = 0
+
+    def add(self, size: int) -> None:
+        self.used += size
+        if self.used > self.max_bytes:
+            raise SpillLimitExceeded(f"Spill files passed the {self.max_bytes}-byte scratch limit (MAX_SPILL_MB).")
+
+    def remove(self, path: str) -> None:
+        """Deletes a spill file and returns its bytes to the budget."""
+        self.used = max(0, self.used - os.path.getsize(path))
+        os.remove(path)
+
+
+def _read_records(path: str) -> Iterator[Tuple[bytes, str]]:
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_RECORD_HEADER.size)
+            if not header:
+                return
+            digest, length = _RECORD_HEADER.unpack(header)
+            yield digest, f.read(length).decode('utf-8', 'replace') if length else ''
+
+
+class KeyUniquenessCheck:
+    """
+    Exact uniqueness check over key_indexes (0-based). The first row passed in is the header;
+    blank rows are ignored. Call finish() after the last row.
+    """
+
+    def __init__(self, key_indexes: List[int], key_names: Optional[List[str]] = None,
+                 memory_mb: Optional[float] = None, spill_dir: Optional[str] = None,
+                 partitions: int = SPILL_PARTITIONS, max_samples: int = MAX_SAMPLE_KEYS,
+                 max_spill_mb: Optional[float] = None):
+        self.key_indexes = key_indexes
+        self.key_names = key_names or [f"column {i + 1}" for i in key_indexes]
+        budget = int((KEY_CHECK_MEMORY_MB if memory_mb is None else memory_mb) * 1024 * 1024)
+        self.max_keys = max(1, budget // BYTES_PER_KEY)
+        self.spill_dir = spill_dir
+        self.spill_budget = SpillBudget(max_spill_mb)
+        self.partitions = partitions
+        self.max_samples = max_samples
+        self.rows = 0
+        self.duplicates = 0
+        self.samples: List[str] = []
+        self.spilled = False
+        self._header_seen = False
+        self._seen = set()
+        self._spill_root: Optional[str] = None
+        self._spill_files: List[BinaryIO] = []
+        self._spill_counts: List[int] = []
+
+    def _duplicate(self, key: str) -> None:
+        self.duplicates += 1
+        sample = key.replace(KEY_SEPARATOR, ' | ')
+        if len(self.samples) < self.max_samples and sample not in self.samples:
+            self.samples.append(sample)
+
+    def _spill_path(self, *parts: int) -> str:
+        return os.path.join(self._spill_root, '_'.join(str(part) for part in parts) + '.keys')
+
+    def _start_spill(self) -> None:
+        self._spill_root = tempfile.mkdtemp(prefix='keys_', dir=self.spill_dir)
+        self._spill_files = [open(self._spill_path(i), 'wb') for i in range(self.partitions)]
+        self._spill_counts = [0] * self.partitions
+        self.spilled = True
+        for digest in self._seen:
+            self._write(digest, '')
+        self._seen = set()
+
+    def _write(self, digest: bytes, key: str) -> None:
+        encoded = key.encode('utf-8')[:0xFFFF]
+        partition = digest[0] % self.partitions
+        self.spill_budget.add(_RECORD_HEADER.size + len(encoded))
+        self._spill_files[partition].write(_RECORD_HEADER.pack(digest, len(encoded)) + encoded)
+        self._spill_counts[partition] += 1
+
+    def add_row(self, row: List[str]) -> None:
+        if not self._header_seen:
+            self._header_seen = True
+            return
+        if not any(field.strip() for field in row):
+            return
+        self.rows += 1
+        key = KEY_SEPARATOR.join(row[i].strip() if i < len(row) else '' for i in self.key_indexes)
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=DIGEST_SIZE).digest()
+        if self.spilled:
+            self._write(digest, key)
+            return
+        if digest in self._seen:
+            self._duplicate(key)
+            return
+        self._seen.add(digest)
+        if len(self._seen) > self.max_keys:
+            self._start_spill()
+
+    def add_rows(self, rows: Iterable[List[str]]) -> 'KeyUniquenessCheck':
+        for row in rows:
+            self.add_row(row)
+        return self
+
+    def _check_partition(self, path: str, count: int, depth: int) -> None:
+        """Checks one spill file, splitting it by the next digest byte while it is over budget."""
+        if count > self.max_keys and depth + 1 < DIGEST_SIZE:
+            children = [open(f"{path}.{i}", 'wb') for i in range(self.partitions)]
+            counts = [0] * self.partitions
+            try:
+                for digest, key in _read_records(path):
+                    child = digest[depth + 1] % self.partitions
+                    encoded = key.encode('utf-8')
+                    self.spill_budget.add(_RECORD_HEADER.size + len(encoded))
+                    children[child].write(_RECORD_HEADER.pack(digest, len(encoded)) + encoded)
+                    counts[child] += 1
+            finally:
+                for child in children:
+                    child.close()
+            self.spill_budget.remove(path)
+            # One heavily repeated key cannot be split further: check its partition as it is
+            child_depth = depth + 1 if max(counts) < count else DIGEST_SIZE
+            for i, child_count in enumerate(counts):
+                self._check_partition(f"{path}.{i}", child_count, child_depth)
+            return
+
+        seen = set()
+        # Keys spilled from memory come first in every file, so a repeat always carries its key text
+        for digest, key in _read_records(path):
+            if digest in seen:
+                self._duplicate(key)
+            else:
+                seen.add(digest)
+        self.spill_budget.remove(path)
+
+    def close(self) -> None:
+        """Removes any spill files (also after an error)."""
+        for f in self._spill_files:
+            f.close()
+        self._spill_files = []
+        if self._spill_root:
+            shutil.rmtree(self._spill_root, ignore_errors=True)
+            self._spill_root = None
+            self.spill_budget.used = 0
+
+    def finish(self) -> 'KeyUniquenessCheck':
+        """Completes the check; raises DuplicateKeysError if any key repeats."""
+        try:
+            if self.spilled and self._spill_files:
+                for f in self._spill_files:
+                    f.close()
+                self._spill_files = []
+                for i, count in enumerate(self._spill_counts):
+                    self._check_partition(self._spill_path(i), count, 0)
+        finally:
+            self.close()
+            self._seen = set()
+        if self.duplicates:
+            raise DuplicateKeysError(self.key_names, self.duplicates, self.samples)
+        return self
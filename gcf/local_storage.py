@@ -0,0 +1,174 @@
+"""
+Directory-backed stand-ins for the parts of google.cloud.storage that xref_processor uses.
+
+Objects live as files under <root>/<bucket>/<object name>, so replays and load tests can push
+realistic file sizes through the processor without holding the objects in memory (and without
+skewing its memory high-water mark). Writes go through a staging file and are renamed into place
+on close (and dropped if the writer exits with an exception), so readers never see a partial object,
+as with GCS.
+
+Only what the processor, the dead-letter index and the rebuild queue call is implemented:
+Client.bucket / list_blobs, Bucket.blob / copy_blob / list_blobs and Blob.open / download_as_bytes /
+download_as_text / upload_from_string / exists / delete / reload. Listings honor `delimiter` and
+report the folders they rolled up in `.prefixes`, like the HTTPIterator of a real listing.
+"""
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import threading
+from typing import List, Optional, Union
+
+from google.api_core import exceptions as gcs_exceptions
+
+STAGING_DIR = '.staging'
+
+
+class _BlobListing(list):
+    """The blobs of a listing; with a delimiter, the folders below the prefix are in `prefixes` instead."""
+
+    def __init__(self, blobs: List['LocalBlob'], prefixes: set):
+        super().__init__(blobs)
+        self.prefixes = prefixes
+
+
+class _StagedWriter(io.FileIO):
+    """Binary file that appears under its object name only when closed; an exception discards it."""
+
+    def __init__(self, staging_path: str, final_path: str):
+        super().__init__(staging_path, 'wb')
+        self._final_path = final_path
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+            return
+        # Like BlobWriter.terminate(): a failed write never becomes an object
+        super().close()
+        os.remove(self.name)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        super().close()
+        os.makedirs(os.path.dirname(self._final_path), exist_ok=True)
+        os.replace(self.name, self._final_path)
+
+
+class LocalBlob:
+    def __init__(self, bucket: 'LocalBucket', name: str):
+        self.bucket = bucket
+        self.name = name
+        self.size: Optional[int] = None
+        self.time_created: Optional[datetime.datetime] = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.bucket.path, *self.name.split('/'))
+
+    def _check_exists(self) -> None:
+        if not os.path.isfile(self.path):
+            raise gcs_exceptions.NotFound(f"gs://{self.bucket.name}/{self.name}")
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def reload(self) -> None:
+        self._check_exists()
+        stat = os.stat(self.path)
+        self.size = stat.st_size
+        self.time_created = datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc)
+
+    def open(self, mode: str = 'rb', chunk_size: Optional[int] = None, **kwargs) -> io.IOBase:
+        if mode == 'rb':
+            self._check_exists()
+            return io.open(self.path, 'rb')
+        if mode == 'wb':
+            return _StagedWriter(self.bucket.client.staging_path(), self.path)
+        raise ValueError(f"Unsupported mode for LocalBlob.open: {mode}")
+
+    def download_as_bytes(self, start: Optional[int] = None, end: Optional[int] = None, **kwargs) -> bytes:
+        self._check_exists()
+        with io.open(self.path, 'rb') as source:
+            source.seek(start or 0)
+            return source.read() if end is None else source.read(end - (start or 0) + 1)
+
+    def download_as_text(self, encoding: str = 'utf-8', **kwargs) -> str:
+        return self.download_as_bytes().decode(encoding)
+
+    def upload_from_string(self, data: Union[str, bytes], content_type: Optional[str] = None,
+                           if_generation_match: Optional[int] = None, **kwargs) -> None:
+        if if_generation_match == 0 and self.exists():
+            raise gcs_exceptions.PreconditionFailed(f"gs://{self.bucket.name}/{self.name} already exists")
+        with self.open('wb') as target:
+            target.write(data.encode('utf-8') if isinstance(data, str) else data)
+
+    def delete(self, **kwargs) -> None:
+        self._check_exists()
+        os.remove(self.path)
+
+
+class LocalBucket:
+    def __init__(self, client: 'LocalStorageClient', name: str):
+        self.client = client
+        self.name = name
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.client.root, self.name)
+
+    def blob(self, blob_name: str) -> LocalBlob:
+        return LocalBlob(self, blob_name)
+
+    def copy_blob(self, blob: LocalBlob, destination_bucket: 'LocalBucket',
+                  new_name: Optional[str] = None, **kwargs) -> LocalBlob:
+        blob._check_exists()
+        destination = destination_bucket.blob(new_name or blob.name)
+        staging_path = self.client.staging_path()
+        shutil.copyfile(blob.path, staging_path)
+        os.makedirs(os.path.dirname(destination.path), exist_ok=True)
+        os.replace(staging_path, destination.path)
+        return destination
+
+    def list_blobs(self, prefix: Optional[str] = None, delimiter: Optional[str] = None, **kwargs) -> _BlobListing:
+        blobs, prefixes = [], set()
+        for directory, _, files in os.walk(self.path):
+            for file_name in sorted(files):
+                name = os.path.relpath(os.path.join(directory, file_name), self.path).replace(os.sep, '/')
+                if prefix and not name.startswith(prefix):
+                    continue
+                rest = name[len(prefix or ''):]
+                if delimiter and delimiter in rest:
+                    prefixes.add((prefix or '') + rest[:rest.index(delimiter) + len(delimiter)])
+                    continue
+                blob = self.blob(name)
+                blob.reload()
+                blobs.append(blob)
+        return _BlobListing(blobs, prefixes)
+
+
+class LocalStorageClient:
+    """storage.Client stand-in rooted at a local directory (a fresh temporary one by default)."""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or tempfile.mkdtemp(prefix='xref_storage_')
+        self._staging = os.path.join(self.root, STAGING_DIR)
+        os.makedirs(self._staging, exist_ok=True)
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def staging_path(self) -> str:
+        with self._lock:
+            self._counter += 1
+            return os.path.join(self._staging, f"{self._counter}.part")
+
+    def bucket(self, bucket_name: str) -> LocalBucket:
+        if bucket_name == STAGING_DIR:
+            raise ValueError(f"Bucket name is reserved: {bucket_name}")
+        return LocalBucket(self, bucket_name)
+
+    def list_blobs(self, bucket_or_name: Union[str, LocalBucket], prefix: Optional[str] = None,
+                   delimiter: Optional[str] = None, **kwargs) -> _BlobListing:
+        bucket = self.bucket(bucket_or_name) if isinstance(bucket_or_name, str) else bucket_or_name
+        return bucket.list_blobs(prefix=prefix, delimiter=delimiter)
@@ -1,23 +1,69 @@
 import functions_framework
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
+from google.api_core import exceptions as gcs_exceptions
 from google.cloud import storage
+from requests.adapters import HTTPAdapter
 import pandas as pd
+import atexit
+import codecs
+import contextlib
+import csv
+import functools
+import gzip
+import hashlib
+import io
+import itertools
 import json
 import fnmatch
 import os
 import logging
-from typing import Dict, Any
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+import dead_letter_index
+from dead_letter_index import DeadLetterIndex, error_record
+from delta import DELTA_SUFFIX, HeaderChanged, write_delta
+from file_stats import STATS_SUFFIX, FileStats
+from gcs_io import GCS_LAND_DEADLINE_SECONDS, GcsIO, StorageUnavailable
+from key_check import DuplicateKeysError, KeyUniquenessCheck, SpillLimitExceeded
+from rebuild_scheduler import REBUILD_QUEUE_BUCKET, enqueue_rebuild
+from typing import Dict, Any, BinaryIO, Callable, Iterator, List, Optional, TextIO, Tuple, Union
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize GCS client globally for efficiency
-STORAGE_CLIENT = storage.Client()
+# GCS client shared by all requests on this instance; created lazily by get_storage_client()
+STORAGE_CLIENT = None
+_STORAGE_CLIENT_LOCK = threading.Lock()
 
 # Configuration constants from environment variables
 CONFIG_BUCKET = os.environ.get('CONFIG_BUCKET') 
 DEAD_LETTER_BUCKET = os.environ.get('DEAD_LETTER_BUCKET') 
 
+# Error records of dead-lettered files, written in batches to DEAD_LETTER_BUCKET (see dead_letter_index.py)
+DEAD_LETTER_INDEX = DeadLetterIndex()
+
+# Deadlines, retries, hedged reads and the circuit breaker for every GCS call (see gcs_io.py)
+GCS_IO = GcsIO()
+
+# Requests served concurrently by one instance (must match the --concurrency deploy flag)
+FUNCTION_CONCURRENCY = int(os.environ.get('FUNCTION_CONCURRENCY', '1'))
+
+# HTTP connections kept per host: each in-flight request may hold a streaming read and write at once
+HTTP_POOL_SIZE = max(10, FUNCTION_CONCURRENCY * 2)
+
+# How long a loaded config is reused before it is read from CONFIG_BUCKET again
+CONFIG_CACHE_TTL_SECONDS = int(os.environ.get('CONFIG_CACHE_TTL_SECONDS', '60'))
+_CONFIG_CACHE: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_CONFIG_CACHE_LOCK = threading.Lock()
+
 # Hardcoded bucket names from the project requirements
 LANDING_ZONE_BUCKET = 'xref-landing-zone'
 EXTERNAL_TABLES_BUCKET = 'xref-ext-tables'
@@ -25,56 +71,779 @@ EXTERNAL_TABLES_BUCKET = 'xref-ext-tables'
 # HARDCODED: The prefix where config files are stored in the GCS bucket
 CONFIG_FOLDER = 'config/'
 
+# Learned header fingerprints of datasets whose config does not pin 'header_fingerprint'
+MANIFEST_FOLDER = 'manifest/'
+
+# What to do when a file's header differs from the dataset's fingerprint (config 'header_policy' overrides):
+#   warn        - land the file and log a warning
+#   dead_letter - reject the file
+#   accept      - land the file and adopt its header as the new fingerprint
+HEADER_POLICIES = ('warn', 'dead_letter', 'accept')
+DEFAULT_HEADER_POLICY = os.environ.get('HEADER_POLICY', 'warn')
+
+# Encoding used to read source CSVs unless the config overrides it with 'encoding'
+DEFAULT_ENCODING = 'latin-1'
+
+# Chunk size for streamed GCS reads/writes during normalization (must be a multiple of 256 KiB)
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Buffer size used when piping decompressed bytes between streams
+STREAM_BUFFER_SIZE = 1024 * 1024
+
+# Bytes fetched with a single ranged read to probe the header row (before decompression)
+HEADER_PROBE_BYTES = 64 * 1024
+
+# Largest object that may be staged on the local filesystem (/tmp is in-memory on Gen2); larger ones are dead-lettered
+MAX_STAGED_OBJECT_BYTES = int(os.environ.get('MAX_STAGED_OBJECT_MB', '128')) * 1024 * 1024
+
+# Bytes staged at once by ALL concurrent requests of an instance; size it below --memory, which the
+# in-memory /tmp shares with the interpreter (e.g. 256 with --memory 1Gi and --concurrency 8)
+MAX_STAGING_BYTES = int(os.environ.get('MAX_STAGING_MB', '256')) * 1024 * 1024
+
+# How long a request waits for staging room before failing for redelivery
+STAGING_WAIT_SECONDS = float(os.environ.get('STAGING_WAIT_SECONDS', '120'))
+
+# Parent directory for per-request scratch directories
+SCRATCH_DIR = os.environ.get('SCRATCH_DIR') or tempfile.gettempdir()
+
+# Compressed upload extensions (e.g. raw_x.csv.gz, raw_x.zip) and their compression type
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.zip': 'zip'}
+
+class StagingLimitExceeded(Exception):
+    """Raised when an object is larger than MAX_STAGED_OBJECT_BYTES and cannot be staged locally."""
+
+
+class StagingBusy(Exception):
+    """Raised when other requests hold the instance's staging room for longer than STAGING_WAIT_SECONDS."""
+
+
+class StagingBudget:
+    """
+    Instance-wide semaphore on staged bytes, shared by all concurrent requests.
+
+    MAX_STAGED_OBJECT_BYTES caps a single object; this caps their sum, so eight concurrent zip
+    uploads cannot stage eight times the per-object limit into the memory of one instance.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = MAX_STAGING_BYTES if max_bytes is None else max_bytes
+        self.used = 0
+        self._available = threading.Condition()
+
+    @contextlib.contextmanager
+    def reserve(self, size: int, timeout: Optional[float] = None) -> Iterator[None]:
+        """
+        Holds size bytes of the budget for the duration of the block, waiting up to timeout
+        (default STAGING_WAIT_SECONDS) for other requests to release theirs.
+
+        Raises StagingLimitExceeded if size alone exceeds the budget, StagingBusy on timeout.
+        """
+        if size > self.max_bytes:
+            raise StagingLimitExceeded(
+                f"Object needs {size} bytes, above the {self.max_bytes}-byte instance staging budget (MAX_STAGING_MB)."
+            )
+        timeout = STAGING_WAIT_SECONDS if timeout is None else timeout
+        with self._available:
+            if not self._available.wait_for(lambda: self.used + size <= self.max_bytes, timeout):
+                raise StagingBusy(f"No room to stage {size} bytes after {timeout}s "
+                                  f"({self.used} of {self.max_bytes} bytes in use by other requests).")
+            self.used += size
+        try:
+            yield
+        finally:
+            with self._available:
+                self.used -= size
+                self._available.notify_all()
+
+
+STAGING_BUDGET = StagingBudget()
+
 # --- Utility Functions ---
 
+def get_storage_client() -> storage.Client:
+    """
+    Returns the instance-wide GCS client, creating it on first use.
+
+    Creation is guarded by a lock so concurrent first requests share one client, and its HTTP
+    connection pool is sized to FUNCTION_CONCURRENCY so requests do not queue for connections.
+    """
+    global STORAGE_CLIENT
+    if STORAGE_CLIENT is None:
+        with _STORAGE_CLIENT_LOCK:
+            if STORAGE_CLIENT is None:
+                credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+                session = AuthorizedSession(credentials)
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount('https://', adapter)
+                STORAGE_CLIENT = storage.Client(project=project, credentials=credentials, _http=session)
+    return STORAGE_CLIENT
+
+
+def clear_config_cache() -> None:
+    """Drops all cached configs (e.g. after a config is updated)."""
+    with _CONFIG_CACHE_LOCK:
+        _CONFIG_CACHE.clear()
+
+def split_dataset_name(blob_name: str) -> Tuple[str, Optional[str]]:
+    """
+    Returns the dataset stem and compression type of a blob, stripping compound extensions.
+
+    e.g. 'folder/raw_x.csv' -> ('raw_x', None), 'raw_x.csv.gz' -> ('raw_x', 'gzip'), 'raw_x.zip' -> ('raw_x', 'zip')
+    """
+    stem, ext = os.path.splitext(os.path.basename(blob_name))
+    compression = COMPRESSION_EXTENSIONS.get(ext.lower())
+    if compression is None:
+        return stem, None
+    if stem.lower().endswith('.csv'):
+        stem = stem[:-len('.csv')]
+    return stem, compression
+
+def matches_filename_pattern(source_blob_name: str, filename_pattern: str) -> bool:
+    """
+    Matches a blob name against a config's 'filename_pattern' with fnmatch. Compressed uploads are also
+    matched as the CSV they carry, so 'raw_x.csv' accepts 'raw_x.csv.gz' and 'raw_x.zip'.
+    """
+    if fnmatch.fnmatch(source_blob_name, filename_pattern):
+        return True
+    stem, compression = split_dataset_name(source_blob_name)
+    if compression is None:
+        return False
+    csv_name = f"{stem}.csv"
+    folder = os.path.dirname(source_blob_name)
+    return fnmatch.fnmatch(f"{folder}/{csv_name}" if folder else csv_name, filename_pattern)
+
+def _read_config(config_bucket: str, config_blob_name: str) -> Dict[str, Any]:
+    """Reads and parses one config object, reusing a recently loaded copy from the instance cache."""
+    cache_key = f"{config_bucket}/{config_blob_name}"
+    
+    # Reuse a recently loaded config (bursts of uploads for one dataset share a single read)
+    with _CONFIG_CACHE_LOCK:
+        cached = _CONFIG_CACHE.get(cache_key)
+    if cached and time.monotonic() - cached[0] < CONFIG_CACHE_TTL_SECONDS:
+        return dict(cached[1])
+        
+    try:
+        logger.info(f"Attempting to load config from: {config_blob_name}")
+        bucket = get_storage_client().bucket(config_bucket)
+        blob = bucket.blob(config_blob_name) 
+        config_data = GCS_IO.call('config read', lambda timeout: blob.download_as_text(timeout=timeout, retry=None),
+                                  hedge=True)
+        config_rules = json.loads(config_data)
+    except StorageUnavailable:
+        # GCS is failing, not the config: never treat this as a missing config
+        raise
+    except Exception as e:
+        logger.warning(f"Configuration file not found or corrupted: {config_blob_name}. Error: {e}")
+        # Raise a specific error type for easy handling in the main function
+        raise FileNotFoundError(f"Config file not found: {config_blob_name}")
+    
+    with _CONFIG_CACHE_LOCK:
+        _CONFIG_CACHE[cache_key] = (time.monotonic(), config_rules)
+    return dict(config_rules)
+
+
 def load_file_config_dynamic(config_bucket: str, source_blob_name: str) -> Dict[str, Any]:
     """
     Loads configuration rules dynamically based on the source file's name.
     
     The expected config path is: gs://xref-config/config/[filename_without_extension].json
+    
+    If it does not exist, the config of a combined target is tried by dropping the last '_' segment
+    of the name (e.g., 'raw_zipcode_territory_ak' -> 'raw_zipcode_territory'). That config is only
+    used if it declares a 'partition_regex' to derive the partition from the filename.
     """
     if not config_bucket:
         raise ValueError("CONFIG_BUCKET environment variable is not set.")
     
-    # 1. Strip directories and get the filename without extension (e.g., 'raw_site_orders.json')
-    base_name = os.path.basename(source_blob_name)
-    file_name_without_ext, _ = os.path.splitext(base_name)
+    # 1. Strip directories and (compound) extensions (e.g., 'raw_site_orders.csv.gz' -> 'raw_site_orders')
+    file_name_without_ext, _ = split_dataset_name(source_blob_name)
     
     # 2. Dynamically construct the specific config file name
     config_blob_name = f"{CONFIG_FOLDER}{file_name_without_ext}.json"
-        
     try:
-        logger.info(f"Attempting to load config from: {config_blob_name}")
-        bucket = STORAGE_CLIENT.bucket(config_bucket)
-        blob = bucket.blob(config_blob_name) 
-        config_data = blob.download_as_text()
-        return json.loads(config_data)
-    except Exception as e:
-        logger.warning(f"Configuration file not found or corrupted: {config_blob_name}. Error: {e}")
-        # Raise a specific error type for easy handling in the main function
+        return _read_config(config_bucket, config_blob_name)
+    except FileNotFoundError:
+        combined_name, separator, _ = file_name_without_ext.rpartition('_')
+        if not separator:
+            raise
+    
+    # 3. Fall back to a combined (partitioned) target config
+    try:
+        combined_config = _read_config(config_bucket, f"{CONFIG_FOLDER}{combined_name}.json")
+    except FileNotFoundError:
+        combined_config = {}
+    if 'partition_regex' not in combined_config:
         raise FileNotFoundError(f"Config file not found: {config_blob_name}")
+    return combined_config
+
+
+def partition_path(config_rules: Dict[str, Any], source_blob_name: str) -> str:
+    """
+    Derives hive partition segments (e.g., 'state=ak/') from the filename using the config's 'partition_regex'.
+    
+    Every named group of the regex, matched against the file stem, becomes one 'key=value/' segment in order.
+    Returns an empty string when the config is not partitioned.
+    """
+    partition_regex = config_rules.get('partition_regex')
+    if not partition_regex:
+        return ''
+    
+    file_name_without_ext, _ = split_dataset_name(source_blob_name)
+    match = re.fullmatch(partition_regex, file_name_without_ext)
+    if not match:
+        raise ValueError(f"Filename '{file_name_without_ext}' does not match partition_regex '{partition_regex}'")
+    return ''.join(f"{key}={value.lower()}/" for key, value in match.groupdict().items())
 
 
 def copy_blob(source_bucket_name: str, source_blob_name: str, 
               target_bucket_name: str, target_blob_name: str) -> None:
     """Copies a blob from one bucket to another using the correct Bucket.copy_blob method."""
     
-    source_bucket = STORAGE_CLIENT.bucket(source_bucket_name) 
+    source_bucket = get_storage_client().bucket(source_bucket_name) 
     source_blob = source_bucket.blob(source_blob_name)
-    destination_bucket = STORAGE_CLIENT.bucket(target_bucket_name)
+    destination_bucket = get_storage_client().bucket(target_bucket_name)
 
     #  Call copy_blob on the source_bucket object
-    source_bucket.copy_blob(
+    GCS_IO.call('copy', lambda timeout: source_bucket.copy_blob(
         source_blob, 
         destination_bucket, 
-        new_name=target_blob_name 
-    )
+        new_name=target_blob_name,
+        timeout=timeout,
+        retry=None
+    ), deadline=GCS_LAND_DEADLINE_SECONDS, attempt_timeout=GCS_LAND_DEADLINE_SECONDS)
     
     logger.info(f"File copied to gs://{target_bucket_name}/{target_blob_name}")
 
-def process_dead_letter(source_bucket: str, source_blob: str, reason: str) -> None:
-    """Copies the file to the Dead Letter Bucket and logs the error."""
-    logger.error(f"DEAD LETTER: File {source_blob} failed processing. Reason: {reason}")
+def normalize_csv_rows(source: TextIO, target: TextIO, expected_columns: int, banner_rows: int = 0,
+                       stats: Optional[FileStats] = None, key_check: Optional[KeyUniquenessCheck] = None) -> int:
+    """
+    Streams CSV rows from source to target one row at a time, producing a clean file.
+
+    - Drops the first `banner_rows` rows (report titles above the header row)
+    - Pads jagged rows with empty fields up to `expected_columns`
+    - Replaces newlines embedded in quoted fields with a literal '\\n' escape
+    - Feeds every written row to `stats` and `key_check`, if given, in the same pass
+
+    Returns the number of rows written (including the header row).
+    """
+    reader = csv.reader(source)
+    writer = csv.writer(target, lineterminator='\n')
+    rows_written = 0
+
+    for row_index, row in enumerate(reader):
+        if row_index < banner_rows:
+            continue
+        if len(row) < expected_columns:
+            row.extend([''] * (expected_columns - len(row)))
+        if stats is not None:
+            stats.add_row(row)
+        if key_check is not None:
+            key_check.add_row(row)
+        writer.writerow([field.replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n') for field in row])
+        rows_written += 1
+
+    return rows_written
+
+
+def _decompress_prefix(data: bytes, compression: Optional[str]) -> bytes:
+    """Decompresses as much as possible from the leading bytes of a (truncated) compressed object."""
+    if compression == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data)
+    if compression == 'zip':
+        # Local file header of the first member: signature, 5 shorts, 3 longs, name/extra lengths
+        if len(data) < 30 or data[:4] != b'PK\x03\x04':
+            raise zipfile.BadZipFile("File is not a zip archive")
+        header = struct.unpack('<4s5H3L2H', data[:30])
+        method, name_length, extra_length = header[3], header[9], header[10]
+        payload = data[30 + name_length + extra_length:]
+        if method == zipfile.ZIP_STORED:
+            return payload
+        if method == zipfile.ZIP_DEFLATED:
+            return zlib.decompressobj(-zlib.MAX_WBITS).decompress(payload)
+        raise zipfile.BadZipFile(f"Unsupported zip compression method: {method}")
+    return data
+
+
+def read_header_sample(bucket_name: str, blob_name: str, compression: Optional[str] = None,
+                       encoding: str = DEFAULT_ENCODING) -> str:
+    """
+    Returns the leading complete lines of a blob using one ranged read of HEADER_PROBE_BYTES.
+
+    Compressed uploads only have that prefix decompressed, so the probe cost does not grow with file size.
+    """
+    blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+    prefix = GCS_IO.call('header probe', lambda timeout: blob.download_as_bytes(
+        start=0, end=HEADER_PROBE_BYTES - 1, timeout=timeout, retry=None), hedge=True)
+    data = _decompress_prefix(prefix, compression)
+    if data.startswith(codecs.BOM_UTF8):
+        data = data[len(codecs.BOM_UTF8):]
+
+    text = codecs.getincrementaldecoder(encoding)().decode(data)
+    # The ranged read can end mid-row; keep only complete lines
+    last_newline = text.rfind('\n')
+    return text[:last_newline + 1] if last_newline >= 0 else text
+
+
+def header_fingerprint(header_sample: str, banner_rows: int = 0) -> Tuple[str, List[str]]:
+    """
+    Returns the sha256 fingerprint of the header row in a header sample, and its normalized names.
+
+    Names are trimmed, lower-cased and whitespace-collapsed, so cosmetic edits are not drift;
+    renamed, added, dropped or reordered columns are.
+    """
+    rows = csv.reader(io.StringIO(header_sample))
+    header = next(itertools.islice(rows, banner_rows, None), [])
+    names = [' '.join(name.split()).lower() for name in header]
+    return hashlib.sha256('\x1f'.join(names).encode('utf-8')).hexdigest(), names
+
+
+def key_column_indexes(key_columns: List[Union[str, int]], header_names: List[str]) -> List[int]:
+    """
+    0-based positions of a config's key_columns: header names (matched like header fingerprints,
+    so case and spacing do not matter) or 1-based column positions.
+    """
+    indexes = []
+    for column in key_columns:
+        if isinstance(column, int):
+            if not 1 <= column <= len(header_names):
+                raise ValueError(f"Key column position {column} is outside the header row ({len(header_names)} columns).")
+            indexes.append(column - 1)
+            continue
+        name = ' '.join(str(column).split()).lower()
+        if name not in header_names:
+            raise ValueError(f"Key column '{column}' is not in the header row {header_names}.")
+        indexes.append(header_names.index(name))
+    return indexes
+
+
+def scan_source_keys(bucket_name: str, blob_name: str, compression: Optional[str],
+                     key_check_factory: Callable[[], KeyUniquenessCheck],
+                     encoding: str = DEFAULT_ENCODING, banner_rows: int = 0, collect_stats: bool = False) -> Optional[FileStats]:
+    """
+    One streaming pass over a landing-zone object before it is copied server-side: checks key uniqueness
+    (raises DuplicateKeysError) and, if asked, computes the statistics of the file, which lands unchanged.
+
+    Objects that are streamed to their landing anyway check their keys in that pass (see write_csv_stream).
+    """
+    def scan(timeout: float) -> Optional[FileStats]:
+        # A retried attempt starts over with a fresh check
+        key_check = key_check_factory()
+        stats = FileStats() if collect_stats else None
+        try:
+            with open_source_stream(bucket_name, blob_name, compression) as source:
+                text_source = io.TextIOWrapper(source, encoding=encoding, newline='')
+                try:
+                    for row in itertools.islice(csv.reader(text_source), banner_rows, None):
+                        key_check.add_row(row)
+                        if stats is not None:
+                            stats.add_row(row)
+                finally:
+                    text_source.detach()
+            key_check.finish()
+        finally:
+            key_check.close()
+        logger.info(f"Key check passed for {blob_name} ({key_check.rows} rows"
+                    f"{', spilled to disk' if key_check.spilled else ''})")
+        return stats
+
+    return GCS_IO.call('key check', scan, deadline=GCS_LAND_DEADLINE_SECONDS,
+                       attempt_timeout=GCS_LAND_DEADLINE_SECONDS)
+
+
+def load_header_manifest(config_bucket: str, stem: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the learned header of a dataset ({} if none yet), cached like configs.
+
+    Returns None if the manifest could not be read, so a transient error never re-seeds it.
+    """
+    cache_key = f"{config_bucket}/{MANIFEST_FOLDER}{stem}.json"
+    with _CONFIG_CACHE_LOCK:
+        cached = _CONFIG_CACHE.get(cache_key)
+    if cached and time.monotonic() - cached[0] < CONFIG_CACHE_TTL_SECONDS:
+        return dict(cached[1])
+
+    blob = get_storage_client().bucket(config_bucket).blob(f"{MANIFEST_FOLDER}{stem}.json")
+    try:
+        manifest = json.loads(GCS_IO.call(
+            'manifest read', lambda timeout: blob.download_as_text(timeout=timeout, retry=None), hedge=True))
+    except gcs_exceptions.NotFound:
+        manifest = {}
+    except Exception as e:
+        logger.warning(f"Header manifest for {stem} could not be read. Error: {e}")
+        return None
+    with _CONFIG_CACHE_LOCK:
+        _CONFIG_CACHE[cache_key] = (time.monotonic(), manifest)
+    return dict(manifest)
+
+
+def save_header_manifest(config_bucket: str, stem: str, manifest: Dict[str, Any]) -> None:
+    """Stores a dataset's accepted header; a failed write only means the header is learned again."""
+    try:
+        blob = get_storage_client().bucket(config_bucket).blob(f"{MANIFEST_FOLDER}{stem}.json")
+        GCS_IO.call('manifest write', lambda timeout: blob.upload_from_string(
+            json.dumps(manifest), content_type='application/json', timeout=timeout, retry=None))
+        with _CONFIG_CACHE_LOCK:
+            _CONFIG_CACHE[f"{config_bucket}/{MANIFEST_FOLDER}{stem}.json"] = (time.monotonic(), dict(manifest))
+        logger.info(f"Header fingerprint for {stem} set to {manifest['header_fingerprint']}")
+    except Exception as e:
+        logger.warning(f"Failed to store header manifest for {stem}. Error: {e}")
+
+
+def check_header(config_rules: Dict[str, Any], source_blob_name: str,
+                 header_sample: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Compares the probed header against the dataset's fingerprint: the config's 'header_fingerprint' if
+    pinned, otherwise the learned one in gs://$CONFIG_BUCKET/manifest/<stem>.json.
+
+    Returns (dead-letter reason or None, manifest to store once the file has landed or None).
+    The first file of an unpinned dataset seeds its manifest.
+    """
+    stem, _ = split_dataset_name(source_blob_name)
+    fingerprint, names = header_fingerprint(header_sample, config_rules.get('banner_rows', 0))
+    policy = config_rules.get('header_policy', DEFAULT_HEADER_POLICY)
+    if policy not in HEADER_POLICIES:
+        raise ValueError(f"Unknown header_policy '{policy}'. Must be one of {HEADER_POLICIES}")
+
+    pinned = config_rules.get('header_fingerprint')
+    manifest = {} if pinned else load_header_manifest(CONFIG_BUCKET, stem)
+    if manifest is None:
+        logger.warning(f"Header drift check skipped for {source_blob_name}.")
+        return None, None
+    expected = pinned or manifest.get('header_fingerprint')
+    candidate = {'header_fingerprint': fingerprint, 'columns': names, 'source_object': source_blob_name}
+
+    if expected is None:
+        return None, candidate
+    if fingerprint == expected:
+        return None, None
+
+    reason = (f"Header drift. Expected fingerprint {expected} ({manifest.get('columns') or 'pinned in config'}), "
+              f"but file has {fingerprint} ({names}).")
+    if policy == 'dead_letter':
+        return reason, None
+    if policy == 'accept':
+        if pinned:
+            logger.warning(f"{reason} Accepted; update 'header_fingerprint' in config/{stem}.json to {fingerprint}.")
+            return None, None
+        logger.warning(f"{reason} Accepted as the new header.")
+        return None, candidate
+    logger.warning(f"{reason} Landing anyway (header_policy 'warn').")
+    return None, None
+
+
+def check_staging_limit(object_size: int, max_bytes: Optional[int] = None) -> None:
+    """
+    Raises StagingLimitExceeded if an object of object_size bytes may not be staged locally: above the
+    per-object limit, or above the whole instance-wide budget.
+    """
+    max_bytes = MAX_STAGED_OBJECT_BYTES if max_bytes is None else max_bytes
+    if object_size > max_bytes:
+        raise StagingLimitExceeded(
+            f"Object is {object_size} bytes, above the {max_bytes}-byte local staging limit (MAX_STAGED_OBJECT_MB)."
+        )
+    if object_size > STAGING_BUDGET.max_bytes:
+        raise StagingLimitExceeded(f"Object is {object_size} bytes, above the {STAGING_BUDGET.max_bytes}-byte "
+                                   f"instance staging budget (MAX_STAGING_MB).")
+
+
+def stage_blob(blob: storage.Blob, local_path: str, max_bytes: Optional[int] = None) -> int:
+    """
+    Streams a blob to local_path through a fixed-size buffer and returns the bytes written.
+
+    Stops with StagingLimitExceeded as soon as more than max_bytes have been written, so a wrong or missing
+    size in the event cannot fill the in-memory filesystem.
+    """
+    bytes_written = 0
+    with blob.open('rb', chunk_size=STREAM_CHUNK_SIZE) as source, open(local_path, 'wb') as target:
+        while True:
+            buffer = source.read(STREAM_BUFFER_SIZE)
+            if not buffer:
+                break
+            bytes_written += len(buffer)
+            check_staging_limit(bytes_written, max_bytes)
+            target.write(buffer)
+    return bytes_written
+
+
+class _CopyingReader(io.RawIOBase):
+    """Raw reader that writes every byte it reads from source to target, so parsing a stream also copies it."""
+
+    def __init__(self, source: BinaryIO, target: BinaryIO):
+        super().__init__()
+        self.source = source
+        self.target = target
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.source.read(len(buffer))
+        self.target.write(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+@contextlib.contextmanager
+def staged_blob(blob: storage.Blob, local_path: str, object_size: int = 0) -> Iterator[str]:
+    """
+    Stages a blob at local_path for the duration of the block, then deletes it.
+
+    The staged bytes are reserved in STAGING_BUDGET first: the object size from the event, or the
+    per-object limit when the event carried none, so the reservation always covers what stage_blob may write.
+    """
+    reserved = min(object_size, MAX_STAGED_OBJECT_BYTES) if object_size > 0 else MAX_STAGED_OBJECT_BYTES
+    with STAGING_BUDGET.reserve(reserved):
+        try:
+            stage_blob(blob, local_path, reserved)
+            yield local_path
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(local_path)
+
+
+@contextlib.contextmanager
+def open_source_stream(bucket_name: str, blob_name: str, compression: Optional[str] = None,
+                       local_path: Optional[str] = None, object_size: int = 0) -> Iterator[BinaryIO]:
+    """
+    Opens a landing-zone object as a stream of decompressed CSV bytes.
+
+    Plain and gzip objects are streamed from GCS in STREAM_CHUNK_SIZE chunks. Zip archives keep their
+    member index at the end of the file, so they are staged at `local_path` (subject to the staging limit
+    and the instance-wide STAGING_BUDGET) and must hold exactly one member.
+    """
+    blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+
+    if compression == 'zip':
+        with staged_blob(blob, local_path, object_size), zipfile.ZipFile(local_path) as archive:
+            members = [member for member in archive.infolist() if not member.is_dir()]
+            if len(members) != 1:
+                raise zipfile.BadZipFile(f"Zip archive must contain exactly one member, found {len(members)}")
+            with archive.open(members[0]) as member_stream:
+                yield member_stream
+        return
+
+    with blob.open('rb', chunk_size=STREAM_CHUNK_SIZE) as raw_source:
+        if compression == 'gzip':
+            with gzip.GzipFile(fileobj=raw_source, mode='rb') as decompressed:
+                yield decompressed
+        else:
+            yield raw_source
+
+
+def write_csv_stream(source: BinaryIO, target_bucket_name: str, target_blob_name: str,
+                     compress_output: bool = False, normalize: bool = False,
+                     expected_columns: int = 0, banner_rows: int = 0,
+                     encoding: str = DEFAULT_ENCODING, stats: Optional[FileStats] = None,
+                     key_check: Optional[KeyUniquenessCheck] = None) -> None:
+    """
+    Streams CSV bytes into the target bucket, optionally normalizing and/or gzip-compressing them.
+
+    Reads and writes go through fixed-size chunks, so memory stays constant regardless of file size.
+    When normalizing, a UTF-8 byte order mark takes precedence over the configured encoding and is stripped.
+    Otherwise the bytes land unchanged; given stats or a key_check, the rows after banner_rows are parsed
+    on their way through, in the same pass.
+    A key_check is completed before the upload is committed, so a file with duplicate keys never lands.
+    """
+    target_blob = get_storage_client().bucket(target_bucket_name).blob(target_blob_name)
+    content_type = 'application/gzip' if compress_output else 'text/csv'
+
+    with target_blob.open('wb', chunk_size=STREAM_CHUNK_SIZE, ignore_flush=True, content_type=content_type) as raw_target:
+        target = gzip.GzipFile(fileobj=raw_target, mode='wb') if compress_output else raw_target
+        try:
+            if normalize:
+                if source.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8:
+                    encoding = 'utf-8-sig'
+                source.seek(0)
+                text_source = io.TextIOWrapper(source, encoding=encoding, newline='')
+                text_target = io.TextIOWrapper(target, encoding='utf-8', newline='')
+                rows_written = normalize_csv_rows(text_source, text_target, expected_columns, banner_rows, stats,
+                                                  key_check)
+                if key_check is not None:
+                    key_check.finish()
+                text_target.flush()
+                # Detach so closing the wrappers later does not close the underlying streams early
+                text_target.detach()
+                text_source.detach()
+                logger.info(f"File normalized ({rows_written} rows, source encoding {encoding})")
+            elif stats is not None or key_check is not None:
+                copying_source = io.BufferedReader(_CopyingReader(source, target), STREAM_BUFFER_SIZE)
+                text_source = io.TextIOWrapper(copying_source, encoding=encoding, newline='')
+                for row in itertools.islice(csv.reader(text_source), banner_rows, None):
+                    if stats is not None:
+                        stats.add_row(row)
+                    if key_check is not None:
+                        key_check.add_row(row)
+                if key_check is not None:
+                    key_check.finish()
+                    logger.info(f"Key check passed ({key_check.rows} rows"
+                                f"{', spilled to disk' if key_check.spilled else ''})")
+                text_source.detach()
+            else:
+                shutil.copyfileobj(source, target, STREAM_BUFFER_SIZE)
+        finally:
+            if compress_output:
+                target.close()
+
+    logger.info(f"File streamed to gs://{target_bucket_name}/{target_blob_name}")
+
+
+@contextlib.contextmanager
+def open_landed_rows(bucket_name: str, blob_name: str, encoding: str = DEFAULT_ENCODING,
+                     banner_rows: int = 0) -> Iterator[Iterator[List[str]]]:
+    """Opens a landed (plain or gzip) object as a stream of CSV rows, starting at its header row."""
+    compression = 'gzip' if blob_name.lower().endswith('.gz') else None
+    with open_source_stream(bucket_name, blob_name, compression) as source:
+        text_source = io.TextIOWrapper(source, encoding=encoding, newline='')
+        try:
+            yield itertools.islice(csv.reader(text_source), banner_rows, None)
+        finally:
+            text_source.detach()
+
+
+def stream_file_stats(bucket_name: str, blob_name: str, encoding: str = DEFAULT_ENCODING,
+                      banner_rows: int = 0) -> FileStats:
+    """Computes FileStats with one streaming read of a landed (plain or gzip) object; memory stays constant."""
+    def read_stats(timeout: float) -> FileStats:
+        with open_landed_rows(bucket_name, blob_name, encoding, banner_rows) as rows:
+            return FileStats().add_rows(rows)
+
+    return GCS_IO.call('stats read', read_stats, deadline=GCS_LAND_DEADLINE_SECONDS,
+                       attempt_timeout=GCS_LAND_DEADLINE_SECONDS)
+
+
+def write_stats_sidecar(bucket_name: str, landed_name: str, stats: FileStats) -> Optional[str]:
+    """Writes <stem>.stats.json next to the landed file. A failure is logged; the file stays landed."""
+    sidecar_name = sidecar_blob_name(landed_name, STATS_SUFFIX)
+    try:
+        blob = get_storage_client().bucket(bucket_name).blob(sidecar_name)
+        GCS_IO.call('stats write', lambda timeout: blob.upload_from_string(
+            json.dumps(stats.to_dict(landed_name)), content_type='application/json', timeout=timeout, retry=None))
+        logger.info(f"Statistics ({stats.rows} rows) written to gs://{bucket_name}/{sidecar_name}")
+        return sidecar_name
+    except Exception as e:
+        logger.warning(f"Failed to write statistics for {landed_name}. Error: {e}")
+        return None
+
+
+def withdraw_landed(bucket_name: str, landed_name: str) -> None:
+    """Deletes a landed file and its statistics sidecar, so a file dead-lettered after landing is not read."""
+    bucket = get_storage_client().bucket(bucket_name)
+    for name in (landed_name, sidecar_blob_name(landed_name, STATS_SUFFIX)):
+        blob = bucket.blob(name)
+        try:
+            GCS_IO.call('withdraw', lambda timeout: blob.delete(timeout=timeout, retry=None))
+        except gcs_exceptions.NotFound:
+            pass
+    logger.info(f"Withdrew gs://{bucket_name}/{landed_name}")
+
+
+def previous_ingestion(bucket_name: str, ingestion_prefix: str, timestamp: str, landed_name: str) -> Optional[str]:
+    """
+    The latest object of the same file (same folder and dataset stem, either compression) landed under
+    <ingestion_prefix><ts>/ with a timestamp before `timestamp`, or None for a first ingestion.
+
+    Only the <ts>/ folders are listed (one entry per ingestion, not per object). They are then walked
+    newest first, listing just the file's own objects in each, until one holds the file.
+    """
+    client = get_storage_client()
+
+    def list_folders(timeout: float) -> List[str]:
+        listing = client.list_blobs(bucket_name, prefix=ingestion_prefix, delimiter='/', timeout=timeout, retry=None)
+        # The folders are collected as the pages are read
+        for _ in listing:
+            pass
+        return sorted(listing.prefixes, reverse=True)
+
+    folder, (stem, _) = os.path.dirname(landed_name), split_dataset_name(landed_name)
+    for ts_folder in GCS_IO.call('delta list', list_folders):
+        if ts_folder[len(ingestion_prefix):-1] >= timestamp:
+            continue
+        # <ts>/<landed name> and its sidecars (.stats.json, .delta.ndjson, which are not CSVs)
+        file_prefix = f"{ts_folder}{folder + '/' if folder else ''}{stem}."
+        names = GCS_IO.call('delta list', lambda timeout: [
+            blob.name for blob in client.list_blobs(bucket_name, prefix=file_prefix, timeout=timeout, retry=None)])
+        landed = [name for name in names if name.lower().endswith(('.csv', '.csv.gz'))
+                  and split_dataset_name(name[len(ts_folder):])[0] == stem]
+        if landed:
+            return max(landed)
+    return None
+
+
+def write_delta_sidecar(bucket_name: str, previous_name: str, landed_name: str, key_indexes: List[int],
+                        encoding: str = DEFAULT_ENCODING, banner_rows: int = 0,
+                        spill_dir: Optional[str] = None) -> Optional[str]:
+    """
+    Writes <stem>.delta.ndjson next to the landed file: its keyed changes since previous_name (see delta.py).
+
+    Returns the sidecar name, or None if the header changed (consumers then reload the full file).
+    """
+    sidecar_name = sidecar_blob_name(landed_name, DELTA_SUFFIX)
+    blob = get_storage_client().bucket(bucket_name).blob(sidecar_name)
+
+    def stream_delta(timeout: float) -> Dict[str, int]:
+        # A retried attempt starts over; a failed write is never committed
+        with open_landed_rows(bucket_name, previous_name, encoding, banner_rows) as previous_rows, \
+                open_landed_rows(bucket_name, landed_name, encoding, banner_rows) as current_rows, \
+                blob.open('wb', chunk_size=STREAM_CHUNK_SIZE, ignore_flush=True,
+                          content_type='application/x-ndjson') as raw_target:
+            target = io.TextIOWrapper(raw_target, encoding='utf-8', newline='')
+            counts = write_delta(previous_rows, current_rows, key_indexes, target, spill_dir)
+            target.flush()
+            target.detach()
+        return counts
+
+    try:
+        counts = GCS_IO.call('delta', stream_delta, deadline=GCS_LAND_DEADLINE_SECONDS,
+                             attempt_timeout=GCS_LAND_DEADLINE_SECONDS)
+    except HeaderChanged as e:
+        logger.warning(f"No delta for {landed_name}: {e}")
+        return None
+    logger.info(f"Delta against {previous_name} ({counts['insert']} inserted, {counts['update']} updated, "
+                f"{counts['delete']} deleted) written to gs://{bucket_name}/{sidecar_name}")
+    return sidecar_name
+
+
+def landed_blob_name(source_blob_name: str, compression: Optional[str], compress_output: bool) -> str:
+    """Returns the object name to land under the ingestion prefix, reflecting any change of compression."""
+    if compression is None or (compression == 'gzip' and compress_output):
+        return source_blob_name
+    stem, _ = split_dataset_name(source_blob_name)
+    landed_name = f"{stem}.csv.gz" if compress_output else f"{stem}.csv"
+    return os.path.join(os.path.dirname(source_blob_name), landed_name)
+
+
+def sidecar_blob_name(landed_blob_name: str, suffix: str) -> str:
+    """
+    <prefix>/<stem><suffix> next to a landed file, e.g. the STATS_SUFFIX or DELTA_SUFFIX sidecar.
+    Sidecar names never match the *.csv uris of the ext_ tables.
+    """
+    directory, base = landed_blob_name.rsplit('/', 1) if '/' in landed_blob_name else ('', landed_blob_name)
+    for extension in ('.csv.gz', '.csv'):
+        if base.lower().endswith(extension):
+            base = base[:-len(extension)]
+            break
+    return f"{directory}/{base}{suffix}" if directory else f"{base}{suffix}"
+
+def flush_dead_letter_index() -> None:
+    """Writes the buffered dead-letter error records, if any, as one NDJSON object."""
+    if not DEAD_LETTER_BUCKET or not len(DEAD_LETTER_INDEX):
+        return
+    try:
+        index_name = DEAD_LETTER_INDEX.flush(get_storage_client(), DEAD_LETTER_BUCKET, GCS_IO)
+        logger.info(f"Dead-letter error records written to gs://{DEAD_LETTER_BUCKET}/{index_name}")
+    except Exception as e:
+        # Records stay buffered for the next flush; the log line of each failure remains the fallback
+        logger.warning(f"Failed to write dead-letter error records. Error: {e}")
+
+# Records still buffered when the instance shuts down
+atexit.register(flush_dead_letter_index)
+
+def process_dead_letter(source_bucket: str, source_blob: str, reason: str,
+                        reason_code: str = dead_letter_index.UNEXPECTED_ERROR,
+                        expected_columns: Optional[int] = None, actual_columns: Optional[int] = None,
+                        size: Any = None, generation: Any = None) -> None:
+    """Copies the file to the Dead Letter Bucket, logs the error and buffers a structured error record."""
+    logger.error(f"DEAD LETTER: File {source_blob} failed processing. Reason ({reason_code}): {reason}")
     if not DEAD_LETTER_BUCKET:
         logger.critical("CRITICAL: DEAD_LETTER_BUCKET environment variable is not set. Cannot move file.")
         return
@@ -83,12 +852,32 @@ def process_dead_letter(source_bucket: str, source_blob: str, reason: str) -> No
     timestamp_prefix = pd.Timestamp.now().strftime('%Y%m%d%H%M%S')
     target_blob_name = f"error/{timestamp_prefix}_{source_blob}"
     
+    copied = False
     try:
         copy_blob(source_bucket, source_blob, DEAD_LETTER_BUCKET, target_blob_name)
         logger.info(f"File moved to Dead Letter: gs://{DEAD_LETTER_BUCKET}/{target_blob_name}")
+        copied = True
     except Exception as e:
         logger.critical(f"CRITICAL: Failed to move file to DQL bucket {DEAD_LETTER_BUCKET}. Error: {e}")
 
+    stem, _ = split_dataset_name(source_blob)
+    record = error_record(stem, source_blob, target_blob_name, reason_code, reason,
+                          expected_columns, actual_columns, size, generation, copied)
+    if DEAD_LETTER_INDEX.add(record):
+        flush_dead_letter_index()
+
+def queue_rebuild(target_path: str, target_blob_name: str) -> None:
+    """Queues a debounced dbt rebuild for target_path (see rebuild_scheduler.py), if enabled."""
+    if not REBUILD_QUEUE_BUCKET:
+        return
+    try:
+        marker_name = enqueue_rebuild(get_storage_client(), REBUILD_QUEUE_BUCKET, target_path, target_blob_name,
+                                      gcs_io=GCS_IO)
+        logger.info(f"Queued rebuild for {target_path}: gs://{REBUILD_QUEUE_BUCKET}/{marker_name}")
+    except Exception as e:
+        # The file is already landed; a missed marker only delays the rebuild to the next upload
+        logger.warning(f"Failed to queue rebuild for {target_path}. Error: {e}")
+
 def find_config(config_rules: Dict) -> Dict:
     """
     Validates that the required keys exist and extracts path/columns from the single config file.
@@ -99,6 +888,8 @@ def find_config(config_rules: Dict) -> Dict:
     for key in required_keys:
         if key not in config_rules:
             raise ValueError(f"Configuration file is missing required key: '{key}'")
+    if config_rules.get('delta') and not config_rules.get('key_columns'):
+        raise ValueError("Configuration enables 'delta' but declares no 'key_columns' to match rows on")
             
     return config_rules
 
@@ -123,9 +914,13 @@ def xref_processor(cloud_event: Dict[str, Any]):
     
     logger.info(f"Processing file: gs://{source_bucket_name}/{source_blob_name}")
     
-    # Use only the filename for local storage to prevent FileNotFoundError due to nested folders
-    file_name_only = os.path.basename(source_blob_name)
-    temp_local_file = f'/tmp/{file_name_only}' 
+    # Stage into a scratch directory unique to this request, so concurrent requests for the same
+    # basename never overwrite each other. Use only the filename to avoid nested folders.
+    object_size = int(data.get('size') or 0)
+    dead_letter = functools.partial(process_dead_letter, source_bucket_name, source_blob_name,
+                                    size=data.get('size'), generation=data.get('generation'))
+    scratch_dir = tempfile.mkdtemp(prefix='xref_', dir=SCRATCH_DIR)
+    temp_local_file = os.path.join(scratch_dir, os.path.basename(source_blob_name))
 
     try:
         # 1. Load Configuration DYNAMICALLY based on filename (FIRST STEP)
@@ -139,44 +934,164 @@ def xref_processor(cloud_event: Dict[str, Any]):
         expected_pattern = validated_config['filename_pattern']
         
         # Match the actual GCS path against the explicit pattern
-        if not fnmatch.fnmatch(source_blob_name, expected_pattern):
+        if not matches_filename_pattern(source_blob_name, expected_pattern):
             reason = f"Filename '{source_blob_name}' does not match the mandatory pattern '{expected_pattern}' defined in config file."
-            return process_dead_letter(source_bucket_name, source_blob_name, reason)
+            return dead_letter(reason, dead_letter_index.FILENAME_PATTERN_MISMATCH, expected_columns)
 
-        # 3. Download and COUNT Columns (Validation)
-        bucket = STORAGE_CLIENT.bucket(source_bucket_name)
-        blob = bucket.blob(source_blob_name)
-        
-        # Download the file to the simple /tmp/[filename] path
-        blob.download_to_filename(temp_local_file)
+        # Combined targets derive their partition (e.g., state=ak/) from the filename
+        try:
+            partition_segments = partition_path(validated_config, source_blob_name)
+        except ValueError as e:
+            return dead_letter(str(e), dead_letter_index.PARTITION_MISMATCH, expected_columns)
+
+        # 3. Probe the header and COUNT Columns (Validation)
+        # Only the first HEADER_PROBE_BYTES are downloaded (and decompressed for .csv.gz/.zip)
+        _, compression = split_dataset_name(source_blob_name)
+        encoding = validated_config.get('encoding', DEFAULT_ENCODING)
+        header_sample = read_header_sample(source_bucket_name, source_blob_name, compression, encoding)
         
-        # Read and count columns (Using encoding='latin-1')
-        df = pd.read_csv(temp_local_file, nrows=1, header=None, encoding='latin-1') 
+        # Read and count columns of the first row (already decoded with encoding='latin-1' unless overridden)
+        df = pd.read_csv(io.StringIO(header_sample), nrows=1, header=None)
         actual_columns = len(df.columns)
         
         if actual_columns != expected_columns:
             reason = f"Column count mismatch. Config expected {expected_columns}, but file has {actual_columns}."
-            return process_dead_letter(source_bucket_name, source_blob_name, reason)
+            return dead_letter(reason, dead_letter_index.COLUMN_COUNT_MISMATCH, expected_columns, actual_columns)
+
+        # Same sample: renamed or reordered columns are caught without reading more of the file
+        header_reason, header_manifest = check_header(validated_config, source_blob_name, header_sample)
+        if header_reason:
+            return dead_letter(header_reason, dead_letter_index.HEADER_MISMATCH, expected_columns, actual_columns)
+
+        # Reference tables declare key_columns; duplicates would multiply rows in every downstream join
+        key_check_factory, key_indexes = None, None
+        if validated_config.get('key_columns'):
+            _, header_names = header_fingerprint(header_sample, validated_config.get('banner_rows', 0))
+            try:
+                key_indexes = key_column_indexes(validated_config['key_columns'], header_names)
+            except ValueError as e:
+                return dead_letter(str(e), dead_letter_index.HEADER_MISMATCH, expected_columns, actual_columns)
+            key_names = [header_names[i] for i in key_indexes]
+            key_check_factory = functools.partial(KeyUniquenessCheck, key_indexes, key_names, spill_dir=scratch_dir)
 
         # 4. Ingestion Timestamp & Target Copy
         timestamp = pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')
         clean_target_path = target_path if target_path.endswith('/') else target_path + '/'
+        ingestion_prefix = f"{clean_target_path}{partition_segments}ingestion_timestamp="
         
-        # Target blob name includes the full original path (e.g., folder/file.csv)
-        target_blob_name = f"{clean_target_path}ingestion_timestamp={timestamp}/{source_blob_name}"
+        # Compressed uploads land decompressed as <stem>.csv unless land_compressed is set, so every
+        # upload of a file matches its ext_ table's raw_x.csv uri whatever compression it arrived in.
+        # Zip archives are always re-landed, as plain CSV (default) or gzip.
+        normalize = validated_config.get('normalize', False)
+        # Optional statistics sidecar: computed inline when normalizing, else by one read of the landed file
+        collect_stats = validated_config.get('stats', False)
+        stats = None
+        compress_output = compression is not None and validated_config.get('land_compressed', False)
+        
+        # Target blob name includes the full original path (e.g., folder/file.csv), below any
+        # partition derived from the filename (e.g., zipcode_territory/state=ak/ingestion_timestamp=...)
+        landed_name = landed_blob_name(source_blob_name, compression, compress_output)
+        target_blob_name = f"{ingestion_prefix}{timestamp}/{landed_name}"
+
+        if normalize or compression == 'zip' or (compression == 'gzip' and not compress_output):
+            if compression == 'zip':
+                # Zip archives are staged locally; refuse oversized ones before downloading anything
+                check_staging_limit(object_size)
+
+            # Stream the content: decompress, optionally normalize (no banner rows/BOM, padded rows,
+            # escaped newlines) and optionally recompress. Keys and statistics are taken in the same
+            # pass, so a zip is staged only once.
 
-        copy_blob(source_bucket_name, source_blob_name, EXTERNAL_TABLES_BUCKET, target_blob_name)
+            def stream_to_target(timeout: float) -> Optional[FileStats]:
+                # A retried attempt starts over from the first byte (a failed write is never committed)
+                inline_stats = FileStats() if collect_stats and (normalize or key_check_factory) else None
+                key_check = key_check_factory() if key_check_factory else None
+                try:
+                    with open_source_stream(source_bucket_name, source_blob_name, compression, temp_local_file,
+                                            object_size) as source:
+                        write_csv_stream(source, EXTERNAL_TABLES_BUCKET, target_blob_name, compress_output, normalize,
+                                         expected_columns, validated_config.get('banner_rows', 0), encoding,
+                                         stats=inline_stats, key_check=key_check)
+                finally:
+                    if key_check is not None:
+                        key_check.close()
+                return inline_stats
+
+            stats = GCS_IO.call('land', stream_to_target, deadline=GCS_LAND_DEADLINE_SECONDS,
+                                attempt_timeout=GCS_LAND_DEADLINE_SECONDS)
+        else:
+            if key_check_factory:
+                stats = scan_source_keys(source_bucket_name, source_blob_name, compression, key_check_factory,
+                                         encoding, validated_config.get('banner_rows', 0), collect_stats)
+            copy_blob(source_bucket_name, source_blob_name, EXTERNAL_TABLES_BUCKET, target_blob_name)
         
+        if collect_stats:
+            try:
+                if stats is None:
+                    # Un-normalized files land byte-for-byte (banner rows included), in the source encoding
+                    stats = stream_file_stats(EXTERNAL_TABLES_BUCKET, target_blob_name, encoding,
+                                              validated_config.get('banner_rows', 0))
+                write_stats_sidecar(EXTERNAL_TABLES_BUCKET, target_blob_name, stats)
+            except Exception as e:
+                logger.warning(f"Failed to compute statistics for {target_blob_name}. Error: {e}")
+
+        # Optional keyed delta against the previous ingestion of the same file, for incremental consumers
+        if validated_config.get('delta'):
+            try:
+                previous_name = previous_ingestion(EXTERNAL_TABLES_BUCKET, ingestion_prefix, timestamp, landed_name)
+                if previous_name is None:
+                    logger.info(f"No previous ingestion of {landed_name}; no delta written.")
+                else:
+                    # Normalized files land as clean UTF-8 without banner rows
+                    landed_encoding, landed_banner_rows = (('utf-8', 0) if normalize else
+                                                           (encoding, validated_config.get('banner_rows', 0)))
+                    write_delta_sidecar(EXTERNAL_TABLES_BUCKET, previous_name, target_blob_name, key_indexes,
+                                        landed_encoding, landed_banner_rows, scratch_dir)
+            except SpillLimitExceeded:
+                # Consumers applying deltas would silently miss this ingestion's changes: take the file
+                # back out and dead-letter it, as when the key check runs out of scratch space
+                withdraw_landed(EXTERNAL_TABLES_BUCKET, target_blob_name)
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to write delta for {target_blob_name}. Error: {e}")
+
         logger.info(f"SUCCESS: File {source_blob_name} validated (Cols: {actual_columns}) and copied to gs://{EXTERNAL_TABLES_BUCKET}/{target_blob_name}")
+        queue_rebuild(target_path, target_blob_name)
+        if header_manifest:
+            save_header_manifest(CONFIG_BUCKET, split_dataset_name(source_blob_name)[0], header_manifest)
 
     except FileNotFoundError as e:
         # Handles 404 error if the config file for the dataset is missing
         reason = f"Configuration file was not found for this dataset: {str(e)}"
-        return process_dead_letter(source_bucket_name, source_blob_name, reason)
+        return dead_letter(reason, dead_letter_index.CONFIG_NOT_FOUND)
+    except StagingLimitExceeded as e:
+        reason = f"Object too large to stage locally: {str(e)} Upload it as .csv.gz instead."
+        return dead_letter(reason, dead_letter_index.STAGING_LIMIT_EXCEEDED)
+    except SpillLimitExceeded as e:
+        reason = (f"Key check or delta ran out of scratch space: {str(e)} Raise MAX_SPILL_MB together with the "
+                  f"function memory, or point SCRATCH_DIR at a disk-backed volume, and replay the file.")
+        return dead_letter(reason, dead_letter_index.SCRATCH_LIMIT_EXCEEDED)
+    except zipfile.BadZipFile as e:
+        # Corrupt archives, unsupported compression methods and multi-member zips
+        reason = f"Invalid zip archive: {str(e)}"
+        return dead_letter(reason, dead_letter_index.INVALID_ZIP)
+    except DuplicateKeysError as e:
+        return dead_letter(str(e), dead_letter_index.DUPLICATE_KEYS, expected_columns, actual_columns)
+    except StagingBusy as e:
+        # Other requests on this instance are staging: the file is fine, so let the trigger redeliver it
+        logger.error(f"No staging room for {source_blob_name}; leaving it for redelivery. Error: {e}")
+        raise
+    except StorageUnavailable as e:
+        # GCS, not the file, is the problem: fail the request so the trigger redelivers the event
+        # (deployed with --retry) instead of dead-lettering a good file
+        logger.error(f"GCS unavailable while processing {source_blob_name}; leaving it for redelivery. Error: {e}")
+        raise
     except Exception as e:
         logger.exception(f"An unexpected error occurred during processing for {source_blob_name}.")
-        process_dead_letter(source_bucket_name, source_blob_name, f"Unexpected processing error: {type(e).__name__} - {str(e)}")
+        dead_letter(f"Unexpected processing error: {type(e).__name__} - {str(e)}", dead_letter_index.UNEXPECTED_ERROR)
     finally:
-        # Final cleanup for the temp file
-        if os.path.exists(temp_local_file):
-            os.remove(temp_local_file)
\ No newline at end of file
+        # Final cleanup for everything this request staged
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        # Write error records that have waited long enough, even if this request succeeded
+        if DEAD_LETTER_INDEX.due():
+            flush_dead_letter_index()
\ No newline at end of file
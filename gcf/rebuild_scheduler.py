@@ -0,0 +1,306 @@
+"""
+Debounced, selective dbt rebuilds for the xref_tables project.
+
+xref_processor drops one small marker object per landed file under
+gs://$REBUILD_QUEUE_BUCKET/rebuild_queue/<target_path>/. The drain side runs on a schedule
+(e.g. a Cloud Run job triggered every minute by Cloud Scheduler) wherever dbt and the
+xref_tables project are installed. Once uploads have gone quiet for REBUILD_QUIET_SECONDS, or
+the oldest marker has waited REBUILD_MAX_WAIT_SECONDS, it runs ONE `dbt build` over the staging
+models of every queued target_path (and their downstream children) and deletes the markers
+that build covered. A selection whose build keeps failing is moved aside after
+REBUILD_MAX_ATTEMPTS passes, so it stops blocking every later rebuild.
+
+Usage:
+    python rebuild_scheduler.py            # one drain pass
+    python rebuild_scheduler.py --dry-run  # print the planned selection without running dbt
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.api_core import exceptions as gcs_exceptions
+from google.cloud import storage
+
+from gcs_io import GcsIO
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bucket holding the marker queue and the drain lock (unset disables enqueueing)
+REBUILD_QUEUE_BUCKET = os.environ.get('REBUILD_QUEUE_BUCKET')
+
+# Marker objects: rebuild_queue/<target_path>/<YYYYMMDDHHMMSS>_<id>_<landed file>.json
+QUEUE_PREFIX = 'rebuild_queue/'
+
+# Created with if_generation_match=0 so only one drain pass runs dbt at a time
+LOCK_BLOB_NAME = 'rebuild_queue.lock'
+
+# Build once no new marker has arrived for this long...
+REBUILD_QUIET_SECONDS = int(os.environ.get('REBUILD_QUIET_SECONDS', '300'))
+
+# ...or once the oldest queued marker has waited this long, even if uploads are still arriving
+REBUILD_MAX_WAIT_SECONDS = int(os.environ.get('REBUILD_MAX_WAIT_SECONDS', '1800'))
+
+# A lock older than this belongs to a drain pass that died; it is taken over
+LOCK_TTL_SECONDS = int(os.environ.get('REBUILD_LOCK_TTL_SECONDS', '3600'))
+
+# Consecutive failed builds, counted in FAILURES_BLOB_NAME, before their markers are moved under
+# DEAD_LETTER_PREFIX (outside QUEUE_PREFIX, so later passes no longer pick them up)
+REBUILD_MAX_ATTEMPTS = int(os.environ.get('REBUILD_MAX_ATTEMPTS', '5'))
+FAILURES_BLOB_NAME = 'rebuild_queue.failures.json'
+DEAD_LETTER_PREFIX = 'rebuild_dead_letter/'
+
+# Retries and deadlines of enqueue_rebuild() when the caller does not share its own GcsIO
+GCS_IO = GcsIO()
+
+DBT_PROJECT_DIR = os.environ.get(
+    'DBT_PROJECT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'xref_tables'))
+DBT_PROFILES_DIR = os.environ.get('DBT_PROFILES_DIR')
+
+# Staging models fed by each target_path (see the uris of models/raw_tables/ext_*.sql).
+# The ext_ tables wildcard every ingestion folder, so only the stg_ models need rebuilding.
+REBUILD_MODELS: Dict[str, List[str]] = {
+    'addcharge_mapping': ['stg_addcharge_mapping'],
+    'akumin_unified_payer_mapping': ['stg_akumin_unified_payer_mapping', 'stg_classification_non_pi'],
+    'commercial_non_pi_quota': [
+        'stg_ae_names', 'stg_all_quota', 'stg_all_quota_mgmt_hedge', 'stg_avg_run_rate_24_25',
+        'stg_house_acct_weekly_orders', 'stg_misc_quota', 'stg_mr_quota', 'stg_other_quota',
+        'stg_pet_quota', 'stg_quota_terr', 'stg_sites_to_terr_list', 'stg_subtotal', 'stg_zip_to_territory',
+    ],
+    'dim_data': ['stg_dim_assets', 'stg_dim_modality'],
+    'fixed_vs_adg_orders': [
+        'stg_2024_tableau_data_fw20', 'stg_2025_tableau_data_fw20', 'stg_actual_scans_from_aos',
+        'stg_same_store_weekly_orders_budget', 'stg_site_orders_24_25', 'stg_site_orders_budget_vs_act',
+        'stg_wow_region_orders_24_25', 'stg_wow_region_orders_summary', 'stg_ytd_orders_summary',
+    ],
+    'fuji_dimensions': ['stg_fuji_carriers', 'stg_fuji_sites'],
+    'npi_organization': ['stg_npi_organization'],
+    'phelix_procedure': ['stg_phelix_procedure'],
+    'trilliant_data': ['stg_trilliant_erad_ma'],
+    'zipcode_territory': ['stg_zipcode_territory'],
+    # Every state file except _ae lands under zipcode_territory/ (see config/raw_zipcode_territory.json)
+    'zipcode_territory_assignments': ['stg_zipcode_change_requests', 'stg_zipcode_territory_ae'],
+}
+
+# Used for a target_path missing from REBUILD_MODELS: rebuild every xref model rather than none
+FALLBACK_SELECTORS = ['tag:xref+']
+
+# (marker blob name, created epoch seconds, target_path)
+Marker = Tuple[str, float, str]
+
+
+def selectors_for(target_path: str) -> List[str]:
+    """Returns the dbt selectors (each model plus its downstream children) for a target_path."""
+    models = REBUILD_MODELS.get(target_path.strip('/'))
+    if not models:
+        logger.warning(f"No dbt models mapped for target_path '{target_path}'; falling back to {FALLBACK_SELECTORS}.")
+        return list(FALLBACK_SELECTORS)
+    return [f"{model}+" for model in models]
+
+
+def enqueue_rebuild(client: storage.Client, bucket_name: str, target_path: str, landed_blob_name: str,
+                    now: Optional[float] = None, gcs_io: Optional[GcsIO] = None) -> str:
+    """
+    Records that target_path received a new file. Returns the marker blob name.
+
+    The write goes through gcs_io (default: this module's GCS_IO); the marker name is unique, so a
+    retried write cannot queue the file twice.
+    """
+    stamp = time.strftime('%Y%m%d%H%M%S', time.gmtime(time.time() if now is None else now))
+    marker_name = (f"{QUEUE_PREFIX}{target_path.strip('/')}/"
+                   f"{stamp}_{uuid.uuid4().hex[:8]}_{os.path.basename(landed_blob_name)}.json")
+    body = json.dumps({'target_path': target_path, 'landed': landed_blob_name})
+    blob = client.bucket(bucket_name).blob(marker_name)
+    (gcs_io or GCS_IO).call('rebuild enqueue', lambda timeout: blob.upload_from_string(
+        body, content_type='application/json', timeout=timeout, retry=None))
+    return marker_name
+
+
+def list_markers(bucket: storage.Bucket) -> List[Marker]:
+    """Lists queued markers without downloading them (the target_path is part of the name)."""
+    markers = []
+    for blob in bucket.list_blobs(prefix=QUEUE_PREFIX):
+        relative = blob.name[len(QUEUE_PREFIX):]
+        if '/' not in relative:
+            continue
+        target_path = relative.rsplit('/', 1)[0]
+        markers.append((blob.name, blob.time_created.timestamp(), target_path))
+    return markers
+
+
+def plan_rebuild(markers: List[Marker], now: float, quiet_seconds: Optional[int] = None,
+                 max_wait_seconds: Optional[int] = None) -> Optional[Tuple[List[str], List[str]]]:
+    """
+    Decides whether the queued markers should be built now.
+
+    Returns (marker names, selectors) when the burst has gone quiet or the oldest marker has
+    waited long enough, or None to keep waiting. Selectors are de-duplicated across markers, so
+    any number of files for the same target_paths coalesce into one selection.
+    """
+    if not markers:
+        return None
+    quiet_seconds = REBUILD_QUIET_SECONDS if quiet_seconds is None else quiet_seconds
+    max_wait_seconds = REBUILD_MAX_WAIT_SECONDS if max_wait_seconds is None else max_wait_seconds
+
+    oldest = min(created for _, created, _ in markers)
+    newest = max(created for _, created, _ in markers)
+    if now - newest < quiet_seconds and now - oldest < max_wait_seconds:
+        return None
+
+    selectors: List[str] = []
+    for target_path in sorted({target for _, _, target in markers}):
+        for selector in selectors_for(target_path):
+            if selector not in selectors:
+                selectors.append(selector)
+    return [name for name, _, _ in markers], selectors
+
+
+def run_dbt_build(selectors: List[str]) -> int:
+    """Runs one `dbt build` over the selectors and returns its exit code."""
+    command = ['dbt', 'build', '--project-dir', DBT_PROJECT_DIR, '--select', *selectors]
+    if DBT_PROFILES_DIR:
+        command += ['--profiles-dir', DBT_PROFILES_DIR]
+    logger.info(f"Running: {' '.join(command)}")
+    return subprocess.run(command, check=False).returncode
+
+
+def _acquire_lock(bucket: storage.Bucket, now: float) -> Optional[int]:
+    """
+    Creates the drain lock, taking over a stale one. Returns the generation of the lock this pass
+    now holds, or None if another pass holds it.
+    """
+    lock = bucket.blob(LOCK_BLOB_NAME)
+    try:
+        lock.upload_from_string(str(now), if_generation_match=0)
+        return lock.generation
+    except gcs_exceptions.PreconditionFailed:
+        pass
+
+    lock.reload()
+    if now - lock.time_created.timestamp() < LOCK_TTL_SECONDS:
+        return None
+    logger.warning(f"Taking over stale rebuild lock created at {lock.time_created.isoformat()}.")
+    try:
+        lock.upload_from_string(str(now), if_generation_match=lock.generation)
+        return lock.generation
+    except gcs_exceptions.PreconditionFailed:
+        return None
+
+
+def _release_lock(bucket: storage.Bucket, generation: int) -> None:
+    """Deletes the lock only if it is still the one this pass created, never a pass that took it over."""
+    try:
+        bucket.blob(LOCK_BLOB_NAME).delete(if_generation_match=generation)
+    except gcs_exceptions.NotFound:
+        pass
+    except gcs_exceptions.PreconditionFailed:
+        logger.warning("The rebuild lock was taken over while dbt ran; leaving it to its new holder.")
+
+
+def _read_failures(bucket: storage.Bucket) -> int:
+    """Consecutive failed builds since the last successful one."""
+    try:
+        return json.loads(bucket.blob(FAILURES_BLOB_NAME).download_as_text())['failures']
+    except gcs_exceptions.NotFound:
+        return 0
+
+
+def _dead_letter_markers(bucket: storage.Bucket, marker_names: List[str]) -> None:
+    """Moves markers under DEAD_LETTER_PREFIX, keeping their target_path folders for replay."""
+    for name in marker_names:
+        blob = bucket.blob(name)
+        try:
+            bucket.copy_blob(blob, bucket, DEAD_LETTER_PREFIX + name[len(QUEUE_PREFIX):])
+            blob.delete()
+        except gcs_exceptions.NotFound:
+            pass
+
+
+def drain_rebuild_queue(client: storage.Client, bucket_name: str,
+                        runner: Callable[[List[str]], int] = run_dbt_build,
+                        now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    One scheduler pass: builds the queued target_paths if they are due.
+
+    Markers are deleted only after a successful build; markers that arrive while dbt runs are
+    left for the next pass. After REBUILD_MAX_ATTEMPTS consecutive failed builds, the markers of
+    the failing one are dead-lettered instead. Returns a summary dict with a 'status' of idle,
+    waiting, locked, built, failed or dead_lettered.
+    """
+    now = time.time() if now is None else now
+    bucket = client.bucket(bucket_name)
+
+    markers = list_markers(bucket)
+    plan = plan_rebuild(markers, now)
+    if plan is None:
+        return {'status': 'waiting' if markers else 'idle', 'markers': len(markers)}
+
+    lock_generation = _acquire_lock(bucket, now)
+    if lock_generation is None:
+        logger.info("Another rebuild is in progress; leaving the queue for the next pass.")
+        return {'status': 'locked', 'markers': len(markers)}
+
+    marker_names, selectors = plan
+    try:
+        logger.info(f"Rebuilding {len(selectors)} selector(s) for {len(marker_names)} queued file(s).")
+        exit_code = runner(selectors)
+        if exit_code != 0:
+            failures = _read_failures(bucket) + 1
+            summary = {'status': 'failed', 'markers': len(marker_names), 'selectors': selectors,
+                       'exit_code': exit_code, 'failures': failures}
+            if failures < REBUILD_MAX_ATTEMPTS:
+                logger.error(f"dbt build failed with exit code {exit_code} ({failures}/{REBUILD_MAX_ATTEMPTS}); "
+                             f"markers kept for retry.")
+                bucket.blob(FAILURES_BLOB_NAME).upload_from_string(
+                    json.dumps({'failures': failures}), content_type='application/json')
+                return summary
+            logger.error(f"dbt build failed {failures} times in a row; moving {len(marker_names)} marker(s) "
+                         f"to {DEAD_LETTER_PREFIX} so later uploads are rebuilt again.")
+            _dead_letter_markers(bucket, marker_names)
+            marker_names = []
+            summary['status'] = 'dead_lettered'
+        else:
+            summary = {'status': 'built', 'markers': len(marker_names), 'selectors': selectors}
+
+        for name in marker_names:
+            try:
+                bucket.blob(name).delete()
+            except gcs_exceptions.NotFound:
+                pass
+        try:
+            bucket.blob(FAILURES_BLOB_NAME).delete()
+        except gcs_exceptions.NotFound:
+            pass
+        return summary
+    finally:
+        _release_lock(bucket, lock_generation)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Run one debounced, selective dbt rebuild pass.')
+    parser.add_argument('--dry-run', action='store_true', help='Print the planned selectors without running dbt')
+    args = parser.parse_args()
+
+    if not REBUILD_QUEUE_BUCKET:
+        logger.error("REBUILD_QUEUE_BUCKET environment variable is not set.")
+        return 1
+
+    client = storage.Client()
+    if args.dry_run:
+        plan = plan_rebuild(list_markers(client.bucket(REBUILD_QUEUE_BUCKET)), time.time())
+        print(json.dumps({'due': plan is not None, 'selectors': plan[1] if plan else []}, indent=2))
+        return 0
+
+    summary = drain_rebuild_queue(client, REBUILD_QUEUE_BUCKET)
+    logger.info(f"Rebuild pass: {json.dumps(summary)}")
+    return 1 if summary['status'] in ('failed', 'dead_lettered') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
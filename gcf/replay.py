@@ -0,0 +1,518 @@
+"""
+Replays GCS finalize events through xref_processor to size instance memory and concurrency.
+
+Events come from a recorded trace or from a synthetic burst over the real config stems:
+- trace: a JSON array or newline-delimited JSON of GCS object resources / CloudEvent data
+  ({"name", "size", "timeCreated"}), CloudEvent envelopes ({"time", "data": {...}}), or Cloud Audit Log
+  entries for storage.objects.create ({"timestamp", "protoPayload": {"resourceName": ...}}).
+- synthetic: --events uploads drawn from the files named by gcf/config (one name per config, a few
+  states per partitioned config), with log-normal sizes or sizes taken from --sizes.
+
+Every distinct file name is materialized once as a synthetic CSV of its recorded (or drawn) size, with
+the config's column count (a --bad-share of the names get one column too many), in a directory-backed
+storage stand-in (local_storage.py). The events are then fed to xref_processor from --concurrency
+threads, as one Gen2 instance would run them, either at a fixed --rate or at the trace's own pace
+scaled by --speed. The report gives throughput, latency and scheduling-lag percentiles, the memory
+high-water mark and the landed / dead-lettered counts by reason code.
+
+Usage:
+    python replay.py synthetic --events 500 --rate 25 --concurrency 8
+    python replay.py trace month_end_events.jsonl --speed 4 --concurrency 8 --trace-malloc
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import glob
+import gzip
+import json
+import logging
+import math
+import os
+import random
+import resource
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+import types
+import zipfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import main
+from dead_letter_index import INDEX_PREFIX, DeadLetterIndex
+from gcs_io import GcsIO
+from local_storage import LocalStorageClient
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config')
+
+# Bucket names used inside the storage stand-in (as in deploy.sh)
+REPLAY_CONFIG_BUCKET = 'xref-config'
+REPLAY_DEAD_LETTER_BUCKET = 'xref-dead-letter'
+
+# Synthetic size distribution: log-normal around the median, capped
+DEFAULT_MEDIAN_KB = 256
+DEFAULT_SIZE_SIGMA = 1.0
+DEFAULT_MAX_MB = 64
+
+# Partitioned configs get this many state files each
+DEFAULT_STATES = 5
+STATE_CODES = ['al', 'ak', 'az', 'ar', 'ca', 'co', 'ct', 'de', 'fl', 'ga', 'hi', 'id', 'il', 'in', 'ia',
+               'ks', 'ky', 'la', 'me', 'md', 'ma', 'mi', 'mn', 'ms', 'mo', 'mt', 'ne', 'nv', 'nh', 'nj',
+               'nm', 'ny', 'nc', 'nd', 'oh', 'ok', 'or', 'pa', 'ri', 'sc', 'sd', 'tn', 'tx', 'ut', 'vt',
+               'va', 'wa', 'wv', 'wi', 'wy']
+
+# Rows generated once per file and repeated up to its size
+SYNTHETIC_BLOCK_ROWS = 512
+
+# Module attributes of main swapped for the duration of a replay
+PATCHED_ATTRIBUTES = ('STORAGE_CLIENT', 'CONFIG_BUCKET', 'DEAD_LETTER_BUCKET', 'REBUILD_QUEUE_BUCKET',
+                      'DEAD_LETTER_INDEX', 'GCS_IO')
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """RFC 3339 timestamp (nanosecond precision allowed) to epoch seconds; None when missing or invalid."""
+    if not value or not isinstance(value, str):
+        return None
+    text = value.strip().replace('Z', '+00:00')
+    if '.' in text:
+        head, _, tail = text.partition('.')
+        digits = len(tail) - len(tail.lstrip('0123456789'))
+        text = f"{head}.{tail[:min(digits, 6)]}{tail[digits:]}"
+    try:
+        parsed = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+
+def event_from_record(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Normalizes one trace record to {'name', 'size', 'time'}.
+
+    Returns None for records that are not landing-zone object finalizations.
+    """
+    if 'protoPayload' in record:
+        payload = record['protoPayload'] or {}
+        method = payload.get('methodName', 'storage.objects.create')
+        bucket, _, name = payload.get('resourceName', '').partition('/objects/')
+        if method != 'storage.objects.create' or not name:
+            return None
+        if bucket.rsplit('/', 1)[-1] != main.LANDING_ZONE_BUCKET:
+            return None
+        return {'name': name, 'size': None, 'time': parse_timestamp(record.get('timestamp'))}
+
+    data = record.get('data') if isinstance(record.get('data'), dict) else record
+    if not data.get('name') or data.get('bucket', main.LANDING_ZONE_BUCKET) != main.LANDING_ZONE_BUCKET:
+        return None
+    size = data.get('size')
+    return {
+        'name': data['name'],
+        'size': int(size) if size not in (None, '') else None,
+        'time': parse_timestamp(record.get('time') or data.get('timeCreated') or data.get('updated')),
+    }
+
+
+def load_trace(path: str) -> List[Dict[str, Any]]:
+    """Reads a trace and returns its events in time order, with 'offset' seconds from the first one."""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    stripped = text.lstrip()
+    records = json.loads(stripped) if stripped.startswith('[') else \
+        [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    events = [event for event in map(event_from_record, records) if event]
+    timed = all(event['time'] is not None for event in events)
+    if timed:
+        events.sort(key=lambda event: event['time'])
+    start = events[0]['time'] if events and timed else None
+    for event in events:
+        event['offset'] = event['time'] - start if timed else None
+    logger.info(f"Loaded {len(events)} landing-zone events from {path} ({len(records)} records)")
+    return events
+
+
+def load_configs(config_dir: str = CONFIG_DIR) -> Dict[str, Dict[str, Any]]:
+    """Config stem -> config rules for every gcf/config/*.json."""
+    configs = {}
+    for path in sorted(glob.glob(os.path.join(config_dir, '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            configs[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+    return configs
+
+
+def config_for(configs: Dict[str, Dict[str, Any]], name: str) -> Optional[Dict[str, Any]]:
+    """The config xref_processor would resolve for a file name (including the partitioned fallback)."""
+    stem, _ = main.split_dataset_name(name)
+    if stem in configs:
+        return configs[stem]
+    fallback = configs.get(stem.rsplit('_', 1)[0]) if '_' in stem else None
+    return fallback if fallback and fallback.get('partition_regex') else None
+
+
+def synthetic_names(configs: Dict[str, Dict[str, Any]], rng: random.Random, states: int = DEFAULT_STATES,
+                    compressed_share: float = 0.0) -> List[str]:
+    """One landing-zone file name per config, and `states` names per partitioned config."""
+    names = []
+    for stem, config in sorted(configs.items()):
+        if config.get('partition_regex'):
+            candidates = [code for code in STATE_CODES if f"{stem}_{code}" not in configs]
+            bases = [f"{stem}_{code}" for code in rng.sample(candidates, min(states, len(candidates)))]
+        else:
+            bases = [stem]
+        for base in bases:
+            extension = '.csv'
+            if rng.random() < compressed_share:
+                allowed = [ext for ext in ('.csv.gz', '.zip') if main.matches_filename_pattern(base + ext, config['filename_pattern'])]
+                extension = rng.choice(allowed) if allowed else extension
+            names.append(base + extension)
+    return names
+
+
+def synthetic_events(configs: Dict[str, Dict[str, Any]], count: int, seed: int = 0,
+                     states: int = DEFAULT_STATES, compressed_share: float = 0.0) -> List[Dict[str, Any]]:
+    """A burst of `count` uploads drawn uniformly from the synthetic file names (sizes are drawn later)."""
+    rng = random.Random(seed)
+    names = synthetic_names(configs, rng, states, compressed_share)
+    return [{'name': rng.choice(names), 'size': None, 'time': None, 'offset': None} for _ in range(count)]
+
+
+def _synthetic_rows(columns: int, rng: random.Random) -> List[List[str]]:
+    """A block of CSV rows mixing integers, decimals, codes and empty fields."""
+    kinds = [rng.choice(('int', 'decimal', 'code', 'text')) for _ in range(columns)]
+    rows = []
+    for i in range(SYNTHETIC_BLOCK_ROWS):
+        fields = []
+        for kind in kinds:
+            if rng.random() < 0.05:
+                fields.append('')
+            elif kind == 'int':
+                fields.append(str(rng.randint(0, 99999)))
+            elif kind == 'decimal':
+                fields.append(f"{rng.uniform(-1000, 1000):.2f}")
+            elif kind == 'code':
+                fields.append(rng.choice(STATE_CODES).upper() + str(rng.randint(100, 999)))
+            else:
+                fields.append(f"\"Site {i % 97}, Suite {rng.randint(1, 40)}\"")
+        rows.append(fields)
+    return rows
+
+
+def synthetic_header(columns: int, key_columns: Optional[List[Any]] = None) -> Tuple[List[str], List[int]]:
+    """
+    Header names (col_<n>) and the 0-based key positions for a config's key_columns: positions are
+    kept, named keys take the first free columns under their own names.
+    """
+    names = [f"col_{i + 1}" for i in range(columns)]
+    positions = [column - 1 for column in key_columns or [] if isinstance(column, int) and 0 < column <= columns]
+    free = (i for i in range(columns) if i not in positions)
+    for column in key_columns or []:
+        if not isinstance(column, int):
+            position = next(free, None)
+            if position is not None:
+                names[position] = str(column)
+                positions.append(position)
+    return names, positions
+
+
+def write_synthetic_file(client: LocalStorageClient, name: str, columns: int, size: int,
+                         banner_rows: int = 0, seed: int = 0, key_columns: Optional[List[Any]] = None) -> int:
+    """
+    Writes a synthetic CSV of about `size` uncompressed bytes to the landing zone, gzip or zip compressed
+    per the extension. Key columns get a unique value per row. Returns the stored object size.
+    """
+    rng = random.Random(f"{seed}:{name}")
+    blob = client.bucket(main.LANDING_ZONE_BUCKET).blob(name)
+    block = _synthetic_rows(columns, rng)
+    with contextlib.ExitStack() as stack:
+        target = stack.enter_context(blob.open('wb'))
+        if name.lower().endswith('.gz'):
+            target = stack.enter_context(gzip.GzipFile(fileobj=target, mode='wb', compresslevel=1))
+        elif name.lower().endswith('.zip'):
+            archive = stack.enter_context(zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED))
+            member = os.path.basename(name)[:-len('.zip')] + '.csv'
+            target = stack.enter_context(archive.open(member, 'w', force_zip64=True))
+
+        written = 0
+        for i in range(banner_rows):
+            line = f"Report generated for {name} page {i + 1}\n".encode()
+            target.write(line)
+            written += len(line)
+        names, key_positions = synthetic_header(columns, key_columns)
+        header = (','.join(names) + '\n').encode()
+        target.write(header)
+        written += len(header)
+        encoded = [(','.join(row) + '\n').encode() for row in block]
+        row_number = 0
+        while written < size:
+            row_number += 1
+            if key_positions:
+                fields = list(block[row_number % len(block)])
+                for position in key_positions:
+                    fields[position] = f"K{row_number}"
+                line = (','.join(fields) + '\n').encode()
+            else:
+                line = encoded[row_number % len(encoded)]
+            target.write(line)
+            written += len(line)
+    blob.reload()
+    return blob.size
+
+
+def materialize(client: LocalStorageClient, events: List[Dict[str, Any]], configs: Dict[str, Dict[str, Any]],
+                seed: int = 0, sizes: Optional[Dict[str, int]] = None, median_kb: float = DEFAULT_MEDIAN_KB,
+                sigma: float = DEFAULT_SIZE_SIGMA, max_mb: float = DEFAULT_MAX_MB,
+                bad_share: float = 0.0) -> Dict[str, int]:
+    """
+    Writes one landing-zone object per distinct file name and fills in each event's 'size' with it.
+
+    A name's size is the largest recorded for it, else sizes[stem], else a log-normal draw. Names
+    without a config get three columns (they dead-letter as config_not_found, as in production).
+    Returns name -> stored object size.
+    """
+    rng = random.Random(seed)
+    wanted: Dict[str, Optional[int]] = {}
+    for event in events:
+        wanted[event['name']] = max(filter(None, [wanted.get(event['name']), event['size']]), default=None)
+
+    stored = {}
+    for name in sorted(wanted):
+        stem, _ = main.split_dataset_name(name)
+        size = wanted[name] or (sizes or {}).get(stem) or \
+            int(median_kb * 1024 * math.exp(rng.gauss(0, sigma)))
+        size = max(1024, min(size, int(max_mb * 1024 * 1024)))
+        config = config_for(configs, name)
+        columns = config['expected_columns'] if config else 3
+        if config and rng.random() < bad_share:
+            columns += 1
+        stored[name] = write_synthetic_file(client, name, columns, size, (config or {}).get('banner_rows', 0),
+                                            seed, (config or {}).get('key_columns'))
+
+    for event in events:
+        event['size'] = stored[event['name']]
+    logger.info(f"Materialized {len(stored)} files ({sum(stored.values()) / 1024 / 1024:.1f} MB stored)")
+    return stored
+
+
+def upload_configs(client: LocalStorageClient, configs: Dict[str, Dict[str, Any]]) -> None:
+    bucket = client.bucket(REPLAY_CONFIG_BUCKET)
+    for stem, config in configs.items():
+        bucket.blob(f"{main.CONFIG_FOLDER}{stem}.json").upload_from_string(json.dumps(config))
+
+
+@contextlib.contextmanager
+def local_processor(client: LocalStorageClient) -> Iterator[None]:
+    """Points xref_processor at the storage stand-in (rebuild queueing off) and restores it afterwards."""
+    saved = {name: getattr(main, name) for name in PATCHED_ATTRIBUTES}
+    main.STORAGE_CLIENT = client
+    main.CONFIG_BUCKET = REPLAY_CONFIG_BUCKET
+    main.DEAD_LETTER_BUCKET = REPLAY_DEAD_LETTER_BUCKET
+    main.REBUILD_QUEUE_BUCKET = None
+    main.DEAD_LETTER_INDEX = DeadLetterIndex()
+    main.GCS_IO = GcsIO()
+    main.clear_config_cache()
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(main, name, value)
+        main.clear_config_cache()
+
+
+def percentiles(values: Iterable[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank p50/p90/p99, max and mean, rounded to milliseconds."""
+    ordered = sorted(values)
+    if not ordered:
+        return {'p50': None, 'p90': None, 'p99': None, 'max': None, 'mean': None}
+
+    def rank(p: float) -> float:
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    return {
+        'p50': round(rank(50), 3),
+        'p90': round(rank(90), 3),
+        'p99': round(rank(99), 3),
+        'max': round(ordered[-1], 3),
+        'mean': round(sum(ordered) / len(ordered), 3),
+    }
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def count_outcomes(client: LocalStorageClient) -> Dict[str, Any]:
+    """
+    Landed objects and dead-letter records (by reason code) found in the storage stand-in.
+
+    Uploads of one name within the same second land on the same ingestion_timestamp= object, so
+    landed_objects can be lower than the number of events that landed.
+    """
+    landed = [blob for blob in client.list_blobs(main.EXTERNAL_TABLES_BUCKET)
+              if not blob.name.endswith((main.STATS_SUFFIX, main.DELTA_SUFFIX))]
+    reasons: Dict[str, int] = {}
+    for blob in client.list_blobs(REPLAY_DEAD_LETTER_BUCKET, prefix=INDEX_PREFIX):
+        for line in blob.download_as_text().splitlines():
+            if line.strip():
+                code = json.loads(line)['reason_code']
+                reasons[code] = reasons.get(code, 0) + 1
+    return {
+        'landed_objects': len(landed),
+        'landed_mb': round(sum(blob.size for blob in landed) / 1024 / 1024, 2),
+        'dead_lettered': sum(reasons.values()),
+        'dead_letter_reasons': dict(sorted(reasons.items())),
+    }
+
+
+def run_replay(client: LocalStorageClient, events: List[Dict[str, Any]], concurrency: int = 8,
+               rate: float = 0.0, speed: float = 0.0, trace_malloc: bool = False) -> Dict[str, Any]:
+    """
+    Dispatches the events to xref_processor from `concurrency` threads and returns the report.
+
+    Event i is due at i / rate seconds with a rate, at offset / speed with a speed and a timed trace,
+    and immediately otherwise. Scheduling lag is how late an event started after it was due, so a
+    growing lag means the instance could not keep up.
+    """
+    latencies: List[float] = []
+    lags: List[float] = []
+    errors = []
+    results_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(concurrency)
+
+    def due_at(index: int, event: Dict[str, Any]) -> float:
+        if rate > 0:
+            return index / rate
+        if speed > 0 and event.get('offset') is not None:
+            return event['offset'] / speed
+        return 0.0
+
+    def process(index: int, event: Dict[str, Any], due: float) -> None:
+        started = time.perf_counter()
+        cloud_event = types.SimpleNamespace(data={
+            'bucket': main.LANDING_ZONE_BUCKET, 'name': event['name'],
+            'size': str(event['size']), 'generation': str(1_000_000 + index)})
+        try:
+            main.xref_processor(cloud_event)
+        except Exception as e:
+            with results_lock:
+                errors.append(f"{event['name']}: {e}")
+        finally:
+            elapsed = time.perf_counter() - started
+            with results_lock:
+                latencies.append(elapsed)
+                lags.append(max(0.0, started - run_start - due))
+            slots.release()
+
+    baseline_rss = _max_rss_mb()
+    if trace_malloc:
+        tracemalloc.start()
+    with local_processor(client):
+        run_start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for index, event in enumerate(events):
+                due = due_at(index, event)
+                delay = run_start + due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                # Like one instance at --concurrency: an event waits for a free request slot
+                slots.acquire()
+                executor.submit(process, index, event, due)
+        wall_seconds = time.perf_counter() - run_start
+        main.flush_dead_letter_index()
+    traced_peak = None
+    if trace_malloc:
+        traced_peak = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+
+    total_bytes = sum(event['size'] for event in events)
+    report = {
+        'events': len(events),
+        'concurrency': concurrency,
+        'rate': rate or None,
+        'speed': speed or None,
+        'wall_seconds': round(wall_seconds, 3),
+        'throughput_events_per_second': round(len(events) / wall_seconds, 2) if wall_seconds else None,
+        'throughput_mb_per_second': round(total_bytes / 1024 / 1024 / wall_seconds, 2) if wall_seconds else None,
+        'input_mb': round(total_bytes / 1024 / 1024, 2),
+        'latency_seconds': percentiles(latencies),
+        'schedule_lag_seconds': percentiles(lags),
+        'memory': {
+            'baseline_max_rss_mb': baseline_rss,
+            'max_rss_mb': _max_rss_mb(),
+            'traced_peak_mb': traced_peak,
+        },
+        'errors': errors,
+    }
+    report.update(count_outcomes(client))
+    report['landed'] = len(events) - report['dead_lettered'] - len(errors)
+    return report
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description='Replay GCS finalize events through xref_processor.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    trace = subparsers.add_parser('trace', help='Replay a recorded trace of finalize events')
+    trace.add_argument('path')
+    synthetic = subparsers.add_parser('synthetic', help='Replay a synthetic burst over the config stems')
+    synthetic.add_argument('--events', type=int, default=200)
+    synthetic.add_argument('--states', type=int, default=DEFAULT_STATES,
+                           help='State files per partitioned config')
+    synthetic.add_argument('--compressed-share', type=float, default=0.3,
+                           help='Share of names uploaded as .csv.gz/.zip where the pattern allows it')
+    for command in (trace, synthetic):
+        command.add_argument('--config-dir', default=CONFIG_DIR)
+        command.add_argument('--concurrency', type=int, default=8, help='Concurrent requests (as deployed)')
+        command.add_argument('--rate', type=float, default=0.0, help='Events per second (0: as fast as possible)')
+        command.add_argument('--speed', type=float, default=0.0,
+                             help='Replay a timed trace at this multiple of its recorded pace')
+        command.add_argument('--sizes', help='JSON file of stem -> bytes for files without a recorded size')
+        command.add_argument('--median-kb', type=float, default=DEFAULT_MEDIAN_KB)
+        command.add_argument('--sigma', type=float, default=DEFAULT_SIZE_SIGMA)
+        command.add_argument('--max-mb', type=float, default=DEFAULT_MAX_MB)
+        command.add_argument('--bad-share', type=float, default=0.0,
+                             help='Share of file names generated with a wrong column count')
+        command.add_argument('--seed', type=int, default=0)
+        command.add_argument('--storage-root', help='Directory for the storage stand-in (default: a temp dir)')
+        command.add_argument('--keep', action='store_true', help='Keep the storage directory afterwards')
+        command.add_argument('--trace-malloc', action='store_true',
+                             help='Also report the tracemalloc peak (slows the replay)')
+        command.add_argument('--log-level', default='ERROR', help='Log level while replaying')
+    args = parser.parse_args()
+
+    configs = load_configs(args.config_dir)
+    if args.command == 'trace':
+        events = load_trace(args.path)
+    else:
+        events = synthetic_events(configs, args.events, args.seed, args.states, args.compressed_share)
+    if not events:
+        logger.error("No landing-zone events to replay.")
+        return 1
+
+    sizes = None
+    if args.sizes:
+        with open(args.sizes, 'r', encoding='utf-8') as f:
+            sizes = {stem: int(size) for stem, size in json.load(f).items()}
+
+    client = LocalStorageClient(args.storage_root)
+    try:
+        upload_configs(client, configs)
+        materialize(client, events, configs, args.seed, sizes, args.median_kb, args.sigma, args.max_mb,
+                    args.bad_share)
+        logging.getLogger().setLevel(args.log_level.upper())
+        report = run_replay(client, events, args.concurrency, args.rate, args.speed, args.trace_malloc)
+    finally:
+        if not args.keep:
+            shutil.rmtree(client.root, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
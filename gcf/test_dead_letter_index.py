@@ -0,0 +1,80 @@
+import json
+from unittest import mock
+
+import pytest
+from google.api_core import exceptions as gcs_exceptions
+
+from dead_letter_index import DeadLetterIndex, error_record, INDEX_PREFIX, COLUMN_COUNT_MISMATCH
+from gcs_io import GcsIO
+
+# 2026-01-05T10:00:00Z
+NOW = 1767607200.0
+
+
+def make_record(name):
+    return error_record(name, f"{name}.csv", f"error/20260105100000_{name}.csv", COLUMN_COUNT_MISMATCH,
+                        'Column count mismatch.', 3, 5, '120', '1767607200000001', now=NOW)
+
+
+def test_burst_is_written_as_one_batch():
+    """A burst of failures is buffered and written as a single NDJSON object."""
+    index = DeadLetterIndex(batch_size=3, flush_seconds=600)
+    client = mock.Mock()
+    upload = client.bucket.return_value.blob.return_value.upload_from_string
+
+    assert index.add(make_record('a')) is False
+    assert index.add(make_record('b')) is False
+    assert index.add(make_record('c')) is True
+
+    object_name = index.flush(client, 'xref-dead-letter')
+    assert object_name.startswith(f"{INDEX_PREFIX}dt=2026-01-05/20260105T100000_")
+    assert object_name.endswith('.ndjson')
+    upload.assert_called_once()
+    lines = upload.call_args[0][0].splitlines()
+    assert [json.loads(line)['stem'] for line in lines] == ['a', 'b', 'c']
+    assert json.loads(lines[0])['generation'] == 1767607200000001
+    assert len(index) == 0
+    assert index.flush(client, 'xref-dead-letter') is None
+
+
+def test_quiet_buffer_becomes_due_after_flush_seconds():
+    """A lone record is written once it has waited flush_seconds, not held until the batch fills."""
+    clock = mock.Mock(return_value=100.0)
+    index = DeadLetterIndex(batch_size=25, flush_seconds=30, clock=clock)
+
+    assert index.add(make_record('a')) is False
+    clock.return_value = 129.0
+    assert index.due() is False
+    clock.return_value = 130.0
+    assert index.due() is True
+
+
+def test_failed_write_keeps_records():
+    """Records survive a failed write and go out with the next flush."""
+    index = DeadLetterIndex(batch_size=1, flush_seconds=30)
+    client = mock.Mock()
+    upload = client.bucket.return_value.blob.return_value.upload_from_string
+    upload.side_effect = [RuntimeError('503'), None]
+
+    index.add(make_record('a'))
+    with pytest.raises(RuntimeError):
+        index.flush(client, 'xref-dead-letter')
+    index.add(make_record('b'))
+    assert len(index) == 2
+
+    index.flush(client, 'xref-dead-letter')
+    assert [json.loads(line)['stem'] for line in upload.call_args[0][0].splitlines()] == ['a', 'b']
+
+
+def test_transient_write_error_is_retried():
+    """A 503 on the index write is retried through GcsIO within the same flush."""
+    index = DeadLetterIndex(batch_size=1, flush_seconds=30)
+    client = mock.Mock()
+    upload = client.bucket.return_value.blob.return_value.upload_from_string
+    upload.side_effect = [gcs_exceptions.ServiceUnavailable('busy'), None]
+
+    index.add(make_record('a'))
+    assert index.flush(client, 'xref-dead-letter', GcsIO(sleep=lambda seconds: None))
+    assert upload.call_count == 2
+    assert upload.call_args.kwargs['retry'] is None
+    assert len(index) == 0
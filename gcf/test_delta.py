@@ -0,0 +1,52 @@
+import io
+import json
+import os
+
+import pytest
+
+from delta import HeaderChanged, sorted_by_key, write_delta
+from key_check import SpillLimitExceeded
+
+
+def test_delta_lists_inserted_updated_and_deleted_rows():
+    previous = [['Zip', 'Territory', 'State'], ['10001', 'T1', 'NY'], ['10002', 'T1', 'NY'], ['10003', 'T2', 'NY'],
+                ['', '', '']]
+    current = [['zip', 'territory', 'state'], ['10003', 'T2', 'NY'], ['10001', 'T9'], ['10004', 'T3', 'NJ']]
+    target = io.StringIO()
+
+    counts = write_delta(previous, current, [0], target)
+
+    assert counts == {'insert': 1, 'update': 1, 'delete': 1}
+    changes = [json.loads(line) for line in target.getvalue().splitlines()]
+    assert changes == [
+        {'op': 'update', 'key': {'zip': '10001'}, 'row': {'zip': '10001', 'territory': 'T9', 'state': ''},
+         'previous': {'zip': '10001', 'territory': 'T1', 'state': 'NY'}},
+        {'op': 'delete', 'key': {'zip': '10002'}, 'row': {'zip': '10002', 'territory': 'T1', 'state': 'NY'}},
+        {'op': 'insert', 'key': {'zip': '10004'}, 'row': {'zip': '10004', 'territory': 'T3', 'state': 'NJ'}},
+    ]
+
+    with pytest.raises(HeaderChanged):
+        write_delta([['zip', 'territory']], [['zip', 'region']], [0], io.StringIO())
+
+
+def test_external_sort_spills_runs_and_cleans_up(tmp_path):
+    """Beyond the memory budget rows are sorted in spilled runs and merged; the order is the same."""
+    rows = [[f"{(i * 7919) % 5000:05d}", f"v{i}"] for i in range(5000)]
+    merged = list(sorted_by_key(iter(rows), [0], 2, spill_dir=str(tmp_path), memory_mb=0.05))
+
+    assert [key for key, _ in merged] == sorted(row[0] for row in rows)
+    assert os.listdir(tmp_path) == []
+
+
+def test_spilled_runs_are_capped(tmp_path):
+    """The runs of both files share one spill cap; passing it raises SpillLimitExceeded and removes the runs."""
+    previous = [['code', 'v']] + [[f"{i:05d}", 'a'] for i in range(2000)]
+    current = [['code', 'v']] + [[f"{i:05d}", 'b'] for i in range(2000)]
+    with pytest.raises(SpillLimitExceeded):
+        write_delta(previous, current, [0], io.StringIO(), spill_dir=str(tmp_path), memory_mb=0.01, max_spill_mb=0.05)
+    assert os.listdir(tmp_path) == []
+
+    target = io.StringIO()
+    assert write_delta(previous, current, [0], target, spill_dir=str(tmp_path), memory_mb=0.01,
+                       max_spill_mb=1)['update'] == 2000
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,24 @@
+from file_stats import FileStats, HyperLogLog
+
+
+def test_hyperloglog_estimates_within_a_few_percent():
+    for cardinality in (10, 1000, 50000):
+        sketch = HyperLogLog()
+        for i in range(cardinality):
+            sketch.add(f"value-{i}")
+            sketch.add(f"value-{i}")  # duplicates do not count
+        assert abs(sketch.estimate() - cardinality) <= max(1, cardinality * 0.05)
+
+
+def test_file_stats_nulls_min_max_and_jagged_rows():
+    stats = FileStats()
+    stats.add_rows([['\ufeffid', 'amount', 'label'], ['1', '2.5', 'a'], ['2', '-1', ''], ['3', 'n/a']])
+    result = stats.to_dict('shared_data/x.csv')
+    assert result['rows'] == 3
+    ident, amount, label = result['columns']
+    assert ident['name'] == 'id'
+    assert (ident['min'], ident['max'], ident['approx_distinct']) == (1, 3, 3)
+    # One unparsable value makes the column non-numeric
+    assert (amount['numeric'], amount['min'], amount['max']) == (False, None, None)
+    # Empty and missing trailing fields are NULL
+    assert (label['null_count'], label['numeric']) == (2, False)
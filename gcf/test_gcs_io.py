@@ -0,0 +1,106 @@
+import threading
+
+import pytest
+from google.api_core import exceptions as gcs_exceptions
+
+from gcs_io import CircuitBreaker, CircuitOpenError, GcsIO, StorageUnavailable, backoff_delay, is_retryable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_io(clock, **kwargs):
+    breaker = CircuitBreaker(threshold=kwargs.pop('threshold', 3), reset_seconds=30, clock=clock)
+    return GcsIO(deadline_seconds=kwargs.pop('deadline_seconds', 30), max_attempts=kwargs.pop('max_attempts', 5),
+                 hedge_after=0, breaker=breaker, sleep=clock.sleep, clock=clock, **kwargs)
+
+
+def flaky(failures, error_factory=lambda: gcs_exceptions.ServiceUnavailable('busy')):
+    calls = []
+
+    def func(timeout):
+        calls.append(timeout)
+        if len(calls) <= failures:
+            raise error_factory()
+        return 'ok'
+
+    return func, calls
+
+
+def test_transient_errors_are_retried_with_bounded_jittered_backoff():
+    clock = FakeClock()
+    func, calls = flaky(2)
+    assert make_io(clock).call('config read', func) == 'ok'
+    assert len(calls) == 3
+    assert 0 <= clock.now <= 0.2 + 0.4
+
+    assert backoff_delay(10, base=0.2, cap=5, rng=lambda low, high: high) == 5
+    assert is_retryable(ConnectionResetError()) and is_retryable(gcs_exceptions.TooManyRequests('slow down'))
+    assert not is_retryable(gcs_exceptions.NotFound('gone')) and not is_retryable(ValueError('bad file'))
+
+
+def test_non_retryable_errors_fail_at_once_and_exhaustion_raises_storage_unavailable():
+    clock = FakeClock()
+    gcs = make_io(clock, threshold=100)
+    func, calls = flaky(1, lambda: gcs_exceptions.Forbidden('denied'))
+    with pytest.raises(gcs_exceptions.Forbidden):
+        gcs.call('copy', func)
+    assert len(calls) == 1
+
+    func, calls = flaky(100)
+    with pytest.raises(StorageUnavailable):
+        gcs.call('copy', func)
+    assert len(calls) == 5
+
+    # The deadline bounds the attempts too: every attempt gets at most the time left
+    func, calls = flaky(100, lambda: TimeoutError('read timed out'))
+    with pytest.raises(StorageUnavailable):
+        make_io(FakeClock(), deadline_seconds=0.5, max_attempts=50).call('copy', func)
+    assert all(timeout <= 0.5 for timeout in calls)
+
+
+def test_circuit_breaker_fails_fast_then_lets_one_trial_through():
+    clock = FakeClock()
+    gcs = make_io(clock, max_attempts=3, threshold=3)
+    failing, _ = flaky(100)
+    with pytest.raises(StorageUnavailable):
+        gcs.call('copy', failing)
+    assert gcs.breaker.state == 'open'
+
+    healthy, calls = flaky(0)
+    with pytest.raises(CircuitOpenError):
+        gcs.call('config read', healthy)
+    assert calls == []
+
+    clock.now += 30
+    assert gcs.breaker.state == 'half_open'
+    assert gcs.call('config read', healthy) == 'ok'
+    assert gcs.breaker.state == 'closed'
+
+
+def test_hedged_read_returns_the_first_answer():
+    release = threading.Event()
+    calls = []
+
+    def read(timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            # The first request is stuck; the hedged one answers
+            release.wait(5)
+            return 'slow'
+        return 'fast'
+
+    gcs = GcsIO(hedge_after=0.05)
+    try:
+        assert gcs.call('header probe', read, hedge=True) == 'fast'
+        assert gcs.hedged_requests == 1
+    finally:
+        release.set()
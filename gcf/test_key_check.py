@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from key_check import DuplicateKeysError, KeyUniquenessCheck, SpillLimitExceeded
+
+
+def test_duplicates_are_reported_with_sample_keys():
+    check = KeyUniquenessCheck([0, 2], ['zip', 'state'])
+    check.add_rows([['zip', 'territory', 'state'], ['10001', 'T1', 'NY'], ['', '', ''], ['10001', 'T2', 'NJ'],
+                    [' 10001 ', 'T3', 'NY'], ['10002', 'T1']])
+    with pytest.raises(DuplicateKeysError) as raised:
+        check.finish()
+    assert raised.value.duplicates == 1
+    assert raised.value.samples == ['10001 | NY']
+    assert 'Key (zip, state) is not unique: 1 duplicate row(s)' in str(raised.value)
+    assert check.rows == 4 and not check.spilled
+
+
+def test_spilled_check_is_exact_and_cleans_up(tmp_path):
+    """Beyond the memory budget keys spill to hash partitions on disk; the result is the same."""
+    rows = [['id', 'name']] + [[str(i), f"n{i}"] for i in range(20000)]
+    rows += [['17', 'again'], ['19999', 'again'], ['17', 'third']]
+
+    check = KeyUniquenessCheck([0], memory_mb=0.05, spill_dir=str(tmp_path), partitions=8).add_rows(rows)
+    assert check.spilled and len(check._seen) == 0
+    with pytest.raises(DuplicateKeysError) as raised:
+        check.finish()
+    assert raised.value.duplicates == 3
+    assert sorted(raised.value.samples) == ['17', '19999']
+    assert os.listdir(tmp_path) == []
+
+    unique = KeyUniquenessCheck([0], memory_mb=0.05, spill_dir=str(tmp_path), partitions=8)
+    assert unique.add_rows(rows[:-3]).finish().duplicates == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_heavily_repeated_key_in_spill_mode(tmp_path):
+    """One key repeated far beyond the budget is still checked without splitting forever."""
+    rows = [['id'], ['a'], ['b']] + [['same']] * 3000
+    check = KeyUniquenessCheck([0], memory_mb=0, spill_dir=str(tmp_path), partitions=4).add_rows(rows)
+    assert check.spilled
+    with pytest.raises(DuplicateKeysError) as raised:
+        check.finish()
+    assert (raised.value.duplicates, raised.value.samples) == (2999, ['same'])
+
+
+def test_spill_is_capped(tmp_path):
+    """Spill files count against max_spill_mb; passing it raises SpillLimitExceeded and close() cleans up."""
+    rows = [['id']] + [[str(i)] for i in range(20000)]
+    check = KeyUniquenessCheck([0], memory_mb=0.05, spill_dir=str(tmp_path), partitions=8, max_spill_mb=0.1)
+    with pytest.raises(SpillLimitExceeded):
+        check.add_rows(rows)
+    check.close()
+    assert os.listdir(tmp_path) == []
+
+    # Within the cap the spilled check completes and returns every byte
+    check = KeyUniquenessCheck([0], memory_mb=0.05, spill_dir=str(tmp_path), partitions=8, max_spill_mb=1)
+    assert check.add_rows(rows).finish().duplicates == 0
+    assert check.spill_budget.used == 0
@@ -1,12 +1,24 @@
 import pytest
 from unittest import mock
+import gzip
+import io
 import json
 import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+from google.api_core import exceptions as gcs_exceptions
 from google.cloud import storage
 
+from dead_letter_index import DeadLetterIndex
+from gcs_io import GcsIO, StorageUnavailable
+
 # Import the main GCF functions and constants
-from main import xref_processor, LANDING_ZONE_BUCKET, EXTERNAL_TABLES_BUCKET, DEAD_LETTER_BUCKET
+import main
+from main import (xref_processor, normalize_csv_rows, split_dataset_name, read_header_sample,
+                  header_fingerprint, stage_blob, clear_config_cache, StagingLimitExceeded, LANDING_ZONE_BUCKET, EXTERNAL_TABLES_BUCKET, DEAD_LETTER_BUCKET)
 
 # --- Fixtures for Mock Data and Environment Setup ---
 
@@ -67,6 +79,15 @@ def mock_env_variables(monkeypatch):
     monkeypatch.setattr('main.os.path.isdir', lambda x: False)
     monkeypatch.setattr('main.os.makedirs', lambda x, exist_ok: None)
 
+    # 3. Each test provides its own configs
+    clear_config_cache()
+
+    # 4. Each test starts with an empty dead-letter record buffer
+    monkeypatch.setattr('main.DEAD_LETTER_INDEX', DeadLetterIndex())
+
+    # 5. ... and a closed GCS circuit breaker, without real sleeps between retries
+    monkeypatch.setattr('main.GCS_IO', GcsIO(sleep=lambda seconds: None))
+
 
 # --- Tests ---
 
@@ -79,6 +100,7 @@ def test_successful_ingestion(mock_read_csv, mock_storage_client, mock_copy_blob
     # Setup mocks:
     mock_read_csv.return_value = mock.Mock(columns=['A', 'B', 'C']) # 3 columns (matches config)
     mock_storage_client.bucket.return_value.blob.return_value.download_as_text.return_value = mock_config_data
+    mock_storage_client.bucket.return_value.blob.return_value.download_as_bytes.return_value = b'A,B,C\n1,2,3\n'
     
     xref_processor(gcf_event_success)
     
@@ -105,6 +127,7 @@ def test_column_mismatch_to_dead_letter(mock_read_csv, mock_storage_client, mock
     # Setup mocks: 
     mock_read_csv.return_value = mock.Mock(columns=['A', 'B', 'C', 'D', 'E']) # 5 columns (config expects 3)
     mock_storage_client.bucket.return_value.blob.return_value.download_as_text.return_value = mock_config_data
+    mock_storage_client.bucket.return_value.blob.return_value.download_as_bytes.return_value = b'A,B,C\n1,2,3\n'
     
     xref_processor(gcf_event_mismatch)
     
@@ -148,4 +171,789 @@ def test_config_not_found_to_dead_letter(mock_read_csv, mock_storage_client, moc
     # 3. Assert the destination argument passed was the Dead Letter Bucket
     target_bucket_name_arg = mock_copy_blob.call_args[0][2]
     # Assert against the known string literal value
-    assert target_bucket_name_arg == 'xref-dead-letter'
\ No newline at end of file
+    assert target_bucket_name_arg == 'xref-dead-letter'
+
+
+def test_normalize_csv_rows():
+    """Banner rows are dropped, jagged rows padded and quoted newlines escaped."""
+    source = io.StringIO(
+        'Site Orders Report,,\n'
+        'site,region,notes\n'
+        'A,East,"line one\nline two"\n'
+        'B,West\n'
+    )
+    target = io.StringIO()
+
+    rows_written = normalize_csv_rows(source, target, expected_columns=3, banner_rows=1)
+
+    assert rows_written == 3
+    assert target.getvalue() == (
+        'site,region,notes\n'
+        'A,East,line one\\nline two\n'
+        'B,West,\n'
+    )
+
+
+@mock.patch('main.write_csv_stream')
+@mock.patch('main.copy_blob')
+@mock.patch('main.STORAGE_CLIENT')
+@mock.patch('main.pd.read_csv')
+def test_successful_ingestion_with_normalization(mock_read_csv, mock_storage_client, mock_copy_blob, mock_write_csv_stream, gcf_event_success):
+    """Test case where the config enables normalization: the file is streamed instead of copied."""
+
+    mock_read_csv.return_value = mock.Mock(columns=['A', 'B', 'C'])
+    mock_storage_client.bucket.return_value.blob.return_value.download_as_text.return_value = json.dumps({
+        "expected_columns": 3,
+        "target_path": "shared_data/",
+        "filename_pattern": "addcharge_mapping.csv",
+        "normalize": True,
+        "banner_rows": 1
+    })
+
+    mock_storage_client.bucket.return_value.blob.return_value.download_as_bytes.return_value = b'Report\nA,B,C\n'
+
+    xref_processor(gcf_event_success)
+
+    # The normalized copy replaces the plain server-side copy
+    mock_copy_blob.assert_not_called()
+    mock_write_csv_stream.assert_called_once()
+    args = mock_write_csv_stream.call_args[0]
+    assert args[1] == EXTERNAL_TABLES_BUCKET
+    assert args[3:] == (False, True, 3, 1, 'latin-1')
+
+
+def test_split_dataset_name():
+    """Config lookup stems strip directories and compound extensions."""
+    assert split_dataset_name('folder/raw_fuji_sites.csv') == ('raw_fuji_sites', None)
+    assert split_dataset_name('raw_2024_tableau_data_fw20.csv.gz') == ('raw_2024_tableau_data_fw20', 'gzip')
+    assert split_dataset_name('raw_2024_tableau_data_fw20.ZIP') == ('raw_2024_tableau_data_fw20', 'zip')
+
+
+@mock.patch('main.STORAGE_CLIENT')
+def test_read_header_sample_compressed(mock_storage_client):
+    """The header probe decompresses only the ranged prefix of .csv.gz and .zip uploads."""
+    rows = 'a,b,c\n' + '1,2,3\n' * 50000
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('raw_fuji_sites.csv', rows)
+    blob = mock_storage_client.bucket.return_value.blob.return_value
+
+    for compression, payload in [('gzip', gzip.compress(rows.encode())), ('zip', zip_buffer.getvalue())]:
+        blob.download_as_bytes.side_effect = lambda start, end, payload=payload, **kwargs: payload[start:end + 1]
+        sample = read_header_sample(LANDING_ZONE_BUCKET, 'raw_fuji_sites.csv', compression)
+        assert sample.startswith('a,b,c\n1,2,3\n')
+        assert sample.endswith('\n')
+        assert blob.download_as_bytes.call_args == mock.call(start=0, end=64 * 1024 - 1, timeout=mock.ANY, retry=None)
+
+
+@pytest.mark.parametrize('land_compressed', [False, True])
+@mock.patch('main.open_source_stream')
+@mock.patch('main.write_csv_stream')
+@mock.patch('main.copy_blob')
+@mock.patch('main.STORAGE_CLIENT')
+def test_gzip_upload_landing(mock_storage_client, mock_copy_blob, mock_write_csv_stream, mock_open_source_stream,
+                             land_compressed, mock_config_data):
+    """A .csv.gz upload uses the plain config; it lands decompressed unless land_compressed copies it as-is."""
+    event = mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'addcharge_mapping.csv.gz'})
+    blob = mock_storage_client.bucket.return_value.blob.return_value
+    blob.download_as_text.return_value = json.dumps({
+        "expected_columns": 3,
+        "target_path": "shared_data/",
+        "filename_pattern": "addcharge_mapping.csv",
+        "land_compressed": land_compressed
+    })
+    blob.download_as_bytes.return_value = gzip.compress(b'A,B,C\n1,2,3\n')
+
+    xref_processor(event)
+
+    mock_storage_client.bucket.return_value.blob.assert_any_call('config/addcharge_mapping.json')
+    if land_compressed:
+        mock_write_csv_stream.assert_not_called()
+        mock_copy_blob.assert_called_once()
+        assert mock_copy_blob.call_args[0][2] == EXTERNAL_TABLES_BUCKET
+        assert mock_copy_blob.call_args[0][3].endswith('/addcharge_mapping.csv.gz')
+    else:
+        mock_copy_blob.assert_not_called()
+        assert mock_open_source_stream.call_args[0][2] == 'gzip'
+        args = mock_write_csv_stream.call_args[0]
+        assert args[2].endswith('/addcharge_mapping.csv')
+        assert args[3] is False
+
+
+@mock.patch('main.open_source_stream')
+@mock.patch('main.write_csv_stream')
+@mock.patch('main.copy_blob')
+@mock.patch('main.STORAGE_CLIENT')
+def test_zip_upload_relanded_as_csv(mock_storage_client, mock_copy_blob, mock_write_csv_stream, mock_open_source_stream):
+    """A .zip upload is streamed out of the archive and landed as .csv, which BigQuery can read."""
+    event = mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'addcharge_mapping.zip'})
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('addcharge_mapping.csv', 'A,B,C\n1,2,3\n')
+    blob = mock_storage_client.bucket.return_value.blob.return_value
+    blob.download_as_text.return_value = json.dumps({
+        "expected_columns": 3,
+        "target_path": "shared_data/",
+        "filename_pattern": "addcharge_mapping.csv"
+    })
+    blob.download_as_bytes.return_value = zip_buffer.getvalue()
+
+    xref_processor(event)
+
+    mock_copy_blob.assert_not_called()
+    mock_open_source_stream.assert_called_once()
+    assert mock_open_source_stream.call_args[0][2] == 'zip'
+    args = mock_write_csv_stream.call_args[0]
+    assert args[2].endswith('/addcharge_mapping.csv')
+    assert args[3] is False
+
+
+@mock.patch('main.stage_blob')
+@mock.patch('main.copy_blob')
+@mock.patch('main.STORAGE_CLIENT')
+def test_oversized_zip_to_dead_letter(mock_storage_client, mock_copy_blob, mock_stage_blob, monkeypatch):
+    """A zip larger than the staging ceiling is dead-lettered without being downloaded."""
+    monkeypatch.setattr('main.MAX_STAGED_OBJECT_BYTES', 1024)
+    event = mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'addcharge_mapping.zip', 'size': '4096'})
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('addcharge_mapping.csv', 'A,B,C\n1,2,3\n')
+    blob = mock_storage_client.bucket.return_value.blob.return_value
+    blob.download_as_text.return_value = json.dumps({
+        "expected_columns": 3,
+        "target_path": "shared_data/",
+        "filename_pattern": "addcharge_mapping.csv"
+    })
+    blob.download_as_bytes.return_value = zip_buffer.getvalue()
+
+    with mock.patch('main.logger') as mock_logger:
+        xref_processor(event)
+
+    mock_stage_blob.assert_not_called()
+    mock_copy_blob.assert_called_once()
+    assert mock_copy_blob.call_args[0][2] == 'xref-dead-letter'
+    assert 'Object too large to stage locally' in mock_logger.error.call_args[0][0]
+
+
+def test_stage_blob_enforces_limit(tmp_path):
+    """Staging streams through a fixed buffer and stops once the ceiling is crossed."""
+    blob = mock.MagicMock()
+    blob.open.return_value = io.BytesIO(b'x' * 4096)
+
+    with pytest.raises(StagingLimitExceeded):
+        stage_blob(blob, str(tmp_path / 'staged.zip'), max_bytes=1024)
+
+    blob.open.return_value = io.BytesIO(b'x' * 512)
+    assert stage_blob(blob, str(tmp_path / 'staged.zip'), max_bytes=1024) == 512
+
+
+def test_staging_budget_is_shared_by_concurrent_requests():
+    """Reservations of all requests together stay within the instance budget; a late one waits for room."""
+    budget = main.StagingBudget(max_bytes=1000)
+    with pytest.raises(StagingLimitExceeded):
+        with budget.reserve(1001):
+            pass
+
+    held, release = threading.Event(), threading.Event()
+
+    def other_request():
+        with budget.reserve(600):
+            held.set()
+            release.wait()
+
+    other = threading.Thread(target=other_request)
+    other.start()
+    held.wait()
+    with pytest.raises(main.StagingBusy):
+        with budget.reserve(600, timeout=0.01):
+            pass
+    with budget.reserve(400, timeout=0):
+        assert budget.used == 1000
+
+    threading.Timer(0.05, release.set).start()
+    with budget.reserve(600, timeout=5):
+        assert budget.used == 600
+    other.join()
+    assert budget.used == 0
+
+
+def test_staged_zip_is_released(tmp_path, monkeypatch):
+    """A staged zip holds its event size in the budget only while it is read."""
+    budget = main.StagingBudget(max_bytes=4096)
+    monkeypatch.setattr('main.STAGING_BUDGET', budget)
+    local_path = str(tmp_path / 'staged.zip')
+    blob = mock.MagicMock()
+    blob.open.return_value = io.BytesIO(b'x' * 512)
+
+    with main.staged_blob(blob, local_path, object_size=512):
+        assert budget.used == 512
+        assert os.path.getsize(local_path) == 512
+    assert budget.used == 0
+
+
+@mock.patch('main.STORAGE_CLIENT')
+def test_staging_busy_leaves_file_for_redelivery(mock_storage_client, monkeypatch):
+    """A zip that finds no staging room fails the request instead of being dead-lettered."""
+    event = mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'addcharge_mapping.zip', 'size': '4096'})
+    blob = mock_storage_client.bucket.return_value.blob.return_value
+    blob.download_as_text.return_value = json.dumps({
+        "expected_columns": 3,
+        "target_path": "shared_data/",
+        "filename_pattern": "addcharge_mapping.csv"
+    })
+    monkeypatch.setattr('main.read_header_sample', lambda *args: 'A,B,C\n')
+    monkeypatch.setattr('main.STAGING_WAIT_SECONDS', 0)
+    budget = main.StagingBudget(max_bytes=8192)
+    monkeypatch.setattr('main.STAGING_BUDGET', budget)
+
+    with budget.reserve(8192), mock.patch('main.process_dead_letter') as mock_dead_letter:
+        with pytest.raises(main.StagingBusy):
+            xref_processor(event)
+    mock_dead_letter.assert_not_called()
+
+
+@mock.patch('main.copy_blob')
+@mock.patch('main.STORAGE_CLIENT')
+def test_state_file_routed_to_combined_partition(mock_storage_client, mock_copy_blob):
+    """A per-state file without its own config uses the combined config and lands under state=<x>/."""
+    event = mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'raw_zipcode_territory_AK.csv'})
+    combined_config = json.dumps({
+        "expected_columns": 3,
+        "filename_pattern": "raw_zipcode_territory_*.csv*",
+        "target_path": "zipcode_territory/",
+        "partition_regex": "raw_zipcode_territory_(?P<state>[A-Za-z]+)"
+    })
+    configs = {'config/raw_zipcode_territory.json': combined_config}
+
+    def blob_for(name):
+        blob = mock.MagicMock()
+        if name in configs:
+            blob.download_as_text.return_value = configs[name]
+        else:
+            blob.download_as_text.side_effect = FileNotFoundError(name)
+        blob.download_as_bytes.return_value = b'A,B,C\n1,2,3\n'
+        return blob
+    mock_storage_client.bucket.return_value.blob.side_effect = blob_for
+
+    xref_processor(event)
+
+    mock_storage_client.bucket.return_value.blob.assert_any_call('config/raw_zipcode_territory_AK.json')
+    mock_copy_blob.assert_called_once()
+    target_blob_name = mock_copy_blob.call_args[0][3]
+    assert mock_copy_blob.call_args[0][2] == EXTERNAL_TABLES_BUCKET
+    assert target_blob_name.startswith('zipcode_territory/state=ak/ingestion_timestamp=')
+    assert target_blob_name.endswith('/raw_zipcode_territory_AK.csv')
+
+
+@mock.patch('main.copy_blob')
+@mock.patch('main.STORAGE_CLIENT')
+def test_fallback_requires_partitioned_config(mock_storage_client, mock_copy_blob, mock_config_data):
+    """A shorter config name is only used as a fallback when it declares a partition_regex."""
+    event = mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'addcharge_mapping_v2.csv'})
+
+    def blob_for(name):
+        blob = mock.MagicMock()
+        if name == 'config/addcharge_mapping.json':
+            blob.download_as_text.return_value = mock_config_data
+        else:
+            blob.download_as_text.side_effect = FileNotFoundError(name)
+        return blob
+    mock_storage_client.bucket.return_value.blob.side_effect = blob_for
+
+    xref_processor(event)
+
+    mock_copy_blob.assert_called_once()
+    assert mock_copy_blob.call_args[0][2] == 'xref-dead-letter'
+
+
+# --- Concurrency load test with local GCS stand-ins ---
+
+class InMemoryBlob:
+    """Minimal stand-in for storage.Blob backed by a shared dict of object contents."""
+
+    def __init__(self, objects, lock, name):
+        self._objects, self._lock, self.name = objects, lock, name
+
+    def _content(self):
+        with self._lock:
+            return self._objects[self.name]
+
+    def download_as_text(self, **kwargs):
+        return self._content().decode('utf-8')
+
+    def download_as_bytes(self, start=0, end=None, **kwargs):
+        return self._content()[start:None if end is None else end + 1]
+
+    def upload_from_string(self, data, content_type=None, **kwargs):
+        with self._lock:
+            self._objects[self.name] = data.encode('utf-8') if isinstance(data, str) else data
+
+    def delete(self, **kwargs):
+        with self._lock:
+            if self._objects.pop(self.name, None) is None:
+                raise gcs_exceptions.NotFound(self.name)
+
+    def open(self, mode='rb', chunk_size=None, ignore_flush=None, **kwargs):
+        if mode == 'rb':
+            return io.BytesIO(self._content())
+        blob = self
+
+        class _Writer(io.BytesIO):
+            def __exit__(writer, exc_type, exc_val, exc_tb):
+                # Like BlobWriter: an exception inside the block terminates the upload
+                if exc_type is None:
+                    writer.close()
+                else:
+                    io.BytesIO.close(writer)
+
+            def close(writer):
+                if not writer.closed:
+                    with blob._lock:
+                        blob._objects[blob.name] = writer.getvalue()
+                super().close()
+
+        return _Writer()
+
+
+class InMemoryBucket:
+    def __init__(self, objects, lock, name):
+        self._objects, self._lock, self.name = objects, lock, name
+
+    def blob(self, blob_name):
+        return InMemoryBlob(self._objects, self._lock, blob_name)
+
+    def copy_blob(self, blob, destination_bucket, new_name, **kwargs):
+        with self._lock:
+            destination_bucket._objects[new_name] = self._objects[blob.name]
+
+
+class BlobListing(list):
+    prefixes = set()
+
+
+class InMemoryStorageClient:
+    """Thread-safe stand-in for storage.Client holding every bucket in memory."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.buckets = {}
+        # (bucket, prefix, delimiter) of every list_blobs call
+        self.listed = []
+
+    def bucket(self, bucket_name):
+        with self._lock:
+            objects = self.buckets.setdefault(bucket_name, {})
+        return InMemoryBucket(objects, self._lock, bucket_name)
+
+    def list_blobs(self, bucket_name, prefix='', delimiter=None, **kwargs):
+        with self._lock:
+            names = sorted(name for name in self.buckets.get(bucket_name, {}) if name.startswith(prefix))
+        self.listed.append((bucket_name, prefix, delimiter))
+        # With a delimiter, names with one below the prefix roll up into listing.prefixes, as on GCS
+        folders = {prefix + name[len(prefix):].split(delimiter)[0] + delimiter
+                   for name in names if delimiter and delimiter in name[len(prefix):]}
+        listing = BlobListing(InMemoryBlob(self.buckets[bucket_name], self._lock, name) for name in names
+                              if not (delimiter and delimiter in name[len(prefix):]))
+        listing.prefixes = folders
+        return listing
+
+
+def test_concurrent_events_share_one_process(monkeypatch):
+    """N simultaneous events (same basenames in different folders, mixed formats) all land correct content."""
+    client = InMemoryStorageClient()
+    monkeypatch.setattr('main.STORAGE_CLIENT', client)
+    client.bucket('xref-config')
+    client.buckets['xref-config']['config/addcharge_mapping.json'] = json.dumps({
+        "expected_columns": 3,
+        "target_path": "shared_data/",
+        "filename_pattern": "*addcharge_mapping*"
+    }).encode()
+    client.bucket(LANDING_ZONE_BUCKET)
+
+    events, expected = [], {}
+    for i in range(24):
+        content = f'A,B,C\nfolder_{i},{i},{"x" * i}\n'.encode()
+        if i % 3 == 0:
+            name, payload = f'batch_{i}/addcharge_mapping.csv', content
+        elif i % 3 == 1:
+            name, payload = f'batch_{i}/addcharge_mapping.csv.gz', gzip.compress(content)
+        else:
+            zip_buffer = io.BytesIO()
+            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr('addcharge_mapping.csv', content)
+            name, payload = f'batch_{i}/addcharge_mapping.zip', zip_buffer.getvalue()
+        client.buckets[LANDING_ZONE_BUCKET][name] = payload
+        events.append(mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': name, 'size': str(len(payload))}))
+        expected[f'batch_{i}'] = content
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(xref_processor, events))
+
+    landed = client.buckets['xref-ext-tables']
+    assert 'xref-dead-letter' not in client.buckets
+    assert len(landed) == len(events)
+    for blob_name, payload in landed.items():
+        # <target_path>/ingestion_timestamp=<ts>/batch_<i>/<file>
+        folder = blob_name.split('/')[2]
+        content = gzip.decompress(payload) if blob_name.endswith('.gz') else payload
+        assert content == expected[folder]
+
+
+def test_banner_rows_match_ext_table_layout():
+    """Every shipped config puts its header where its ext_ table expects it: skip_leading_rows is the banner plus the header."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    models_dir = os.path.join(here, '..', 'xref_tables', 'models', 'raw_tables')
+    configs = set(os.listdir(os.path.join(here, 'config')))
+    checked = 0
+    for model in sorted(name for name in os.listdir(models_dir) if name.startswith('ext_')):
+        with open(os.path.join(models_dir, model)) as f:
+            ddl = f.read()
+        skip = re.search(r"skip_leading_rows\s*=\s*(\d+)", ddl)
+        uri = re.search(r"/(raw_\w+)\.csv", ddl)
+        if not (skip and uri and f'{uri.group(1)}.json' in configs):
+            continue
+        with open(os.path.join(here, 'config', f'{uri.group(1)}.json')) as f:
+            config = json.load(f)
+        # Normalized files land without their banner rows
+        expected_skip = 1 if config.get('normalize') else config.get('banner_rows', 0) + 1
+        assert int(skip.group(1)) == expected_skip, model
+        checked += 1
+    assert checked > 0
+
+
+@pytest.mark.parametrize('source_name', ['raw_addcharge_mapping.csv.gz', 'raw_addcharge_mapping.zip'])
+def test_compressed_upload_matches_shipped_config(monkeypatch, source_name):
+    """The exact filename_pattern of a config in gcf/config/ accepts the compressed forms of its CSV."""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'raw_addcharge_mapping.json'), 'rb') as f:
+        shipped_config = f.read()
+    assert json.loads(shipped_config)['filename_pattern'] == 'raw_addcharge_mapping.csv'
+    client = InMemoryStorageClient()
+    monkeypatch.setattr('main.STORAGE_CLIENT', client)
+    client.bucket('xref-config')
+    client.buckets['xref-config']['config/raw_addcharge_mapping.json'] = shipped_config
+    content = b'A,B,C\n1,2,3\n'
+    if source_name.endswith('.gz'):
+        payload = gzip.compress(content)
+    else:
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('raw_addcharge_mapping.csv', content)
+        payload = zip_buffer.getvalue()
+    client.bucket(LANDING_ZONE_BUCKET)
+    client.buckets[LANDING_ZONE_BUCKET][source_name] = payload
+
+    xref_processor(mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': source_name, 'size': str(len(payload))}))
+
+    assert 'xref-dead-letter' not in client.buckets
+    (landed_name,) = client.buckets['xref-ext-tables']
+    assert landed_name.startswith('addcharge_mapping/ingestion_timestamp=')
+    # Landed under the name the ext_addcharge_mapping uri matches
+    assert landed_name.endswith('/raw_addcharge_mapping.csv')
+    assert client.buckets['xref-ext-tables'][landed_name] == content
+    assert main.matches_filename_pattern('folder/raw_x.csv.gz', 'folder/*.csv')
+    assert not main.matches_filename_pattern('raw_x.csv.gz', 'raw_y.csv')
+
+
+@pytest.mark.parametrize('normalize, source_name', [(False, 'addcharge_mapping.csv'),
+                                                     (True, 'addcharge_mapping.csv.gz')])
+def test_stats_sidecar_written_next_to_landed_file(monkeypatch, normalize, source_name):
+    """With "stats": true, <stem>.stats.json lands beside the file, from the normalize pass or one re-read."""
+    client = InMemoryStorageClient()
+    monkeypatch.setattr('main.STORAGE_CLIENT', client)
+    client.bucket('xref-config')
+    client.buckets['xref-config']['config/addcharge_mapping.json'] = json.dumps({
+        "expected_columns": 3,
+        "target_path": "shared_data/",
+        "filename_pattern": "*addcharge_mapping*",
+        "normalize": normalize,
+        "stats": True
+    }).encode()
+    content = b'A,B,C\n1,x,\n2,y,\n10,y,z\n'
+    client.bucket(LANDING_ZONE_BUCKET)
+    client.buckets[LANDING_ZONE_BUCKET][source_name] = gzip.compress(content) if normalize else content
+
+    xref_processor(mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': source_name}))
+
+    landed = client.buckets['xref-ext-tables']
+    (landed_name,) = [name for name in landed if not name.endswith('.stats.json')]
+    stats = json.loads(landed[main.sidecar_blob_name(landed_name, '.stats.json')])
+    assert stats['object'] == landed_name
+    assert stats['rows'] == 3
+    a, b, c = stats['columns']
+    assert (a['name'], a['numeric'], a['min'], a['max'], a['approx_distinct']) == ('A', True, 1, 10, 3)
+    assert (b['numeric'], b['approx_distinct'], b['null_count']) == (False, 2, 0)
+    assert (c['null_count'], c['null_rate']) == (2, round(2 / 3, 6))
+
+
+@pytest.mark.parametrize('normalize', [False, True])
+def test_duplicate_keys_are_dead_lettered(monkeypatch, normalize):
+    """Files of a keyed config with a repeated key never land; each is dead-lettered with sample keys."""
+    client = InMemoryStorageClient()
+    monkeypatch.setattr('main.STORAGE_CLIENT', client)
+    client.bucket('xref-config')
+    client.buckets['xref-config']['config/addcharge_mapping.json'] = json.dumps({
+        "expected_columns": 3,
+        "target_path": "shared_data/",
+        "filename_pattern": "*addcharge_mapping*",
+        "normalize": normalize,
+        "key_columns": ["Charge Code", 3]
+    }).encode()
+    client.bucket(LANDING_ZONE_BUCKET)
+    landing = client.buckets[LANDING_ZONE_BUCKET]
+    landing['addcharge_mapping.csv'] = b'charge code,desc,site\nA1,x,1\nA1,y,2\nA2,z,1\nA1,w,1\n'
+
+    xref_processor(mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'addcharge_mapping.csv'}))
+
+    assert not client.buckets.get('xref-ext-tables')
+    record = main.DEAD_LETTER_INDEX._records[-1]
+    assert record['reason_code'] == 'duplicate_keys'
+    assert "Key (charge code, site) is not unique: 1 duplicate row(s). Sample keys: 'A1 | 1'" in record['reason']
+
+    # The same rows with unique keys land
+    landing['addcharge_mapping.csv'] = b'charge code,desc,site\nA1,x,1\nA1,y,2\nA2,z,1\n'
+    xref_processor(mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'addcharge_mapping.csv'}))
+    assert len(client.buckets['xref-ext-tables']) == 1
+    assert len(main.DEAD_LETTER_INDEX) == 1
+
+    # A check that would spill past MAX_SPILL_MB is dead-lettered instead of filling the scratch directory
+    monkeypatch.setattr('key_check.KEY_CHECK_MEMORY_MB', 0)
+    monkeypatch.setattr('key_check.MAX_SPILL_MB', 0)
+    xref_processor(mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'addcharge_mapping.csv'}))
+    assert len(client.buckets['xref-ext-tables']) == 1
+    assert main.DEAD_LETTER_INDEX._records[-1]['reason_code'] == 'scratch_limit_exceeded'
+
+
+@pytest.mark.parametrize('normalize', [False, True])
+def test_zip_keys_checked_in_single_staging_pass(monkeypatch, normalize):
+    """A keyed zip upload is staged once: its keys and stats are taken while it is landed."""
+    client = InMemoryStorageClient()
+    monkeypatch.setattr('main.STORAGE_CLIENT', client)
+    client.bucket('xref-config')
+    client.buckets['xref-config']['config/addcharge_mapping.json'] = json.dumps({
+        "expected_columns": 3,
+        "target_path": "shared_data/",
+        "filename_pattern": "*addcharge_mapping*",
+        "normalize": normalize,
+        "stats": True,
+        "key_columns": ["Charge Code", 3]
+    }).encode()
+    client.bucket(LANDING_ZONE_BUCKET)
+
+    def upload(content):
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('addcharge_mapping.csv', content)
+        client.buckets[LANDING_ZONE_BUCKET]['addcharge_mapping.zip'] = zip_buffer.getvalue()
+        xref_processor(mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'addcharge_mapping.zip'}))
+
+    with mock.patch('main.stage_blob', wraps=main.stage_blob) as stage:
+        upload(b'charge code,desc,site\nA1,x,1\nA1,y,1\n')
+        assert stage.call_count == 1
+        assert not client.buckets.get('xref-ext-tables')
+        assert main.DEAD_LETTER_INDEX._records[-1]['reason_code'] == 'duplicate_keys'
+
+        upload(b'charge code,desc,site\nA1,x,1\nA1,y,2\n')
+        assert stage.call_count == 2
+    landed = client.buckets['xref-ext-tables']
+    (landed_name,) = [name for name in landed if name.endswith('.csv')]
+    assert landed[landed_name] == b'charge code,desc,site\nA1,x,1\nA1,y,2\n'
+    assert json.loads(landed[main.sidecar_blob_name(landed_name, '.stats.json')])['rows'] == 2
+
+
+@pytest.mark.parametrize('normalize', [False, True])
+def test_delta_written_against_previous_ingestion(monkeypatch, normalize):
+    """With "delta": true, <stem>.delta.ndjson lists the rows changed since the latest earlier ingestion."""
+    client = InMemoryStorageClient()
+    monkeypatch.setattr('main.STORAGE_CLIENT', client)
+    client.bucket('xref-config')
+    client.buckets['xref-config']['config/addcharge_mapping.json'] = json.dumps({
+        "expected_columns": 3,
+        "target_path": "shared_data/",
+        "filename_pattern": "*addcharge_mapping*",
+        "normalize": normalize,
+        "key_columns": ["code"],
+        "delta": True
+    }).encode()
+    client.bucket(LANDING_ZONE_BUCKET)
+    client.buckets[LANDING_ZONE_BUCKET]['addcharge_mapping.csv'] = b'code,desc,site\nA1,x,1\nA3,z,3\nA2,y,2\n'
+    landed = client.bucket('xref-ext-tables')._objects
+    landed['shared_data/ingestion_timestamp=20240101_000000/addcharge_mapping.csv'] = b'code,desc,site\nA1,old,1\n'
+    landed['shared_data/ingestion_timestamp=20250101_000000/addcharge_mapping.csv'] = b'code,desc,site\nA1,x,1\nA2,y,9\nA4,w,4\n'
+    landed['shared_data/ingestion_timestamp=20250101_000000/addcharge_mapping.stats.json'] = b'{}'
+    landed['shared_data/ingestion_timestamp=20250601_000000/other_mapping.csv'] = b'code,desc,site\n'
+    earlier = set(landed)
+
+    xref_processor(mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'addcharge_mapping.csv'}))
+
+    (delta_name,) = [name for name in landed if name.endswith('.delta.ndjson')]
+    (landed_name,) = [name for name in landed if name.endswith('.csv') and name not in earlier]
+    assert delta_name == main.sidecar_blob_name(landed_name, '.delta.ndjson')
+    changes = [json.loads(line) for line in landed[delta_name].decode().splitlines()]
+    assert [(change['op'], change['key']) for change in changes] == [
+        ('update', {'code': 'A2'}), ('insert', {'code': 'A3'}), ('delete', {'code': 'A4'})]
+    assert changes[0]['previous']['site'] == '9' and changes[0]['row']['site'] == '2'
+
+    # A dataset's first ingestion has nothing to diff against
+    assert main.previous_ingestion('xref-ext-tables', 'shared_data/ingestion_timestamp=', '20230101_000000',
+                                   'addcharge_mapping.csv') is None
+
+    # A delta that would spill past MAX_SPILL_MB takes the landed file back out and dead-letters it
+    monkeypatch.setattr('delta.DELTA_MEMORY_MB', 0)
+    monkeypatch.setattr('key_check.MAX_SPILL_MB', 0)
+    for name in (landed_name, delta_name):
+        del landed[name]
+    landed_before = set(landed)
+    xref_processor(mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'addcharge_mapping.csv'}))
+    assert set(landed) == landed_before
+    assert main.DEAD_LETTER_INDEX._records[-1]['reason_code'] == 'scratch_limit_exceeded'
+
+
+def test_previous_ingestion_lists_folders_then_only_the_file(monkeypatch):
+    """The ingestion folders are listed once; then only the file's own objects, newest folder first, until found."""
+    client = InMemoryStorageClient()
+    monkeypatch.setattr('main.STORAGE_CLIENT', client)
+    landed = client.bucket('xref-ext-tables')._objects
+    prefix = 'shared_data/ingestion_timestamp='
+    landed[f'{prefix}20240101_000000/batch_1/addcharge_mapping.csv'] = b'old'
+    landed[f'{prefix}20240601_000000/batch_1/addcharge_mapping.csv.gz'] = b'previous'
+    landed[f'{prefix}20240601_000000/batch_1/addcharge_mapping.stats.json'] = b'{}'
+    landed[f'{prefix}20240901_000000/batch_1/addcharge_mapping_v2.csv'] = b'other dataset'
+    landed[f'{prefix}20240901_000000/batch_2/addcharge_mapping.csv'] = b'other folder'
+    landed[f'{prefix}20250101_000000/batch_1/addcharge_mapping.csv'] = b'this upload'
+
+    assert main.previous_ingestion('xref-ext-tables', prefix, '20250101_000000', 'batch_1/addcharge_mapping.csv') == \
+        f'{prefix}20240601_000000/batch_1/addcharge_mapping.csv.gz'
+    assert client.listed == [
+        ('xref-ext-tables', prefix, '/'),
+        ('xref-ext-tables', f'{prefix}20240901_000000/batch_1/addcharge_mapping.', None),
+        ('xref-ext-tables', f'{prefix}20240601_000000/batch_1/addcharge_mapping.', None),
+    ]
+
+
+def test_sidecar_blob_name_sits_beside_landed_file():
+    assert main.sidecar_blob_name('t/ingestion_timestamp=20240101_000000/a.csv.gz', '.stats.json') == \
+        't/ingestion_timestamp=20240101_000000/a.stats.json'
+    assert main.sidecar_blob_name('t/ingestion_timestamp=20240101_000000/b/A.CSV', '.delta.ndjson') == \
+        't/ingestion_timestamp=20240101_000000/b/A.delta.ndjson'
+    assert main.sidecar_blob_name('plain.txt', '.stats.json') == 'plain.txt.stats.json'
+
+
+@mock.patch('main.STORAGE_CLIENT')
+def test_transient_gcs_errors_do_not_dead_letter(mock_storage_client, gcf_event_success, mock_config_data):
+    """A 503 during the copy is retried and the file lands; a lasting outage fails the request for redelivery."""
+    bucket = mock_storage_client.bucket.return_value
+    bucket.blob.return_value.download_as_text.return_value = mock_config_data
+    bucket.blob.return_value.download_as_bytes.return_value = b'A,B,C\n1,2,3\n'
+    bucket.copy_blob.side_effect = [gcs_exceptions.ServiceUnavailable('backend busy'), None]
+
+    xref_processor(gcf_event_success)
+
+    assert bucket.copy_blob.call_count == 2
+    assert bucket.copy_blob.call_args.kwargs['new_name'].startswith('shared_data/ingestion_timestamp=')
+    assert len(main.DEAD_LETTER_INDEX) == 0
+
+    bucket.copy_blob.reset_mock()
+    bucket.copy_blob.side_effect = gcs_exceptions.ServiceUnavailable('backend down')
+    with pytest.raises(StorageUnavailable):
+        xref_processor(gcf_event_success)
+    # Only landing attempts were made: nothing was copied to the dead-letter bucket
+    assert all(c.kwargs['new_name'].startswith('shared_data/') for c in bucket.copy_blob.call_args_list)
+    assert len(main.DEAD_LETTER_INDEX) == 0
+
+
+@mock.patch('main.enqueue_rebuild')
+@mock.patch('main.copy_blob')
+@mock.patch('main.STORAGE_CLIENT')
+def test_landed_file_queues_rebuild(mock_storage_client, mock_copy_blob, mock_enqueue, monkeypatch,
+                                    gcf_event_success, mock_config_data):
+    """Only successfully landed files queue a selective dbt rebuild for their target_path."""
+    monkeypatch.setattr('main.REBUILD_QUEUE_BUCKET', 'xref-config')
+    blob = mock_storage_client.bucket.return_value.blob.return_value
+    blob.download_as_text.return_value = mock_config_data
+    blob.download_as_bytes.return_value = b'A,B,C\n1,2,3\n'
+
+    xref_processor(gcf_event_success)
+
+    mock_enqueue.assert_called_once()
+    _, bucket_name, target_path, landed_name = mock_enqueue.call_args[0]
+    assert (bucket_name, target_path) == ('xref-config', 'shared_data/')
+    assert landed_name == mock_copy_blob.call_args[0][3]
+
+    # A dead-lettered file queues nothing
+    mock_enqueue.reset_mock()
+    blob.download_as_bytes.return_value = b'A,B\n1,2\n'
+    xref_processor(gcf_event_success)
+    mock_enqueue.assert_not_called()
+
+
+@mock.patch('main.copy_blob')
+@mock.patch('main.STORAGE_CLIENT')
+def test_dead_letter_buffers_error_record(mock_storage_client, mock_copy_blob, mock_config_data):
+    """A rejected file gets a structured record with its reason code, columns, size and generation."""
+    event = mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'addcharge_mapping.csv',
+                            'size': '12', 'generation': '1700000000000001'})
+    blob = mock_storage_client.bucket.return_value.blob.return_value
+    blob.download_as_text.return_value = mock_config_data
+    blob.download_as_bytes.return_value = b'A,B\n1,2\n'
+
+    xref_processor(event)
+
+    assert len(main.DEAD_LETTER_INDEX) == 1
+    record = main.DEAD_LETTER_INDEX._records[0]
+    assert record['reason_code'] == 'column_count_mismatch'
+    assert (record['stem'], record['expected_columns'], record['actual_columns']) == ('addcharge_mapping', 3, 2)
+    assert (record['size'], record['generation']) == (12, 1700000000000001)
+    assert record['dead_letter_object'] == mock_copy_blob.call_args[0][3]
+    # One failure does not cost an extra write: nothing is uploaded until the batch is due
+    blob.upload_from_string.assert_not_called()
+
+
+def test_header_fingerprint_ignores_cosmetic_changes():
+    """Case and whitespace do not change the fingerprint; order and names do."""
+    fingerprint, names = header_fingerprint('Zip Code,AE\n1,2\n')
+    assert names == ['zip code', 'ae']
+    assert header_fingerprint(' zip  code , ae\n')[0] == fingerprint
+    assert header_fingerprint('ae,zip code\n')[0] != fingerprint
+    # The header row sits below any banner rows
+    assert header_fingerprint('Weekly report\nZip Code,AE\n', banner_rows=1)[0] == fingerprint
+
+
+@mock.patch('main.copy_blob')
+@mock.patch('main.STORAGE_CLIENT')
+def test_header_drift_policies(mock_storage_client, mock_copy_blob):
+    """Swapped columns pass the count check but are caught by the fingerprint of the same probe."""
+    config = {"expected_columns": 3, "target_path": "shared_data/", "filename_pattern": "addcharge_mapping.csv"}
+    uploads = {}
+
+    def blob_for(name):
+        blob = mock.MagicMock()
+        if name == 'config/addcharge_mapping.json':
+            blob.download_as_text.return_value = json.dumps(config)
+        else:
+            blob.download_as_text.side_effect = gcs_exceptions.NotFound(name)
+        blob.download_as_bytes.return_value = header
+        blob.upload_from_string.side_effect = lambda data, **kwargs: uploads.__setitem__(name, json.loads(data))
+        return blob
+    mock_storage_client.bucket.return_value.blob.side_effect = blob_for
+    event = mock.Mock(data={'bucket': LANDING_ZONE_BUCKET, 'name': 'addcharge_mapping.csv'})
+
+    # 1. The first file of an unpinned dataset lands and seeds its manifest
+    header = b'code,description,amount\n1,x,2\n'
+    xref_processor(event)
+    assert mock_copy_blob.call_args[0][2] == EXTERNAL_TABLES_BUCKET
+    seeded = uploads['manifest/addcharge_mapping.json']
+    assert seeded['columns'] == ['code', 'description', 'amount']
+
+    # 2. A pinned fingerprint with the dead_letter policy rejects reordered columns
+    clear_config_cache()
+    config.update(header_fingerprint=seeded['header_fingerprint'], header_policy='dead_letter')
+    header = b'code,amount,description\n1,2,x\n'
+    xref_processor(event)
+    assert mock_copy_blob.call_args[0][2] == 'xref-dead-letter'
+    assert main.DEAD_LETTER_INDEX._records[-1]['reason_code'] == 'header_mismatch'
+
+    # 3. warn lands the drifted file anyway
+    clear_config_cache()
+    config['header_policy'] = 'warn'
+    xref_processor(event)
+    assert mock_copy_blob.call_args[0][2] == EXTERNAL_TABLES_BUCKET
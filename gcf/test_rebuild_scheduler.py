@@ -0,0 +1,215 @@
+import pytest
+from unittest import mock
+from datetime import datetime, timezone
+
+from google.api_core import exceptions as gcs_exceptions
+
+from rebuild_scheduler import (plan_rebuild, drain_rebuild_queue, enqueue_rebuild, selectors_for, QUEUE_PREFIX,
+                               DEAD_LETTER_PREFIX, FALLBACK_SELECTORS, LOCK_BLOB_NAME)
+from gcs_io import GcsIO
+
+QUIET = 300
+MAX_WAIT = 1800
+
+
+def make_markers(target_path, start, count, spacing=1.0):
+    """Markers for a burst of uploads, one every `spacing` seconds from `start`."""
+    return [(f"{QUEUE_PREFIX}{target_path}/{i:03d}.json", start + i * spacing, target_path) for i in range(count)]
+
+
+class FakeQueueBucket:
+    """Bucket stand-in holding marker blobs, the drain lock and the failure count, with generations."""
+
+    def __init__(self, markers):
+        self.objects = {name: created for name, created, _ in markers}
+        self.data = {}
+        self.generations = {name: 1 for name in self.objects}
+        self.next_generation = 2
+        self.deleted = []
+
+    def list_blobs(self, prefix):
+        blobs = []
+        for name, created in sorted(self.objects.items()):
+            if name.startswith(prefix):
+                blob = mock.Mock(time_created=datetime.fromtimestamp(created, tz=timezone.utc))
+                blob.name = name
+                blobs.append(blob)
+        return blobs
+
+    def _check_generation(self, name, if_generation_match):
+        if if_generation_match is not None and self.generations.get(name, 0) != if_generation_match:
+            raise gcs_exceptions.PreconditionFailed('generation mismatch')
+
+    def copy_blob(self, blob, destination_bucket, new_name):
+        destination_bucket.objects[new_name] = self.objects[blob.name]
+        destination_bucket.generations[new_name] = self.next_generation
+        self.next_generation += 1
+
+    def blob(self, name):
+        bucket = self
+        blob = mock.Mock()
+        blob.name = name
+
+        def upload_from_string(data, if_generation_match=None, **kwargs):
+            bucket._check_generation(name, if_generation_match)
+            # The lock holds its creation time; other objects are stamped 0
+            bucket.objects[name] = float(data) if name == LOCK_BLOB_NAME else 0.0
+            bucket.data[name] = data
+            bucket.generations[name] = blob.generation = bucket.next_generation
+            bucket.next_generation += 1
+
+        def download_as_text(**kwargs):
+            if name not in bucket.objects:
+                raise gcs_exceptions.NotFound('missing')
+            return bucket.data[name]
+
+        def delete(if_generation_match=None, **kwargs):
+            if name not in bucket.objects:
+                raise gcs_exceptions.NotFound('missing')
+            bucket._check_generation(name, if_generation_match)
+            del bucket.objects[name]
+            bucket.generations.pop(name, None)
+            bucket.deleted.append(name)
+
+        def reload():
+            blob.time_created = datetime.fromtimestamp(bucket.objects[name], tz=timezone.utc)
+            blob.generation = bucket.generations[name]
+
+        blob.upload_from_string.side_effect = upload_from_string
+        blob.download_as_text.side_effect = download_as_text
+        blob.delete.side_effect = delete
+        blob.reload.side_effect = reload
+        return blob
+
+
+def test_burst_is_debounced_into_one_build():
+    """A month-end drop of 40 files waits for the burst to go quiet, then builds once."""
+    markers = make_markers('commercial_non_pi_quota', 1000.0, 30, spacing=5) + \
+        make_markers('fixed_vs_adg_orders', 1010.0, 10, spacing=5)
+    last_upload = max(created for _, created, _ in markers)
+
+    # Still inside the quiet window after the last upload: keep waiting
+    assert plan_rebuild(markers, last_upload + QUIET - 1, QUIET, MAX_WAIT) is None
+
+    names, selectors = plan_rebuild(markers, last_upload + QUIET, QUIET, MAX_WAIT)
+    assert len(names) == 40
+    # One selection covering both target_paths, each model listed once with its children
+    assert selectors == selectors_for('commercial_non_pi_quota') + selectors_for('fixed_vs_adg_orders')
+    assert len(selectors) == len(set(selectors))
+    assert all(selector.endswith('+') for selector in selectors)
+
+
+def test_max_wait_forces_build_during_steady_trickle():
+    """Uploads that never go quiet still get built once the oldest marker hits the max wait."""
+    markers = make_markers('dim_data', 0.0, 200, spacing=QUIET / 2)
+    now = markers[-1][1]
+    assert now > MAX_WAIT
+    assert plan_rebuild(markers, now, QUIET, MAX_WAIT) is not None
+    assert plan_rebuild(markers[:2], markers[1][1], QUIET, MAX_WAIT) is None
+
+
+def test_unmapped_target_path_falls_back_to_all_xref_models():
+    assert selectors_for('dim_data/') == ['stg_dim_assets+', 'stg_dim_modality+']
+    assert selectors_for('brand_new_dataset/') == FALLBACK_SELECTORS
+
+
+@mock.patch('rebuild_scheduler.REBUILD_QUIET_SECONDS', QUIET)
+@mock.patch('rebuild_scheduler.REBUILD_MAX_WAIT_SECONDS', MAX_WAIT)
+def test_drain_runs_once_and_clears_covered_markers():
+    markers = make_markers('dim_data', 1000.0, 3) + make_markers('phelix_procedure', 1001.0, 2)
+    bucket = FakeQueueBucket(markers)
+    client = mock.Mock(**{'bucket.return_value': bucket})
+    runner = mock.Mock(return_value=0)
+
+    assert drain_rebuild_queue(client, 'xref-config', runner, now=1010.0)['status'] == 'waiting'
+    runner.assert_not_called()
+
+    summary = drain_rebuild_queue(client, 'xref-config', runner, now=1010.0 + QUIET)
+    assert summary['status'] == 'built'
+    runner.assert_called_once_with(['stg_dim_assets+', 'stg_dim_modality+', 'stg_phelix_procedure+'])
+    # All markers and the lock are gone
+    assert bucket.objects == {}
+
+    assert drain_rebuild_queue(client, 'xref-config', runner, now=5000.0)['status'] == 'idle'
+
+
+@mock.patch('rebuild_scheduler.REBUILD_QUIET_SECONDS', QUIET)
+@mock.patch('rebuild_scheduler.REBUILD_MAX_WAIT_SECONDS', MAX_WAIT)
+def test_failed_build_keeps_markers_and_held_lock_skips():
+    bucket = FakeQueueBucket(make_markers('dim_data', 1000.0, 2))
+    client = mock.Mock(**{'bucket.return_value': bucket})
+
+    summary = drain_rebuild_queue(client, 'xref-config', mock.Mock(return_value=2), now=2000.0)
+    assert summary['status'] == 'failed'
+    assert len([name for name in bucket.objects if name.startswith(QUEUE_PREFIX)]) == 2
+
+    # Another pass holds a fresh lock: nothing runs
+    bucket.blob('rebuild_queue.lock').upload_from_string('1990.0')
+    runner = mock.Mock(return_value=0)
+    assert drain_rebuild_queue(client, 'xref-config', runner, now=2000.0)['status'] == 'locked'
+    runner.assert_not_called()
+
+
+@mock.patch('rebuild_scheduler.REBUILD_QUIET_SECONDS', QUIET)
+@mock.patch('rebuild_scheduler.REBUILD_MAX_WAIT_SECONDS', MAX_WAIT)
+def test_lock_taken_over_during_build_is_not_released():
+    """A pass whose stale lock was taken over while dbt ran leaves the new holder's lock in place."""
+    bucket = FakeQueueBucket(make_markers('dim_data', 1000.0, 2))
+    client = mock.Mock(**{'bucket.return_value': bucket})
+
+    def slow_build(selectors):
+        # Another pass found the lock stale and took it over
+        bucket.blob(LOCK_BLOB_NAME).upload_from_string('1999.0', if_generation_match=bucket.generations[LOCK_BLOB_NAME])
+        return 0
+
+    assert drain_rebuild_queue(client, 'xref-config', slow_build, now=2000.0)['status'] == 'built'
+    assert bucket.objects[LOCK_BLOB_NAME] == 1999.0
+
+
+@mock.patch('rebuild_scheduler.REBUILD_QUIET_SECONDS', QUIET)
+@mock.patch('rebuild_scheduler.REBUILD_MAX_WAIT_SECONDS', MAX_WAIT)
+@mock.patch('rebuild_scheduler.REBUILD_MAX_ATTEMPTS', 3)
+def test_build_failing_repeatedly_is_dead_lettered():
+    """After REBUILD_MAX_ATTEMPTS failed builds the markers move aside and the count starts over."""
+    bucket = FakeQueueBucket(make_markers('dim_data', 1000.0, 2))
+    client = mock.Mock(**{'bucket.return_value': bucket})
+    failing = mock.Mock(return_value=1)
+
+    for attempt in (1, 2):
+        summary = drain_rebuild_queue(client, 'xref-config', failing, now=2000.0 + attempt)
+        assert (summary['status'], summary['failures']) == ('failed', attempt)
+    summary = drain_rebuild_queue(client, 'xref-config', failing, now=2003.0)
+    assert summary['status'] == 'dead_lettered'
+    assert sorted(bucket.objects) == [f"{DEAD_LETTER_PREFIX}dim_data/000.json", f"{DEAD_LETTER_PREFIX}dim_data/001.json"]
+
+    # A later upload is built normally
+    bucket.objects[f"{QUEUE_PREFIX}dim_data/002.json"] = 2100.0
+    assert drain_rebuild_queue(client, 'xref-config', mock.Mock(return_value=0), now=3000.0)['status'] == 'built'
+
+
+def test_enqueue_goes_through_gcs_io():
+    """A transient error writing a marker is retried by GcsIO instead of losing the rebuild."""
+    bucket = FakeQueueBucket([])
+    client = mock.Mock(**{'bucket.return_value': bucket})
+    writes = []
+    real_blob = bucket.blob
+
+    def flaky_blob(name):
+        blob = real_blob(name)
+        upload = blob.upload_from_string.side_effect
+
+        def upload_from_string(data, **kwargs):
+            writes.append(kwargs)
+            if len(writes) == 1:
+                raise gcs_exceptions.ServiceUnavailable('busy')
+            upload(data, **kwargs)
+
+        blob.upload_from_string.side_effect = upload_from_string
+        return blob
+
+    bucket.blob = flaky_blob
+    marker_name = enqueue_rebuild(client, 'xref-config', 'dim_data/', 'dim_data/x.csv', now=0,
+                                  gcs_io=GcsIO(sleep=lambda seconds: None))
+    assert marker_name in bucket.objects
+    assert len(writes) == 2
+    assert all(kwargs['retry'] is None and kwargs['timeout'] > 0 for kwargs in writes)
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+from google.api_core import exceptions as gcs_exceptions
+
+import main
+from local_storage import LocalStorageClient
+from replay import (config_for, event_from_record, load_configs, load_trace, materialize, percentiles,
+                    run_replay, upload_configs)
+
+
+def test_local_storage_behaves_like_gcs(tmp_path):
+    """Objects appear only once written, ranged reads are inclusive and missing objects raise NotFound."""
+    client = LocalStorageClient(str(tmp_path))
+    blob = client.bucket('landing').blob('folder/a.csv')
+    writer = blob.open('wb')
+    writer.write(b'A,B,C\n1,2,3\n')
+    assert not blob.exists()
+    writer.close()
+
+    assert blob.download_as_bytes(start=0, end=4) == b'A,B,C'
+    client.bucket('landing').copy_blob(blob, client.bucket('landed'), 'x/a.csv')
+    assert [b.name for b in client.list_blobs('landed')] == ['x/a.csv']
+    folders = client.list_blobs('landed', prefix='', delimiter='/')
+    assert list(folders) == [] and folders.prefixes == {'x/'}
+    with pytest.raises(gcs_exceptions.NotFound):
+        client.bucket('landing').blob('missing.csv').download_as_text()
+    with pytest.raises(gcs_exceptions.PreconditionFailed):
+        blob.upload_from_string('again', if_generation_match=0)
+
+
+def test_trace_formats_and_offsets(tmp_path):
+    """Object resources, CloudEvent envelopes and audit log entries all become timed events."""
+    records = [
+        {'time': '2025-06-30T23:59:58.500Z',
+         'data': {'bucket': main.LANDING_ZONE_BUCKET, 'name': 'raw_dim_assets.csv', 'size': '2048'}},
+        {'timestamp': '2025-06-30T23:59:59.123456789Z',
+         'protoPayload': {'methodName': 'storage.objects.create',
+                          'resourceName': f"projects/_/buckets/{main.LANDING_ZONE_BUCKET}/objects/raw_fuji_sites.csv"}},
+        {'bucket': main.LANDING_ZONE_BUCKET, 'name': 'raw_addcharge_mapping.csv', 'size': '10',
+         'timeCreated': '2025-06-30T23:59:58Z'},
+        {'bucket': 'some-other-bucket', 'name': 'ignored.csv', 'timeCreated': '2025-06-30T23:59:58Z'},
+    ]
+    path = tmp_path / 'trace.jsonl'
+    path.write_text('\n'.join(json.dumps(record) for record in records))
+
+    events = load_trace(str(path))
+    assert [(e['name'], e['size'], round(e['offset'], 3)) for e in events] == [
+        ('raw_addcharge_mapping.csv', 10, 0.0),
+        ('raw_dim_assets.csv', 2048, 0.5),
+        ('raw_fuji_sites.csv', None, 1.123),
+    ]
+    assert event_from_record({'protoPayload': {'methodName': 'storage.objects.delete',
+                                               'resourceName': 'projects/_/buckets/b/objects/x.csv'}}) is None
+
+
+def test_replay_reports_outcomes_and_restores_processor(tmp_path):
+    """A small burst lands, dead-letters unknown files and leaves main pointed at its original client."""
+    configs = load_configs()
+    assert config_for(configs, 'raw_zipcode_territory_ak.csv.gz') is configs['raw_zipcode_territory']
+    client = LocalStorageClient(str(tmp_path))
+    upload_configs(client, configs)
+    events = [{'name': name, 'size': None, 'time': None, 'offset': None} for name in
+              ['raw_addcharge_mapping.csv', 'raw_zipcode_territory_ak.csv.gz', 'raw_zipcode_territory_tx.csv',
+               'raw_addcharge_mapping.csv', 'unknown_file.csv']]
+    materialize(client, events, configs, median_kb=16, sigma=0)
+    original_client = main.STORAGE_CLIENT
+
+    report = run_replay(client, events, concurrency=3)
+
+    assert main.STORAGE_CLIENT is original_client
+    assert report['errors'] == []
+    assert (report['events'], report['landed'], report['dead_lettered']) == (5, 4, 1)
+    assert report['dead_letter_reasons'] == {'config_not_found': 1}
+    assert report['latency_seconds']['max'] >= report['latency_seconds']['p50'] > 0
+    assert report['memory']['max_rss_mb'] > 0
+
+
+def test_percentiles_use_nearest_rank():
+    assert percentiles([]) == {'p50': None, 'p90': None, 'p99': None, 'max': None, 'mean': None}
+    result = percentiles([i / 100 for i in range(1, 101)])
+    assert (result['p50'], result['p90'], result['p99'], result['max']) == (0.5, 0.9, 0.99, 1.0)
@@ -0,0 +1,152 @@
+import pytest
+from unittest import mock
+import gzip
+import io
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from main import normalize_csv_rows
+from zip_territory_index import (ZipTerritoryIndex, build_index_arrays, build_from_bucket, save_index,
+                                 latest_version, normalize_zips)
+
+
+@pytest.fixture
+def zip_to_territory():
+    return pd.DataFrame({'zip_code': ['01234', '10001', '73301-0001', 'n/a'],
+                         'territory': ['New England', 'Metro NY', 'Central TX', 'Unknown']})
+
+
+@pytest.fixture
+def territories():
+    return pd.DataFrame({
+        'zip_code': ['1234', '10001', '90210'],
+        'ae': ['Ann Lee', 'Bo Chan', 'Cy Diaz'],
+        'region': ['Northeast', 'Northeast', 'West'],
+        'state': ['ma', 'ny', 'ca'],
+        'state_name': ['Massachusetts', 'New York', 'California'],
+        'county': ['Hampden', 'New York', 'Los Angeles'],
+        'sales_director': ['Dee', 'Dee', ''],
+    })
+
+
+def test_normalize_zips():
+    parsed = normalize_zips(pd.Series(['01234', '1234', '01234-5678', 1234.0, ' 10001 ', 'abc', None]))
+    assert parsed.tolist()[:5] == [1234, 1234, 1234, 1234, 10001]
+    assert parsed.iloc[5:].isna().all()
+
+
+def test_build_save_and_lookup(tmp_path, zip_to_territory, territories):
+    zips, codes, strings = build_index_arrays(zip_to_territory, territories)
+    # Union of both sources, sorted, unparseable zips dropped
+    assert zips.tolist() == [1234, 10001, 73301, 90210]
+
+    save_index(str(tmp_path), '20251001_000000', zips[:1], codes[:1], strings)
+    save_index(str(tmp_path), '20251002_154912', zips, codes, strings)
+    assert latest_version(str(tmp_path)) == '20251002_154912'
+
+    index = ZipTerritoryIndex.open_latest(str(tmp_path))
+    assert isinstance(index.zips, np.memmap)
+    result = index.lookup(['01234', 10001, 99999, 90210, 73301])
+    assert result['territory'].tolist() == ['New England', 'Metro NY', None, None, 'Central TX']
+    assert result['ae'].tolist() == ['Ann Lee', 'Bo Chan', None, 'Cy Diaz', None]
+    # Blank strings are unknown, not empty values
+    assert result['sales_director'].tolist() == ['Dee', 'Dee', None, None, None]
+
+    codes = index.lookup_codes(np.array([1234, 10001, 5]), 'region')
+    assert codes[0] == codes[1] and codes[2] == -1
+
+    with pytest.raises(ValueError):
+        save_index(str(tmp_path), 'latest', zips, codes, strings)
+
+
+def test_batch_lookup_is_vectorized(tmp_path):
+    """A million lookups against 40k zips are answered in well under a second."""
+    rng = np.random.default_rng(0)
+    all_zips = np.sort(rng.choice(99999, size=40000, replace=False) + 1)
+    frame = pd.DataFrame({'zip_code': all_zips.astype(str), 'territory': [f't{z % 300}' for z in all_zips]})
+    zips, codes, strings = build_index_arrays(frame, pd.DataFrame(columns=['zip_code']))
+    index = ZipTerritoryIndex(save_index(str(tmp_path), '20251002_000000', zips, codes, strings))
+
+    queries = rng.choice(all_zips, size=1_000_000)
+    start = time.perf_counter()
+    territory = index.lookup(queries, fields=['territory'])['territory']
+    elapsed = time.perf_counter() - start
+    assert territory[0] == f't{queries[0] % 300}'
+    assert elapsed < 1.0
+
+
+def landed_client(files):
+    """Storage client mock listing and reading the given blob name -> bytes"""
+    def list_blobs(bucket_name, prefix):
+        blobs = []
+        for name in files:
+            if name.startswith(prefix):
+                blob = mock.Mock()
+                blob.name = name
+                blobs.append(blob)
+        return blobs
+
+    client = mock.Mock()
+    client.list_blobs.side_effect = list_blobs
+    client.bucket.return_value.blob.side_effect = lambda name: mock.Mock(
+        **{'open.side_effect': lambda mode: io.BytesIO(files[name])})
+    return client
+
+
+@pytest.mark.parametrize('latest_name', ['raw_zip_to_territory.csv', 'raw_zip_to_territory.csv.gz'])
+def test_build_from_bucket_uses_latest_snapshots(tmp_path, latest_name):
+    # raw_zip_to_territory is normalized: landed without its banner row
+    latest = b'count,zip,territory\n1,10001,Metro NY\n'
+    files = {
+        'commercial_non_pi_quota/ingestion_timestamp=20251001_000000/raw_zip_to_territory.csv':
+            b'count,zip,territory\n1,10001,Old NY\n',
+        # Landed compressed when its config sets land_compressed
+        f'commercial_non_pi_quota/ingestion_timestamp=20251002_143623/{latest_name}':
+            gzip.compress(latest) if latest_name.endswith('.gz') else latest,
+        'commercial_non_pi_quota/ingestion_timestamp=20251002_143623/raw_quota_by_month_mr.csv': b'x\n',
+        'zipcode_territory/state=ny/ingestion_timestamp=20251002_154728/raw_zipcode_territory_ny.csv':
+            b'zip,ae,state,county,region,providers,director\n10001,Bo Chan,New York,New York,Northeast,3,Dee\n',
+    }
+
+    directory = build_from_bucket(landed_client(files), str(tmp_path))
+    index = ZipTerritoryIndex(directory)
+    assert index.version == '20251002_154728'
+    result = index.lookup(['10001'])
+    assert result['territory'][0] == 'Metro NY'
+    assert result['state'][0] == 'ny'
+    assert result['ae'][0] == 'Bo Chan'
+    assert len(index.sources) == 2
+
+
+RAW_ZIP_TO_TERRITORY = ('Zip to territory, FY26\n'
+                        'Count,Zip Code,New Territory Name\n'
+                        '1,01234,Québec Border\n'
+                        '2,05678,South\n').encode('latin-1')
+
+
+def test_build_from_normalized_landing(tmp_path):
+    """The first zip of a normalized landing is indexed, and its UTF-8 names decode as written."""
+    target = io.StringIO()
+    normalize_csv_rows(io.StringIO(RAW_ZIP_TO_TERRITORY.decode('latin-1')), target, expected_columns=3, banner_rows=1)
+    files = {'commercial_non_pi_quota/ingestion_timestamp=20251002_143623/raw_zip_to_territory.csv':
+             target.getvalue().encode('utf-8')}
+
+    index = ZipTerritoryIndex(build_from_bucket(landed_client(files), str(tmp_path)))
+    assert index.zips.tolist() == [1234, 5678]
+    assert index.lookup(['01234'])['territory'][0] == 'Québec Border'
+
+
+def test_build_from_raw_landing_skips_banner_rows(tmp_path):
+    """Without normalize, the file lands as uploaded and is read past its banner rows in its encoding."""
+    config_dir = tmp_path / 'config'
+    config_dir.mkdir()
+    (config_dir / 'raw_zip_to_territory.json').write_text(json.dumps({'expected_columns': 3, 'banner_rows': 1}))
+    files = {'commercial_non_pi_quota/ingestion_timestamp=20251002_143623/raw_zip_to_territory.csv':
+             RAW_ZIP_TO_TERRITORY}
+
+    index = ZipTerritoryIndex(build_from_bucket(landed_client(files), str(tmp_path / 'index'), config_dir=str(config_dir)))
+    assert index.zips.tolist() == [1234, 5678]
+    assert index.lookup(['01234'])['territory'][0] == 'Québec Border'
@@ -0,0 +1,289 @@
+"""
+In-process zip code → territory / AE / region lookups built from the landed xref snapshots.
+
+The index is built from the latest validated uploads in xref-ext-tables:
+- commercial_non_pi_quota/ingestion_timestamp=<ts>/raw_zip_to_territory.csv (zip → territory)
+- zipcode_territory/state=<state>/ingestion_timestamp=<ts>/raw_zipcode_territory_<state>.csv
+  (zip → AE, region, state, county, sales director; latest upload per state)
+
+and saved as a directory of .npy arrays named after the newest ingestion timestamp it contains:
+
+    <root>/<YYYYMMDD_HHMMSS>/zips.npy      sorted uint32 zip codes
+    <root>/<YYYYMMDD_HHMMSS>/codes.npy     int32 [n_zips, n_fields] string codes (-1 = unknown)
+    <root>/<YYYYMMDD_HHMMSS>/strings.json  per-field string tables and the source blobs
+
+Loading memory-maps the arrays, so processes on one host share the pages and opening is O(1).
+Lookups are vectorized binary searches (np.searchsorted) over the zip array.
+
+Usage:
+    python zip_territory_index.py build ./zip_index       # build from GCS and save a new version
+    python zip_territory_index.py lookup ./zip_index 10001 73301
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from google.cloud import storage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EXTERNAL_TABLES_BUCKET = 'xref-ext-tables'
+
+# Landed sources (see gcf/config/raw_zip_to_territory.json and raw_zipcode_territory.json)
+ZIP_TO_TERRITORY_PREFIX = 'commercial_non_pi_quota/'
+ZIP_TO_TERRITORY_FILE = 'raw_zip_to_territory.csv'
+TERRITORY_PREFIX = 'zipcode_territory/'
+
+# The configs the processor landed the sources with; they decide the landed layout (see landed_layout)
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config')
+ZIP_TO_TERRITORY_CONFIG = 'raw_zip_to_territory'
+TERRITORY_CONFIG = 'raw_zipcode_territory'
+
+# Same default encoding the processor validates with
+DEFAULT_ENCODING = 'latin-1'
+
+# Looked-up fields, in codes.npy column order
+FIELDS = ('territory', 'ae', 'region', 'state', 'state_name', 'county', 'sales_director')
+
+# raw_zip_to_territory.csv: count, zip_code, new_territory_name below its header (and banner, unless normalized)
+ZIP_TO_TERRITORY_COLUMNS = {1: 'zip_code', 2: 'territory'}
+
+# raw_zipcode_territory_<state>.csv: the columns of ext_zipcode_territory below the header
+TERRITORY_COLUMNS = {0: 'zip_code', 1: 'ae', 2: 'state_name', 3: 'county', 4: 'region', 6: 'sales_director'}
+
+_INGESTION_RE = re.compile(r'ingestion_timestamp=(\d{8}_\d{6})/')
+_STATE_RE = re.compile(r'state=([^/]+)/')
+_VERSION_RE = re.compile(r'^\d{8}_\d{6}$')
+
+
+def load_config(stem: str, config_dir: str = CONFIG_DIR) -> Dict[str, Any]:
+    """The config rules of a landed source ({} if it has no config)."""
+    path = os.path.join(config_dir, f'{stem}.json')
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def landed_layout(config: Dict[str, Any]) -> Tuple[int, str]:
+    """
+    (rows to skip, encoding) of a landed file. Normalized files land as UTF-8 with only their header row;
+    the others land as uploaded, banner rows included, in the config's encoding.
+    """
+    if config.get('normalize', False):
+        return 1, 'utf-8'
+    return config.get('banner_rows', 0) + 1, config.get('encoding', DEFAULT_ENCODING)
+
+
+def normalize_zips(values: pd.Series) -> pd.Series:
+    """Parses zip codes ('01234', '1234', '01234-5678', 1234.0) to integers; unparseable values become NaN."""
+    digits = values.astype(str).str.extract(r'^\s*(\d{1,5})(?:\.0+)?(?:-\d+)?\s*$', expand=False)
+    return pd.to_numeric(digits, errors='coerce')
+
+
+def build_index_arrays(zip_to_territory: pd.DataFrame,
+                       territories: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, Dict[str, List[str]]]:
+    """
+    Builds (zips, codes, strings) from a zip_code/territory frame and a zip_code/ae/region/... frame.
+
+    Zips present in either source are indexed; a zip listed twice keeps its last row.
+    """
+    frames = []
+    for frame in (zip_to_territory, territories):
+        frame = frame.copy()
+        frame['zip'] = normalize_zips(frame['zip_code'])
+        frames.append(frame.dropna(subset=['zip']).drop_duplicates('zip', keep='last').set_index('zip'))
+    merged = frames[1].drop(columns='zip_code').join(
+        frames[0].drop(columns='zip_code'), how='outer').sort_index()
+
+    zips = merged.index.to_numpy(dtype=np.uint32)
+    codes = np.full((len(zips), len(FIELDS)), -1, dtype=np.int32)
+    strings: Dict[str, List[str]] = {}
+    for position, field in enumerate(FIELDS):
+        if field not in merged:
+            strings[field] = []
+            continue
+        column = merged[field].astype('string').str.strip().replace('', pd.NA)
+        field_codes, uniques = pd.factorize(column, use_na_sentinel=True)
+        codes[:, position] = field_codes
+        strings[field] = [str(value) for value in uniques]
+    return zips, codes, strings
+
+
+def save_index(root: str, version: str, zips: np.ndarray, codes: np.ndarray,
+               strings: Dict[str, List[str]], sources: Optional[List[str]] = None) -> str:
+    """Writes one index version under root/<version>/ atomically and returns its directory."""
+    if not _VERSION_RE.match(version):
+        raise ValueError(f"Index version must be an ingestion timestamp (YYYYMMDD_HHMMSS), got '{version}'.")
+    os.makedirs(root, exist_ok=True)
+    final_dir = os.path.join(root, version)
+    staging_dir = tempfile.mkdtemp(prefix=f'.{version}_', dir=root)
+    try:
+        np.save(os.path.join(staging_dir, 'zips.npy'), zips)
+        np.save(os.path.join(staging_dir, 'codes.npy'), codes)
+        with open(os.path.join(staging_dir, 'strings.json'), 'w') as f:
+            json.dump({'fields': list(FIELDS), 'strings': strings, 'sources': sources or []}, f)
+        if os.path.isdir(final_dir):
+            shutil.rmtree(final_dir)
+        os.rename(staging_dir, final_dir)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    return final_dir
+
+
+def latest_version(root: str) -> Optional[str]:
+    """Returns the newest version directory name under root, or None."""
+    versions = [name for name in os.listdir(root) if _VERSION_RE.match(name)] if os.path.isdir(root) else []
+    return max(versions) if versions else None
+
+
+class ZipTerritoryIndex:
+    """A loaded, memory-mapped index version."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.version = os.path.basename(os.path.normpath(directory))
+        self.zips = np.load(os.path.join(directory, 'zips.npy'), mmap_mode='r')
+        self.codes = np.load(os.path.join(directory, 'codes.npy'), mmap_mode='r')
+        with open(os.path.join(directory, 'strings.json')) as f:
+            meta = json.load(f)
+        self.fields = meta['fields']
+        self.sources = meta.get('sources', [])
+        # Object arrays with a trailing None, so code -1 maps to None without a branch
+        self._strings = {field: np.array(values + [None], dtype=object) for field, values in meta['strings'].items()}
+
+    @classmethod
+    def open_latest(cls, root: str) -> 'ZipTerritoryIndex':
+        version = latest_version(root)
+        if version is None:
+            raise FileNotFoundError(f"No zip territory index found under {root}")
+        return cls(os.path.join(root, version))
+
+    def __len__(self) -> int:
+        return len(self.zips)
+
+    def positions(self, zips: Iterable) -> np.ndarray:
+        """Row position of each zip in the index, or -1 when it is not indexed."""
+        keys = np.asarray(zips)
+        if keys.dtype.kind not in 'iu':
+            keys = normalize_zips(pd.Series(keys)).fillna(-1).to_numpy()
+        keys = keys.astype(np.int64)
+        if len(self.zips) == 0:
+            return np.full(keys.shape, -1, dtype=np.int64)
+        idx = np.minimum(np.searchsorted(self.zips, keys), len(self.zips) - 1)
+        return np.where(self.zips[idx] == keys, idx, -1)
+
+    def lookup_codes(self, zips: Iterable, field: str) -> np.ndarray:
+        """Integer codes of field for each zip (-1 = unknown); cheapest form for joins and group-bys."""
+        column = self.fields.index(field)
+        positions = self.positions(zips)
+        return np.where(positions >= 0, self.codes[np.maximum(positions, 0), column], -1)
+
+    def lookup(self, zips: Iterable, fields: Iterable[str] = FIELDS) -> Dict[str, np.ndarray]:
+        """Vectorized lookup: {field: object array of values (None when unknown)} aligned with zips."""
+        positions = self.positions(zips)
+        rows = self.codes[np.maximum(positions, 0)]
+        result = {}
+        for field in fields:
+            codes = np.where(positions >= 0, rows[:, self.fields.index(field)], -1)
+            result[field] = self._strings[field][codes]
+        return result
+
+
+# --- Building from the landed snapshots ---
+
+def _latest_blobs(client: storage.Client, bucket_name: str, prefix: str,
+                  name_filter) -> Dict[str, Tuple[str, str]]:
+    """Latest (ingestion timestamp, blob name) per partition key for blobs under prefix that pass name_filter."""
+    latest: Dict[str, Tuple[str, str]] = {}
+    for blob in client.list_blobs(bucket_name, prefix=prefix):
+        ingestion = _INGESTION_RE.search(blob.name)
+        if not ingestion or not name_filter(os.path.basename(blob.name)):
+            continue
+        state = _STATE_RE.search(blob.name)
+        key = state.group(1) if state else ''
+        candidate = (ingestion.group(1), blob.name)
+        if key not in latest or candidate > latest[key]:
+            latest[key] = candidate
+    return latest
+
+
+def _read_landed_csv(client: storage.Client, bucket_name: str, blob_name: str, columns: Dict[int, str],
+                     config: Dict[str, Any]) -> pd.DataFrame:
+    skip_rows, encoding = landed_layout(config)
+    with client.bucket(bucket_name).blob(blob_name).open('rb') as f:
+        frame = pd.read_csv(f, header=None, skiprows=skip_rows, usecols=list(columns), dtype=str,
+                            encoding=encoding, compression='gzip' if blob_name.endswith('.gz') else None)
+    return frame.rename(columns=columns)
+
+
+def build_from_bucket(client: storage.Client, root: str, bucket_name: str = EXTERNAL_TABLES_BUCKET,
+                      config_dir: str = CONFIG_DIR) -> str:
+    """
+    Builds an index from the latest landed snapshots and saves it as a new version. Returns its directory.
+    The snapshots are read with the layout their configs in config_dir landed them with.
+    """
+    territory_file = _latest_blobs(client, bucket_name, ZIP_TO_TERRITORY_PREFIX,
+                                   lambda name: name in (ZIP_TO_TERRITORY_FILE, ZIP_TO_TERRITORY_FILE + '.gz'))
+    state_files = _latest_blobs(client, bucket_name, TERRITORY_PREFIX,
+                                lambda name: name.endswith(('.csv', '.csv.gz')))
+    if not territory_file and not state_files:
+        raise FileNotFoundError(f"No zip territory snapshots found in gs://{bucket_name}")
+
+    zip_to_territory = pd.DataFrame(columns=['zip_code', 'territory'])
+    for _, blob_name in territory_file.values():
+        zip_to_territory = _read_landed_csv(client, bucket_name, blob_name, ZIP_TO_TERRITORY_COLUMNS,
+                                            load_config(ZIP_TO_TERRITORY_CONFIG, config_dir))
+
+    territory_config = load_config(TERRITORY_CONFIG, config_dir)
+    state_frames = []
+    for state, (_, blob_name) in sorted(state_files.items()):
+        frame = _read_landed_csv(client, bucket_name, blob_name, TERRITORY_COLUMNS, territory_config)
+        frame['state'] = state
+        state_frames.append(frame)
+    territories = pd.concat(state_frames, ignore_index=True) if state_frames else \
+        pd.DataFrame(columns=['zip_code', *FIELDS[1:]])
+
+    sources = sorted(list(territory_file.values()) + list(state_files.values()))
+    version = max(ingestion for ingestion, _ in sources)
+    zips, codes, strings = build_index_arrays(zip_to_territory, territories)
+    directory = save_index(root, version, zips, codes, strings, [name for _, name in sources])
+    logger.info(f"Built zip territory index {version} with {len(zips)} zips from {len(sources)} file(s): {directory}")
+    return directory
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Build or query the zip → territory index.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='Build a new version from the latest landed snapshots')
+    build.add_argument('root')
+    build.add_argument('--bucket', default=EXTERNAL_TABLES_BUCKET)
+    build.add_argument('--config-dir', default=CONFIG_DIR)
+    lookup = subparsers.add_parser('lookup', help='Look up zips in the latest version')
+    lookup.add_argument('root')
+    lookup.add_argument('zips', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_from_bucket(storage.Client(), args.root, args.bucket, args.config_dir)
+        return 0
+
+    index = ZipTerritoryIndex.open_latest(args.root)
+    values = index.lookup(args.zips)
+    for i, zip_code in enumerate(args.zips):
+        print(json.dumps({'zip': zip_code, **{field: values[field][i] for field in index.fields}}))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
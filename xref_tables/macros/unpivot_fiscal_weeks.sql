@@ -0,0 +1,65 @@
+{#
+    Unpivots a wide fiscal-week staging table into long rows of
+    (region, site, modality_group, fiscal_week, fy, measure, value, growth).
+
+    Week columns are discovered from the relation's schema, so a new week in the file needs no
+    model change. Supported column shapes:
+        fw<week>_fy<yy>                       -> measure 'orders'; fw<week>_growth goes on the latest fy
+        fw<week>_<yy>_<budget|actual|gap>     -> measure budget / actual / gap
+        fw<week>_<yy>                         -> measure default_measure
+
+    Only the latest upload (MAX xref_ingestion_ts) of the staging table is unpivoted.
+    dims maps output dimension -> source column; a missing dimension is NULL.
+#}
+{% macro unpivot_fiscal_weeks(relation, dims, default_measure='orders') -%}
+    {%- set entries = [] -%}
+    {%- set growth_columns = {} -%}
+    {%- set latest_fy = {} -%}
+    {%- if execute -%}
+        {%- set re = modules.re -%}
+        {%- for column in adapter.get_columns_in_relation(relation) -%}
+            {%- set name = column.name | lower -%}
+            {%- set yoy = re.fullmatch('fw(\\d+)_fy(\\d+)', name) -%}
+            {%- set split = re.fullmatch('fw(\\d+)_(\\d+)_(budget|actual|gap)', name) -%}
+            {%- set single = re.fullmatch('fw(\\d+)_(\\d+)', name) -%}
+            {%- set growth = re.fullmatch('fw(\\d+)_growth', name) -%}
+            {%- if growth -%}
+                {%- do growth_columns.update({growth.group(1) | int: column.name}) -%}
+            {%- elif yoy or split or single -%}
+                {%- set match = yoy or split or single -%}
+                {%- set week = match.group(1) | int -%}
+                {%- set fy = 2000 + (match.group(2) | int) -%}
+                {%- set measure = split.group(3) if split else ('orders' if yoy else default_measure) -%}
+                {%- do entries.append({'column': column.name, 'week': week, 'fy': fy, 'measure': measure, 'yoy': yoy is not none}) -%}
+                {%- if yoy and fy > latest_fy.get(week, 0) -%}
+                    {%- do latest_fy.update({week: fy}) -%}
+                {%- endif -%}
+            {%- endif -%}
+        {%- endfor -%}
+    {%- endif %}
+SELECT
+    t.xref_ingestion_ts,
+    '{{ relation.identifier }}' AS source_table,
+    {%- for dim in ['region', 'site', 'modality_group'] %}
+    {% if dims.get(dim) %}t.{{ dims[dim] }}{% else %}CAST(NULL AS STRING){% endif %} AS {{ dim }},
+    {%- endfor %}
+    w.fiscal_week,
+    w.fy,
+    w.measure,
+    w.value,
+    w.growth
+FROM {{ relation }} t
+CROSS JOIN UNNEST([
+    {%- for entry in entries %}
+    STRUCT({{ entry.week }} AS fiscal_week, {{ entry.fy }} AS fy, '{{ entry.measure }}' AS measure,
+           CAST(t.{{ entry.column }} AS FLOAT64) AS value,
+           {% if entry.yoy and entry.week in growth_columns and latest_fy[entry.week] == entry.fy -%}
+           CAST(t.{{ growth_columns[entry.week] }} AS FLOAT64)
+           {%- else -%}
+           CAST(NULL AS FLOAT64)
+           {%- endif %} AS growth){{ ',' if not loop.last }}
+    {%- endfor %}
+]) w
+WHERE t.xref_ingestion_ts = (SELECT MAX(xref_ingestion_ts) FROM {{ relation }})
+  AND w.value IS NOT NULL
+{%- endmacro %}
@@ -0,0 +1,45 @@
+{#
+    Helpers for the stg_ models.
+
+    The ext_ tables are hive-partitioned on ingestion_timestamp (YYYYMMDD_HHMMSS, the
+    folder the xref_processor function lands each upload in). Every upload is a full
+    snapshot of its file, so a stg_ table holds only the newest one: keeping older
+    snapshots, or two uploads of the same day, would repeat every row and multiply the
+    rows of downstream joins.
+
+    The newest ingestion_timestamp is looked up first (a partition-key-only query) and
+    inlined as a literal, so BigQuery prunes every older folder before reading any file.
+    Tables partitioned by another key first (e.g. state=) keep the newest upload of each
+    key value with xref_latest_ingestion_per. A window function over ingestion_timestamp
+    would read every folder instead.
+#}
+
+{% macro xref_ingestion_ts(alias='t') -%}
+    PARSE_TIMESTAMP('%Y%m%d_%H%M%S', {{ alias }}.ingestion_timestamp)
+{%- endmacro %}
+
+{% macro xref_latest_ingestion(ext_table, alias='t') -%}
+{%- if execute -%}
+    {%- set latest = run_query(
+        "SELECT MAX(ingestion_timestamp) FROM `" ~ target.project ~ ".slv_xref." ~ ext_table ~ "`"
+    ).columns[0].values()[0] -%}
+    {%- if latest %}
+-- Literal bound so BigQuery prunes older ingestion_timestamp folders before reading them
+WHERE {{ alias }}.ingestion_timestamp = '{{ latest }}'
+    {%- endif -%}
+{%- endif -%}
+{%- endmacro %}
+
+{% macro xref_latest_ingestion_per(ext_table, key_column, alias='t') -%}
+{%- if execute -%}
+    {%- set latest = run_query(
+        "SELECT " ~ key_column ~ ", MAX(ingestion_timestamp) FROM `" ~ target.project ~ ".slv_xref." ~ ext_table
+        ~ "` GROUP BY " ~ key_column ~ " ORDER BY " ~ key_column
+    ).rows -%}
+    {%- if latest %}
+-- Literal (key, newest ingestion_timestamp) pairs so BigQuery prunes every older folder of each key
+WHERE {% for key, ingestion in latest %}{% if not loop.first %}
+   OR {% endif %}({{ alias }}.{{ key_column }} = '{{ key }}' AND {{ alias }}.ingestion_timestamp = '{{ ingestion }}'){% endfor %}
+    {%- endif -%}
+{%- endif -%}
+{%- endmacro %}
@@ -13,9 +13,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_2025_tableau
     same_store BOOL
 
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/fixed_vs_adg_orders/ingestion_timestamp=20251002_154607/raw_2025_tableau_data_fw20.csv'],
+    uris = ['gs://xref-ext-tables/fixed_vs_adg_orders/*/raw_2025_tableau_data_fw20.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/fixed_vs_adg_orders',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
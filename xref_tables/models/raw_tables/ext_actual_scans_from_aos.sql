@@ -121,9 +121,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_actual_scans
     fw52_25 FLOAT64,
     fw53_25 FLOAT64
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/fixed_vs_adg_orders/ingestion_timestamp=20251002_154047/raw_actual_scans_from_aos.csv'],
+    uris = ['gs://xref-ext-tables/fixed_vs_adg_orders/*/raw_actual_scans_from_aos.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/fixed_vs_adg_orders',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
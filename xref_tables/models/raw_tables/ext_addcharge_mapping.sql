@@ -5,9 +5,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_addcharge_ma
 (addcharge_code STRING,
  scan_description STRING,
  separate_scan BOOL)
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/addcharge_mapping/ingestion_timestamp=20251002_135729/raw_addcharge_mapping.csv'],
+    uris = ['gs://xref-ext-tables/addcharge_mapping/*/raw_addcharge_mapping.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/addcharge_mapping',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
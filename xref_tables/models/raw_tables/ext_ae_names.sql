@@ -7,9 +7,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_ae_names`
  manager STRING,
  vp STRING,
  ae STRING)
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/ingestion_timestamp=20251003_154039/raw_commercial_non_pi_quota_terr_ae_names.csv'],
+    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/*/raw_commercial_non_pi_quota_terr_ae_names.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/commercial_non_pi_quota',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
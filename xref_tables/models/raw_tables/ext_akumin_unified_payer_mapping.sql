@@ -17,9 +17,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_akumin_unifi
  pi_vs_commercial STRING,
  parent_firm_id STRING,
  firm_name STRING)
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/akumin_unified_payer_mapping/ingestion_timestamp=20251003_162324/raw_akumin_unified_payer_mapping.csv'],
+    uris = ['gs://xref-ext-tables/akumin_unified_payer_mapping/*/raw_akumin_unified_payer_mapping.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/akumin_unified_payer_mapping',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
@@ -21,9 +21,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_all_quota_mg
     target_excl_house_acct INT64,
     variance_vs_target_excl_house_acct FLOAT64
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/ingestion_timestamp=20251002_143833/raw_all_quota_mgmt_hedge.csv'],
+    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/*/raw_all_quota_mgmt_hedge.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/commercial_non_pi_quota',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
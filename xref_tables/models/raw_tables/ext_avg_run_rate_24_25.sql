@@ -11,10 +11,14 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_avg_run_rate
     total_weekly INT64,
     total_monthly INT64
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/ingestion_timestamp=20251002_144213/raw_avg_exit_run_rate_24_25.csv'],
-    skip_leading_rows = 2,
+    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/*/raw_avg_exit_run_rate_24_25.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/commercial_non_pi_quota',
+    skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
     allow_jagged_rows = true
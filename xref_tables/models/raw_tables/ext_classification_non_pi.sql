@@ -4,9 +4,13 @@
 CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_classification_non_pi`
 (classification STRING,
  pi_vs_commercial STRING)
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/akumin_unified_payer_mapping/ingestion_timestamp=20251002_135619/raw_classification_non_pi.csv'],
+    uris = ['gs://xref-ext-tables/akumin_unified_payer_mapping/*/raw_classification_non_pi.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/akumin_unified_payer_mapping',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
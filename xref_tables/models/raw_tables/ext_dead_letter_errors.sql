@@ -0,0 +1,32 @@
+{{ config(materialized='ephemeral') }}
+
+-- Error records of dead-lettered files, written in batches by xref_processor (gcf/dead_letter_index.py):
+-- gs://xref-dead-letter/error/_index/dt=<YYYY-MM-DD>/<ts>_<id>.ndjson, one JSON line per rejected file.
+-- Filter on dt to read only the days of interest.
+{% call statement('raw_dead_letter_errors', fetch_result=False) %}
+CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_dead_letter_errors`
+(
+    dead_lettered_at TIMESTAMP,
+    stem STRING,
+    source_object STRING,
+    dead_letter_object STRING,
+    reason_code STRING,
+    reason STRING,
+    expected_columns INT64,
+    actual_columns INT64,
+    size INT64,
+    generation INT64,
+    copied BOOL
+)
+WITH PARTITION COLUMNS (
+    dt DATE
+)
+OPTIONS (
+    format = 'NEWLINE_DELIMITED_JSON',
+    uris = ['gs://xref-dead-letter/error/_index/*.ndjson'],
+    hive_partition_uri_prefix = 'gs://xref-dead-letter/error/_index',
+    require_hive_partition_filter = false,
+    ignore_unknown_values = true
+);
+
+{% endcall %}
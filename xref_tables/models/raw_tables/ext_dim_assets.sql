@@ -57,9 +57,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_dim_assets`
     warranty_start_date TIMESTAMP,
     warranty_end_date TIMESTAMP
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/dim_data/ingestion_timestamp=20251002_153449/raw_dim_assets.csv'],
+    uris = ['gs://xref-ext-tables/dim_data/*/raw_dim_assets.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/dim_data',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
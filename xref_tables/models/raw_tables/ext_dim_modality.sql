@@ -18,9 +18,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_dim_modality
     department_id STRING,
     survey_modality_name STRING
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/dim_data/ingestion_timestamp=20251002_153515/raw_dim_modality.csv'],
+    uris = ['gs://xref-ext-tables/dim_data/*/raw_dim_modality.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/dim_data',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
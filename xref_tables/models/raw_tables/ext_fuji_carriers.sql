@@ -100,9 +100,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_fuji_carrier
  direct_billing_id STRING,
  imagine_carrier_id STRING
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/fuji_dimensions/ingestion_timestamp=20251002_153301/raw_fuji_carriers.csv'],
+    uris = ['gs://xref-ext-tables/fuji_dimensions/*/raw_fuji_carriers.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/fuji_dimensions',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
@@ -58,9 +58,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_fuji_sites`
  use_secure_url BOOL,
  available_to_referrer BOOL,
  nrdr_facility_id STRING)
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/fuji_dimensions/ingestion_timestamp=20251002_144550/raw_fuji_sites.csv'],
+    uris = ['gs://xref-ext-tables/fuji_dimensions/*/raw_fuji_sites.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/fuji_dimensions',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
@@ -7,10 +7,14 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_house_acct_w
     total_weekly_orders INT64,
     fy_25_orders INT64
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/ingestion_timestamp=20251002_144429/raw_house_acct_weekly_orders.csv'],
-    skip_leading_rows = 2,
+    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/*/raw_house_acct_weekly_orders.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/commercial_non_pi_quota',
+    skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
     allow_jagged_rows = true
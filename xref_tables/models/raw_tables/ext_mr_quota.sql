@@ -16,10 +16,14 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_mr_quota`
  q4_dec_22 INT64,
  fy_25_quota FLOAT64,
  notes STRING)
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/ingestion_timestamp=20251002_143316/raw_quota_by_month_mr.csv'],
-    skip_leading_rows = 4,
+    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/*/raw_quota_by_month_mr.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/commercial_non_pi_quota',
+    skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
     allow_jagged_rows = true
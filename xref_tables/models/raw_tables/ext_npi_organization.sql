@@ -14,9 +14,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_npi_organiza
  provider_zip_code STRING,
  provider_state STRING
  )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/npi_organization/ingestion_timestamp=20251002_153649/raw_npi_to_organization.csv'],
+    uris = ['gs://xref-ext-tables/npi_organization/*/raw_npi_to_organization.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/npi_organization',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
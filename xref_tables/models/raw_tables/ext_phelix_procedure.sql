@@ -7,9 +7,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_phelix_proce
     scan_unit INT64,
     note STRING
  )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/phelix_procedure/ingestion_timestamp=20251002_153815/raw_phelix_procedure.csv'],
+    uris = ['gs://xref-ext-tables/phelix_procedure/*/raw_phelix_procedure.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/phelix_procedure',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
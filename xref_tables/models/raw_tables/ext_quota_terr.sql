@@ -7,9 +7,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_quota_terr`
  manager STRING,
  ae STRING,
  quota_and_comp_notes STRING)
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/ingestion_timestamp=20251002_142308/raw_commercial_non_pi_quota_terr.csv'],
+    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/*/raw_commercial_non_pi_quota_terr.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/commercial_non_pi_quota',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
@@ -66,9 +66,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_same_store_w
     ytd_2025 FLOAT64
     
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/fixed_vs_adg_orders/ingestion_timestamp=20251002_154135/raw_same_store_weekly_orders_budget.csv'],
+    uris = ['gs://xref-ext-tables/fixed_vs_adg_orders/*/raw_same_store_weekly_orders_budget.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/fixed_vs_adg_orders',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
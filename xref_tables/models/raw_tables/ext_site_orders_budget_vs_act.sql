@@ -72,10 +72,14 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_site_orders_
     ytd_25_actual FLOAT64,
     ytd_25_gap FLOAT64
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/fixed_vs_adg_orders/ingestion_timestamp=20251002_154232/raw_site_orders_budget_vs_act.csv'],
-    skip_leading_rows = 2,
+    uris = ['gs://xref-ext-tables/fixed_vs_adg_orders/*/raw_site_orders_budget_vs_act.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/fixed_vs_adg_orders',
+    skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
     allow_jagged_rows = true
@@ -6,10 +6,14 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_sites_to_ter
     fixed_territory_name STRING,
     site_name STRING
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/ingestion_timestamp=20251002_143734/raw_commercial_non_pi_quota_terr_list.csv'],
-    skip_leading_rows = 4,
+    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/*/raw_commercial_non_pi_quota_terr_list.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/commercial_non_pi_quota',
+    skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
     allow_jagged_rows = true,
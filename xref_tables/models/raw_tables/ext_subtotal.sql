@@ -16,9 +16,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_subtotal`
  november INT64,
  december INT64,
  ytd_25_quota INT64)
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/ingestion_timestamp=20251002_143241/raw_quota_by_month_subtotal.csv'],
+    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/*/raw_quota_by_month_subtotal.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/commercial_non_pi_quota',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
@@ -16,9 +16,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_trilliant_er
     provider_affiliated_practice_4_zip_code STRING,
     provider_affiliated_practice_5_zip_code STRING
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/trilliant_data/ingestion_timestamp=20251002_153340/raw_trilliant_erad_ma.csv'],
+    uris = ['gs://xref-ext-tables/trilliant_data/*/raw_trilliant_erad_ma.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/trilliant_data',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
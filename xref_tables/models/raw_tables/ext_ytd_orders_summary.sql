@@ -11,9 +11,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_ytd_orders_s
     ytd_25_gap FLOAT64,
     percent_attainment FLOAT64
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/fixed_vs_adg_orders/ingestion_timestamp=20251002_154407/raw_ytd_order_summary.csv'],
+    uris = ['gs://xref-ext-tables/fixed_vs_adg_orders/*/raw_ytd_order_summary.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/fixed_vs_adg_orders',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
@@ -7,10 +7,14 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_zip_to_terri
     zip_code STRING,
     new_territory_name STRING
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/ingestion_timestamp=20251002_143623/raw_zip_to_territory.csv'],
-    skip_leading_rows = 2,
+    uris = ['gs://xref-ext-tables/commercial_non_pi_quota/*/raw_zip_to_territory.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/commercial_non_pi_quota',
+    skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
     allow_jagged_rows = true,
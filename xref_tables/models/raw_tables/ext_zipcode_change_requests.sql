@@ -15,9 +15,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_zipcode_chan
     added_to_baseline STRING,
     added_to_trilliant STRING
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/zipcode_territory_assignments/ingestion_timestamp=20251002_154912/raw_zipcode_change_requests.csv'],
+    uris = ['gs://xref-ext-tables/zipcode_territory_assignments/*/raw_zipcode_change_requests.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/zipcode_territory_assignments',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
@@ -0,0 +1,29 @@
+{{ config(materialized='ephemeral') }}
+
+-- All states in one hive-partitioned table: zipcode_territory/state=<state>/ingestion_timestamp=<ts>/<file>.csv
+{% call statement('raw_zipcode_territory', fetch_result=False) %}
+CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_zipcode_territory`
+(
+    zip_code STRING,
+    ae STRING,
+    state_name STRING,
+    county STRING,
+    region STRING,
+    provider_count INT64,
+    sales_director STRING
+)
+WITH PARTITION COLUMNS (
+    state STRING,
+    ingestion_timestamp STRING
+)
+OPTIONS (
+    format = 'CSV',
+    uris = ['gs://xref-ext-tables/zipcode_territory/*.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/zipcode_territory',
+    skip_leading_rows = 1,
+    field_delimiter = ',',
+    allow_quoted_newlines = true,
+    allow_jagged_rows = true
+);
+
+{% endcall %}
@@ -11,9 +11,13 @@ CREATE OR REPLACE EXTERNAL TABLE `{{ target.project }}.slv_xref.ext_zipcode_terr
     site_manager STRING,
     site_manager_contact_number STRING
 )
+WITH PARTITION COLUMNS (
+    ingestion_timestamp STRING
+)
 OPTIONS (
     format = 'CSV',
-    uris = ['gs://xref-ext-tables/zipcode_territory_assignments/ingestion_timestamp=20251002_154726/raw_zipcode_territory_ae.csv'],
+    uris = ['gs://xref-ext-tables/zipcode_territory_assignments/*/raw_zipcode_territory_ae.csv'],
+    hive_partition_uri_prefix = 'gs://xref-ext-tables/zipcode_territory_assignments',
     skip_leading_rows = 1,
     field_delimiter = ',',
     allow_quoted_newlines = true,
@@ -1,11 +1,12 @@
--- Materializes a persistent table with the ingestion timestamp.
+-- Materializes the latest upload with its ingestion timestamp, reading only the newest ingestion_timestamp partition.
 {{ config(
     materialized='table', 
     tags=['xref'] 
 ) }}
 
 SELECT 
-    TIMESTAMP("{{ run_started_at }}") AS xref_ingestion_ts,
-    t.* -- Selects all columns from the external table after the timestamp
+    {{ xref_ingestion_ts('t') }} AS xref_ingestion_ts,
+    t.* EXCEPT (ingestion_timestamp) -- Selects all columns from the external table after the timestamp
 FROM 
-    `{{ target.project }}.slv_xref.ext_addcharge_mapping` t
\ No newline at end of file
+    `{{ target.project }}.slv_xref.ext_addcharge_mapping` t
+{{ xref_latest_ingestion('ext_addcharge_mapping', 't') }}
@@ -1,13 +1,14 @@
--- Materializes a persistent table with the ingestion timestamp.
+-- Materializes the latest upload with its ingestion timestamp, reading only the newest ingestion_timestamp partition.
 {{ config(
     materialized='table', 
     tags=['xref'] 
 ) }}
 
 SELECT 
-    TIMESTAMP("{{ run_started_at }}") AS xref_ingestion_ts,
+    {{ xref_ingestion_ts('t') }} AS xref_ingestion_ts,
     zip_code,
     new_territory_name
     -- drops count as it may not be needed
 FROM 
-    `{{ target.project }}.slv_xref.ext_zip_to_territory` t
\ No newline at end of file
+    `{{ target.project }}.slv_xref.ext_zip_to_territory` t
+{{ xref_latest_ingestion('ext_zip_to_territory', 't') }}
@@ -1,11 +1,11 @@
--- Materializes a persistent table with the ingestion timestamp.
+-- Materializes the latest upload with its ingestion timestamp, reading only the newest ingestion_timestamp partition.
 {{ config(
     materialized='table', 
     tags=['xref'] 
 ) }}
 
 SELECT 
-    TIMESTAMP("{{ run_started_at }}") AS xref_ingestion_ts,
+    {{ xref_ingestion_ts('t') }} AS xref_ingestion_ts,
     t.zip_code,
     t.ae,
     t.state_name,
@@ -21,4 +21,5 @@ SELECT
     (CASE WHEN t.added_to_trilliant IS NOT NULL AND TRIM(t.added_to_trilliant) != '' THEN TRUE ELSE FALSE END) AS is_trilliant_added
 
 FROM 
-    `{{ target.project }}.slv_xref.ext_zipcode_change_requests` t
\ No newline at end of file
+    `{{ target.project }}.slv_xref.ext_zipcode_change_requests` t
+{{ xref_latest_ingestion('ext_zipcode_change_requests', 't') }}
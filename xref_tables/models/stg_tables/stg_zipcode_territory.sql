@@ -0,0 +1,22 @@
+-- Materializes one table for every state's zip code territory assignments, reading only the newest ingestion_timestamp partition of each state.
+-- Kept as a full rebuild: it is a latest-per-state snapshot, not an append-only history.
+-- Clustered on zip_code so point lookups read a single small block instead of scanning every state's file.
+{{ config(
+    materialized='table', 
+    cluster_by=['zip_code'],
+    tags=['xref'] 
+) }}
+
+SELECT 
+    {{ xref_ingestion_ts('t') }} AS xref_ingestion_ts,
+    t.state,
+    t.zip_code,
+    t.ae,
+    t.state_name,
+    t.county,
+    t.region,
+    t.provider_count,
+    t.sales_director
+FROM 
+    `{{ target.project }}.slv_xref.ext_zipcode_territory` t
+{{ xref_latest_ingestion_per('ext_zipcode_territory', 'state', 't') }}
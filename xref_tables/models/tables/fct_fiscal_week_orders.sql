@@ -0,0 +1,30 @@
+-- Long-format fiscal-week orders from the wide fw<week>_* staging tables (latest upload of each).
+-- Partitioned by fiscal year and clustered by site/week, so a week-range query reads only the
+-- matching year and blocks instead of every fw column; a new week column needs no schema change.
+{{ config(
+    materialized='table', 
+    partition_by={'field': 'fy', 'data_type': 'int64', 'range': {'start': 2020, 'end': 2040, 'interval': 1}},
+    cluster_by=['site', 'fiscal_week'],
+    tags=['xref'] 
+) }}
+
+{% set site_dims = {'region': 'region', 'site': 'site_name', 'modality_group': 'modality_group'} %}
+{% set region_dims = {'region': 'region', 'modality_group': 'modality'} %}
+
+{{ unpivot_fiscal_weeks(ref('stg_site_orders_24_25'), site_dims) }}
+
+UNION ALL
+
+{{ unpivot_fiscal_weeks(ref('stg_site_orders_budget_vs_act'), site_dims) }}
+
+UNION ALL
+
+{{ unpivot_fiscal_weeks(ref('stg_same_store_weekly_orders_budget'), site_dims, default_measure='budget') }}
+
+UNION ALL
+
+{{ unpivot_fiscal_weeks(ref('stg_wow_region_orders_24_25'), region_dims) }}
+
+UNION ALL
+
+{{ unpivot_fiscal_weeks(ref('stg_wow_region_orders_summary'), region_dims) }}